@@ -7,12 +7,58 @@ import os
 # Tests monkeypatch `backend.app.DATA_FILE` to isolate file I/O.
 DATA_FILE = os.path.join(os.path.dirname(__file__), 'food_data.json')
 
+# Storage backend: 'json' (rewrite the file on each change), 'journal'
+# (append changes to a write-ahead log), 'sqlite' or 'partitioned' (one file
+# per collection and month, see backend/storage/)
+STORAGE_MODE = os.environ.get('FRIDGY_STORAGE_MODE', 'json')
+
+# Group commit: writes arriving within this many milliseconds are flushed
+# together with one file write (0 disables batching)
+WRITE_BATCH_MS = int(os.environ.get('FRIDGY_WRITE_BATCH_MS', '0'))
+
+# Format the data file is written in: 'json' (indented), 'compact' (JSON
+# without whitespace) or 'msgpack' (binary, needs msgpack). Files in any of
+# them are read regardless; see backend/storage/serialization.py
+SNAPSHOT_FORMAT = os.environ.get('FRIDGY_SNAPSHOT_FORMAT', 'json')
+
+# Number of serialized GET responses kept in memory (0 disables the cache;
+# ETag/304 handling stays on)
+RESPONSE_CACHE_ENTRIES = int(os.environ.get('FRIDGY_RESPONSE_CACHE_ENTRIES', '256'))
+
+# Rebuild the reminder list in a background thread just after each midnight
+REMINDER_SWEEPER = os.environ.get('FRIDGY_REMINDER_SWEEPER', '0') == '1'
+
+# Profile every Nth request with cProfile (0 disables) and dump the stats
+# into PROFILE_DIR (see backend/metrics.py)
+PROFILE_EVERY = int(os.environ.get('FRIDGY_PROFILE_EVERY', '0'))
+PROFILE_DIR = os.environ.get('FRIDGY_PROFILE_DIR', os.path.join(os.path.dirname(__file__), 'profiles'))
+
+# Worker threads running the app under the ASGI entry point (backend/asgi.py)
+ASYNC_WORKERS = int(os.environ.get('FRIDGY_ASYNC_WORKERS', '8'))
+
+# Per-household data files live in HOUSEHOLDS_DIR/<household>/ (see
+# backend/households.py). At most STORE_POOL_SIZE households, and
+# STORE_POOL_MB of their data files, stay loaded in memory (0 = no limit)
+HOUSEHOLDS_DIR = os.environ.get('FRIDGY_HOUSEHOLDS_DIR', os.path.join(os.path.dirname(__file__), 'households'))
+STORE_POOL_SIZE = int(os.environ.get('FRIDGY_STORE_POOL_SIZE', '64'))
+STORE_POOL_MB = int(os.environ.get('FRIDGY_STORE_POOL_MB', '512'))
+
+# Move meals, steps and health metrics older than this many days into the
+# compressed archive once at startup and then daily (0 disables; see
+# backend/archive.py). POST /api/archive/run?days=N archives on demand
+ARCHIVE_AFTER_DAYS = int(os.environ.get('FRIDGY_ARCHIVE_AFTER_DAYS', '0'))
+
 # Import blueprints using package-qualified names so `import backend.app` works
 from backend.routes.foods import foods_bp
 from backend.routes.recipes import recipes_bp
 from backend.routes.meals import meals_bp
 from backend.routes.health import health_bp
 from backend.routes.analytics import analytics_bp
+from backend.routes.export import export_bp
+from backend.routes.addictions import addictions_bp
+from backend.routes.metrics import metrics_bp
+from backend.routes.archive import archive_bp
+from backend import data_service, households, metrics
 
 # Create the Flask application
 app = Flask(__name__)
@@ -22,9 +68,13 @@ CORS(app, resources={
     r"/api/*": {
         "origins": "*",
         "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"]
+        "allow_headers": ["Content-Type", "Authorization", "If-None-Match", households.HEADER],
+        "expose_headers": ["ETag", "Last-Modified"]
     }
 })
+# Read by the per-route @cross_origin() decorators too, so clients on
+# another origin can see the validators
+app.config['CORS_EXPOSE_HEADERS'] = ["ETag", "Last-Modified"]
 
 # Configure logging
 logging.basicConfig(
@@ -39,6 +89,26 @@ app.register_blueprint(recipes_bp, url_prefix='/api')
 app.register_blueprint(meals_bp, url_prefix='/api')
 app.register_blueprint(health_bp, url_prefix='/api')
 app.register_blueprint(analytics_bp, url_prefix='/api')
+app.register_blueprint(export_bp, url_prefix='/api')
+app.register_blueprint(addictions_bp, url_prefix='/api')
+app.register_blueprint(metrics_bp, url_prefix='/api')
+app.register_blueprint(archive_bp, url_prefix='/api')
+
+# Household selection by /h/<household> URL prefix or header
+households.init_app(app)
+
+# Per-endpoint latency, phase timings and byte counts for /api/metrics
+metrics.init_app(app, data_service._get_setting)
+
+if REMINDER_SWEEPER:
+    from backend.data_service import resident_stores
+    from backend.indexes.expiry import REMINDER_DAYS, start_sweeper
+    from backend.routes.analytics import DASHBOARD_REMINDER_DAYS
+    start_sweeper(resident_stores, (REMINDER_DAYS, DASHBOARD_REMINDER_DAYS))
+
+if ARCHIVE_AFTER_DAYS > 0:
+    from backend.archive import start_archiver
+    start_archiver(lambda: data_service.archive_history(ARCHIVE_AFTER_DAYS))
 
 @app.errorhandler(Exception)
 def handle_uncaught_exceptions(e):
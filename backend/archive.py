@@ -0,0 +1,308 @@
+"""Archive of old meals, steps and health metrics in compressed monthly segments.
+
+`data_service.archive_history` moves records dated before a cutoff day out of
+the live data into `food_data.archive/` (next to the data file):
+
+    index.json                  per-segment summaries (see below)
+    meals-2024-03.jsonl.gz      one gzip-compressed JSONL segment per
+    steps-2024-03.jsonl.gz      collection and month, records sorted by date
+
+For each segment the index keeps its record count, first and last date and
+one summary per day: the nutrition summary of `backend/indexes/rollups.py`
+plus meals per food (`foods`, `foodNames`) for meals, `{"count", "total"}`
+for steps, and `{"count", "byType": {type: {"count", "total", "last",
+"lastDate"}}}` for health metrics. Day-level views (nutrition and step
+trends and totals, stats, health metric trends, the food-addiction
+analysis) combine these day summaries with the live data, so they never
+open a segment. Record-level reads (day views, date-filtered lists) add the
+archived records of their window, decompressing only the segments with
+days in it; the last few read are kept in memory.
+
+Records are written to their segments before they are deleted from the live
+data. If archiving is interrupted in between, the next run finds the same
+records again and merges them by id, so nothing is lost or counted twice for
+long.
+"""
+
+import argparse
+import gzip
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from backend.indexes.consumption import meal_food_keys
+from backend.indexes.rollups import day_key, summarize_meals
+from backend.metrics import count_storage_bytes
+from backend.storage.base import file_size
+from backend.storage.files import FileLock, file_stamp, write_atomic
+from backend.storage.serialization import decode_snapshot, dumps, encode_snapshot, loads
+
+logger = logging.getLogger('fridgy')
+
+# Collections that are archived
+ARCHIVED = ('meals', 'steps', 'healthMetrics')
+
+# Decompressed segments kept in memory per archive
+SEGMENT_CACHE_ENTRIES = 4
+
+
+def _number(value):
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else 0
+
+
+def summarize_day(collection, records):
+    """Return the day summary of one day's `records` of `collection`."""
+    if collection == 'meals':
+        summary = summarize_meals(records)
+        # Meals per food, as ConsumptionIndex counts them
+        summary['foods'], summary['foodNames'] = {}, {}
+        for meal in records:
+            for key, name in meal_food_keys(meal).items():
+                summary['foods'][key] = summary['foods'].get(key, 0) + 1
+                summary['foodNames'][key] = name
+        return summary
+    if collection == 'steps':
+        return {"count": len(records), "total": sum(_number(r.get('steps')) for r in records)}
+    by_type = {}
+    for record in records:
+        part = by_type.setdefault(str(record.get('type')), {"count": 0, "total": 0, "last": None})
+        part['count'] += 1
+        part['total'] += _number(record.get('value'))
+        part['last'], part['lastDate'] = record.get('value'), record['date']
+    return {"count": len(records), "byType": by_type}
+
+
+def _segment_key(collection, record):
+    return '%s/%s' % (collection, record['date'][:7])
+
+
+class Archive:
+    """The archive next to one data file."""
+
+    def __init__(self, data_file):
+        self.data_file = data_file
+        self.directory = os.path.splitext(data_file)[0] + '.archive'
+        self.index_file = os.path.join(self.directory, 'index.json')
+        self._lock = threading.Lock()
+        self._file_lock = FileLock(self.index_file)
+        self._index = None
+        self._index_stamp = None
+        # (segment key, index version) -> records
+        self._segments = OrderedDict()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key.replace('/', '-') + '.jsonl.gz')
+
+    def index(self):
+        """Return the index, re-read if another process changed it (shared, read-only)."""
+        with self._lock:
+            stamp = file_stamp(self.index_file)
+            if stamp is None:
+                return {"version": 0, "segments": {}}
+            if stamp != self._index_stamp:
+                with open(self.index_file, 'rb') as f:
+                    raw = f.read()
+                count_storage_bytes('read', len(raw))
+                self._index, self._index_stamp = decode_snapshot(raw), stamp
+            return self._index
+
+    def _keys(self, collection, start_month=None, end_month=None):
+        """Return the segment keys of `collection` for months in `[start_month, end_month]`, oldest first."""
+        keys = []
+        for key in sorted(self.index()['segments']):
+            name, month = key.split('/', 1)
+            if name == collection and (start_month is None or month >= start_month) \
+                    and (end_month is None or month <= end_month):
+                keys.append(key)
+        return keys
+
+    # -- summaries -----------------------------------------------------
+
+    def days(self, collection, start=None, end=None):
+        """Return `{day: summary}` of archived `collection` days with `start <= day < end` (YYYY-MM-DD)."""
+        segments = self.index()['segments']
+        result = {}
+        for key in self._keys(collection, start and start[:7], end and end[:7]):
+            for day, summary in segments[key]['days'].items():
+                if (start is None or day >= start) and (end is None or day < end):
+                    result[day] = summary
+        return result
+
+    def has_day(self, collection, day):
+        segment = self.index()['segments'].get('%s/%s' % (collection, day[:7]))
+        return segment is not None and day in segment['days']
+
+    # -- records -------------------------------------------------------
+
+    def _read_segment(self, key, version):
+        with self._lock:
+            cached = self._segments.get((key, version))
+            if cached is not None:
+                self._segments.move_to_end((key, version))
+                return cached
+        try:
+            with open(self._path(key), 'rb') as f:
+                raw = f.read()
+        except FileNotFoundError:
+            return []
+        count_storage_bytes('read', len(raw))
+        records = [loads(line) for line in gzip.decompress(raw).splitlines() if line]
+        with self._lock:
+            self._segments[(key, version)] = records
+            while len(self._segments) > SEGMENT_CACHE_ENTRIES:
+                self._segments.popitem(last=False)
+        return records
+
+    @staticmethod
+    def _has_days(segment, start, end):
+        """Return True if `segment` has records on a day that overlaps `[start, end)`."""
+        return any((start is None or day >= start[:10]) and (end is None or day < end)
+                   for day in segment['days'])
+
+    def records(self, collection, start=None, end=None):
+        """Return archived records with `start <= date < end` (ISO strings), oldest first.
+
+        Only the segments of the months in the window are decompressed.
+        """
+        return list(self.iter_records(collection, start, end))
+
+    def iter_records(self, collection, start=None, end=None):
+        """Yield the same records as `records`, decompressing one segment at a time."""
+        index = self.index()
+        for key in self._keys(collection, start and start[:7], end and end[:7]):
+            if not self._has_days(index['segments'][key], start, end):
+                continue
+            for record in self._read_segment(key, index['segments'][key]['version']):
+                date = record['date']
+                if (start is None or date >= start) and (end is None or date < end):
+                    yield record
+
+    def latest(self, collection, since, limit):
+        """Return up to `limit` of the latest archived records dated at or after `since`, oldest first.
+
+        Segments are read newest first, so only as many as needed are decompressed.
+        """
+        index = self.index()
+        result = []
+        for key in reversed(self._keys(collection, since[:7])):
+            if not self._has_days(index['segments'][key], since, None):
+                continue
+            records = [r for r in self._read_segment(key, index['segments'][key]['version'])
+                       if r['date'] >= since]
+            result = records[-(limit - len(result)):] + result
+            if len(result) >= limit:
+                break
+        return result
+
+    def stats(self):
+        """Return one entry per segment: collection, month, count, first/last date and bytes."""
+        segments = self.index()['segments']
+        return [{
+            "collection": key.split('/', 1)[0],
+            "month": key.split('/', 1)[1],
+            "count": segment['count'],
+            "first": segment['first'],
+            "last": segment['last'],
+            "bytes": file_size(self._path(key)),
+        } for key, segment in sorted(segments.items())]
+
+    # -- writing -------------------------------------------------------
+
+    def add(self, collection, records):
+        """Merge `records` (with ISO `date` strings) into their segments and update the index.
+
+        Records already archived (same id) are replaced, so adding the same
+        records twice keeps one copy.
+        """
+        by_segment = {}
+        for record in records:
+            by_segment.setdefault(_segment_key(collection, record), []).append(record)
+        if not by_segment:
+            return
+        with self._file_lock:
+            index = self.index()
+            version = index['version'] + 1
+            segments = dict(index['segments'])
+            for key, added in sorted(by_segment.items()):
+                merged = OrderedDict()
+                if key in segments:
+                    for record in self._read_segment(key, segments[key]['version']):
+                        merged[record.get('id')] = record
+                for record in added:
+                    merged.pop(record.get('id'), None)
+                    merged[record.get('id')] = record
+                ordered = sorted(merged.values(), key=lambda r: r['date'])
+                payload = ''.join(dumps(r) + '\n' for r in ordered).encode('utf-8')
+                write_atomic(self._path(key), gzip.compress(payload))
+
+                per_day = OrderedDict()
+                for record in ordered:
+                    per_day.setdefault(day_key(record), []).append(record)
+                segments[key] = {
+                    "version": version,
+                    "count": len(ordered),
+                    "first": ordered[0]['date'],
+                    "last": ordered[-1]['date'],
+                    "days": {day: summarize_day(collection, part) for day, part in per_day.items()},
+                }
+            write_atomic(self.index_file, encode_snapshot({"version": version, "segments": segments}, 'compact'))
+
+    # -- store pool interface ---------------------------------------------
+
+    def disk_bytes(self):
+        return file_size(self.index_file)
+
+    def close(self):
+        with self._lock:
+            self._segments.clear()
+
+
+def is_archivable(record):
+    """Return True if the record has an ISO date and can be placed in a monthly segment."""
+    date = record.get('date')
+    return isinstance(date, str) and len(date) >= 10 and date[4] == '-' and date[7] == '-'
+
+
+def start_archiver(run):
+    """Start a daemon thread that calls `run()` now and then just after each midnight.
+
+    Args:
+        run: Archives the history (normally `data_service.archive_history`
+            with the configured number of days).
+    """
+    def archive_daily():
+        while True:
+            try:
+                moved = run()
+                logger.info('Archived %s', ', '.join('%d %s' % (n, c) for c, n in moved.items()))
+            except Exception:
+                logger.exception('Archiving failed')
+            now = datetime.now()
+            midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+            time.sleep((midnight - now).total_seconds() + 1)
+
+    thread = threading.Thread(target=archive_daily, name='fridgy-archiver', daemon=True)
+    thread.start()
+    return thread
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Move old meals, steps and health metrics into the archive.')
+    parser.add_argument('--data', help='data file (default: the app data file)')
+    parser.add_argument('--days', type=int, required=True, help='keep this many days of history live')
+    args = parser.parse_args(argv)
+
+    import backend.app as app_mod
+    from backend import data_service
+    if args.data:
+        app_mod.DATA_FILE = args.data
+    moved = data_service.archive_history(args.days)
+    for name, count in moved.items():
+        print('%-16s %d records archived' % (name, count))
+
+
+if __name__ == '__main__':
+    main()
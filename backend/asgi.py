@@ -0,0 +1,338 @@
+"""ASGI entry point: the Flask app served from an event loop.
+
+    uvicorn backend.asgi:app --port 8080
+
+(any ASGI server works; none ships with Fridgy). Connections are held by the
+event loop, so hundreds of idle or slow clients cost coroutines, not
+threads. The Flask app itself, and with it all storage I/O and JSON work,
+runs on a bounded pool of `ASYNC_WORKERS` threads (`FRIDGY_ASYNC_WORKERS`);
+requests beyond that wait in the loop for a free worker.
+
+Identical concurrent GETs are single-flight: while one is being answered,
+another with the same path, query and relevant headers (see
+`SHARED_HEADERS`) waits for it and is sent the same response instead of
+taking a worker. A write handled by this process starts a new generation,
+so a GET that arrives during or after a write never reuses a response
+computed before it. Loading the data file after a change is already
+single-flight in the storage backends.
+
+Streamed responses stay streamed: each body chunk is produced on a worker
+and sent as soon as it is ready. A flight buffers at most
+`MAX_BUFFERED_CHUNKS` chunks its slowest client has not been sent yet; the
+worker waits for that client before producing more, and chunks every
+client has been sent are dropped. A GET arriving once a flight has dropped
+chunks starts its own flight.
+"""
+
+import asyncio
+import contextvars
+import io
+import itertools
+import logging
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from backend import data_service
+
+logger = logging.getLogger('fridgy')
+
+# Default number of worker threads (see backend/app.py)
+ASYNC_WORKERS = 8
+
+# Methods whose concurrent identical requests share one response
+SHARED_METHODS = ('GET', 'HEAD')
+
+# Request headers that can change a response; requests differing only in
+# other headers (user agent, cookies...) share a flight
+SHARED_HEADERS = (b'accept', b'authorization', b'if-modified-since', b'if-none-match',
+                  b'origin', b'x-fridgy-household')
+
+# Body chunks a flight holds for its slowest client before the producer waits
+MAX_BUFFERED_CHUNKS = 8
+
+
+class _Flight:
+    """The response to one WSGI call, replayed to every client waiting for it."""
+
+    def __init__(self):
+        self.status = None
+        self.headers = None
+        # Body chunks not yet sent to every client; `first` is the index
+        # of chunks[0] in the whole body
+        self.chunks = deque()
+        self.first = 0
+        self.done = False
+        self.changed = asyncio.Condition()
+        # Client token -> chunks sent to it
+        self._sent = {}
+        self._tokens = itertools.count()
+
+    @property
+    def joinable(self):
+        """True while no chunk was dropped, so a new client gets the whole body."""
+        return self.first == 0
+
+    def join(self):
+        """Register a client and return the token to pass to `replay`."""
+        token = next(self._tokens)
+        self._sent[token] = 0
+        return token
+
+    async def _publish(self, **fields):
+        async with self.changed:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self.changed.notify_all()
+
+    async def add_chunk(self, chunk):
+        """Buffer a body chunk once the slowest client is close enough behind."""
+        async with self.changed:
+            await self.changed.wait_for(lambda: len(self.chunks) < MAX_BUFFERED_CHUNKS)
+            self.chunks.append(chunk)
+            self._drop_sent()
+            self.changed.notify_all()
+
+    def _drop_sent(self):
+        """Drop the chunks every client has been sent (caller holds `changed`)."""
+        end = self.first + len(self.chunks)
+        sent = min(self._sent.values(), default=end)
+        while self.first < sent:
+            self.chunks.popleft()
+            self.first += 1
+
+    async def replay(self, send, token):
+        """Send the response to the client `token`, chunks included, as they arrive."""
+        try:
+            async with self.changed:
+                await self.changed.wait_for(lambda: self.status is not None)
+            await send({"type": "http.response.start", "status": self.status,
+                        "headers": self.headers})
+            sent = 0
+            while True:
+                async with self.changed:
+                    await self.changed.wait_for(
+                        lambda: self.first + len(self.chunks) > sent or self.done)
+                    start = sent - self.first
+                    chunks = list(itertools.islice(self.chunks, start, None))
+                    done = self.done
+                for chunk in chunks:
+                    await send({"type": "http.response.body", "body": chunk,
+                                "more_body": True})
+                sent += len(chunks)
+                async with self.changed:
+                    self._sent[token] = sent
+                    self._drop_sent()
+                    self.changed.notify_all()
+                if done:
+                    break
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            # A client gone (or failed) no longer holds chunks back
+            async with self.changed:
+                self._sent.pop(token, None)
+                self._drop_sent()
+                self.changed.notify_all()
+
+
+def _latin1(value):
+    return value.decode('latin-1') if isinstance(value, bytes) else value
+
+
+def build_environ(scope, body):
+    """Return the WSGI environ for an ASGI HTTP `scope` and its request body bytes."""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': _latin1(scope.get('query_string', b'')),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = _latin1(name).upper().replace('-', '_')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        value = _latin1(value)
+        # Repeated headers are joined, as a WSGI server would
+        environ[name] = environ[name] + ',' + value if name in environ else value
+    # The body was read whole, so its length is known even if it came chunked
+    if body:
+        environ['CONTENT_LENGTH'] = str(len(body))
+    else:
+        environ.pop('CONTENT_LENGTH', None)
+    return environ
+
+
+class AsgiAdapter:
+    """ASGI application running a WSGI app on a bounded thread pool.
+
+    Args:
+        wsgi_app: The WSGI application; by default the Fridgy app with the
+            frontend routes of `backend/server.py`, imported on first use.
+        workers: Worker threads; defaults to the `ASYNC_WORKERS` setting,
+            read when the first request arrives.
+    """
+
+    def __init__(self, wsgi_app=None, workers=None):
+        self._wsgi_app = wsgi_app
+        self.workers = workers
+        self._executor = None
+        # Single-flight key -> _Flight of GETs being answered
+        self._flights = {}
+        # Bumped when a write starts and when it ends
+        self.generation = 0
+
+    @property
+    def wsgi_app(self):
+        if self._wsgi_app is None:
+            from backend.server import app as flask_app
+            self._wsgi_app = flask_app
+        return self._wsgi_app
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            workers = self.workers or data_service._get_setting('ASYNC_WORKERS',
+                                                                ASYNC_WORKERS)
+            self._executor = ThreadPoolExecutor(max_workers=workers,
+                                                thread_name_prefix='fridgy-asgi')
+        return self._executor
+
+    def close(self):
+        """Stop the worker threads once the running calls finish."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        else:
+            raise NotImplementedError('Unsupported ASGI scope type: %s' % scope['type'])
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({"type": "lifespan.startup.complete"})
+            elif message['type'] == 'lifespan.shutdown':
+                await asyncio.get_running_loop().run_in_executor(None, self.close)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _read_body(self, receive):
+        parts = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+            parts.append(message.get('body', b''))
+            if not message.get('more_body', False):
+                return b''.join(parts)
+
+    def _flight_key(self, scope):
+        headers = tuple(sorted((name.lower(), value)
+                               for name, value in scope.get('headers', [])
+                               if name.lower() in SHARED_HEADERS))
+        return (scope['method'], scope.get('root_path', ''), scope['path'],
+                scope.get('query_string', b''), headers, self.generation)
+
+    async def _http(self, scope, receive, send):
+        body = await self._read_body(receive)
+        if body is None:
+            return
+        if scope['method'] in SHARED_METHODS and not body:
+            key = self._flight_key(scope)
+            flight = self._flights.get(key)
+            if flight is None or not flight.joinable:
+                flight = self._flights[key] = _Flight()
+                token = flight.join()
+                environ = build_environ(scope, body)
+                task = asyncio.ensure_future(self._produce(flight, environ))
+                task.add_done_callback(lambda _: self._end_flight(key, flight))
+            else:
+                token = flight.join()
+            await flight.replay(send, token)
+            return
+
+        self.generation += 1
+        try:
+            flight = _Flight()
+            token = flight.join()
+            # Not shared, so it is produced and sent in step
+            await asyncio.gather(self._produce(flight, build_environ(scope, body)),
+                                 flight.replay(send, token))
+        finally:
+            self.generation += 1
+
+    def _end_flight(self, key, flight):
+        # A newer flight may have taken the key once this one dropped chunks
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def _produce(self, flight, environ):
+        """Run the WSGI app for `environ` on the pool and publish its response."""
+        loop = asyncio.get_running_loop()
+        # One context for every step of the request, so context-local state
+        # set while calling the app is still there when the body is iterated
+        context = contextvars.copy_context()
+
+        def run(func, *args):
+            return loop.run_in_executor(self.executor, context.run, func, *args)
+
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(name.lower().encode('latin-1'),
+                                   value.encode('latin-1'))
+                                  for name, value in headers]
+            return lambda data: started.setdefault('written', []).append(data)
+
+        result = None
+        try:
+            result = await run(self.wsgi_app, environ, start_response)
+            await flight._publish(status=started['status'], headers=started['headers'])
+            for chunk in started.get('written', []):
+                await flight.add_chunk(chunk)
+            iterator = iter(result)
+            end = object()
+            while True:
+                chunk = await run(next, iterator, end)
+                if chunk is end:
+                    break
+                if chunk:
+                    await flight.add_chunk(chunk)
+        except Exception:
+            logger.exception('Error while serving %s %s', environ['REQUEST_METHOD'],
+                             environ['PATH_INFO'])
+            if flight.status is None:
+                await flight._publish(
+                    status=500, headers=[(b'content-type', b'application/json')],
+                    chunks=deque([b'{"error": "Internal server error"}']))
+        finally:
+            if result is not None and hasattr(result, 'close'):
+                await run(result.close)
+            await flight._publish(done=True)
+
+
+def create_app(wsgi_app=None, workers=None):
+    """Return an ASGI app serving `wsgi_app` (default: the Fridgy app and frontend)."""
+    return AsgiAdapter(wsgi_app, workers)
+
+
+app = create_app()
@@ -0,0 +1,63 @@
+"""Request handling shared by the batch endpoints.
+
+A batch request body is a JSON array of objects (or `{"items": [...]}`).
+Every item is validated before anything is written; if any item is
+invalid the response is 400 with one error per bad item and nothing is
+stored. Valid batches are written with one `apply_changes` call: one file
+write, one journal fsync, or one SQLite transaction.
+"""
+
+from flask import jsonify, request
+
+from backend.data_service import apply_changes
+
+# Most items accepted in one batch request
+MAX_BATCH_ITEMS = 1000
+
+
+def read_items(validate=None):
+    """Return `(items, None)` from the request body, or `(None, error response)`.
+
+    Args:
+        validate: Optional callable returning an error message for a bad
+            item, or None if the item is fine.
+    """
+    body = request.get_json(silent=True)
+    if isinstance(body, dict):
+        body = body.get('items')
+    if not isinstance(body, list) or not body:
+        return None, (jsonify({"error": "Body must be a non-empty JSON array of objects"}), 400)
+    if len(body) > MAX_BATCH_ITEMS:
+        return None, (jsonify({"error": "At most %d items per batch" % MAX_BATCH_ITEMS}), 400)
+
+    errors = []
+    for index, item in enumerate(body):
+        message = 'must be a JSON object' if not isinstance(item, dict) else validate and validate(item)
+        if message:
+            errors.append({"index": index, "error": message})
+    if errors:
+        return None, (jsonify({"error": "Invalid items; nothing was saved", "items": errors}), 400)
+    return body, None
+
+
+def insert_batch(collection, records):
+    """Insert `records` into `collection` with one write and return the 201 response."""
+    apply_changes([{"op": "insert", "collection": collection, "record": r} for r in records])
+    return jsonify(records), 201
+
+
+def delete_batch(collection):
+    """Delete the records whose ids are listed in the body (`{"ids": [...]}`)."""
+    body = request.get_json(silent=True)
+    ids = body.get('ids') if isinstance(body, dict) else body
+    if not isinstance(ids, list) or not ids or not all(
+            isinstance(i, (str, int)) and not isinstance(i, bool) for i in ids):
+        return jsonify({"error": "Body must be {\"ids\": [...]} with a non-empty list of ids"}), 400
+    if len(ids) > MAX_BATCH_ITEMS:
+        return jsonify({"error": "At most %d ids per batch" % MAX_BATCH_ITEMS}), 400
+    results = apply_changes([{"op": "delete", "collection": collection, "id": i} for i in ids])
+    return jsonify({"deleted": sum(1 for r in results if r)})
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
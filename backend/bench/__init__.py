@@ -0,0 +1,9 @@
+"""Benchmark harness for the Fridgy API.
+
+`dataset.py` writes seeded synthetic data files and `run.py` drives the API
+through Flask's test client against them, reporting latency percentiles,
+throughput and peak memory as JSON so runs can be compared across commits:
+
+    python -m backend.bench.run --scale small --out bench.json
+    python -m backend.bench.run --scale full --compare bench.json
+"""
@@ -0,0 +1,230 @@
+"""Seeded generator of realistic Fridgy data files.
+
+The same seed, sizes and `today` always produce the same file, so benchmark
+runs on different commits see identical data. Records are generated and written one
+at a time, so even the full-size data set (500k meals) is written without
+holding it in memory.
+"""
+
+import argparse
+import json
+import random
+from datetime import datetime, timedelta
+
+from backend.indexes.rollups import NUTRITION_FIELDS
+from backend.storage.base import COLLECTIONS
+
+# Record counts per named scale
+SCALES = {
+    'tiny': {"foods": 50, "recipes": 20, "meals": 500, "days": 30},
+    'small': {"foods": 1000, "recipes": 100, "meals": 20000, "days": 180},
+    'full': {"foods": 10000, "recipes": 1000, "meals": 500000, "days": 3 * 365},
+}
+
+BASE_FOODS = [
+    # name, category, storage, nutrition per unit (calories, protein, carbs, fats, sugar, sodium)
+    ('milk', 'dairy', 'fridge', (120, 8, 12, 5, 12, 100)),
+    ('yogurt', 'dairy', 'fridge', (100, 10, 6, 4, 5, 60)),
+    ('cheese', 'dairy', 'fridge', (110, 7, 1, 9, 0, 180)),
+    ('butter', 'dairy', 'fridge', (100, 0, 0, 11, 0, 90)),
+    ('egg', 'protein', 'fridge', (70, 6, 0, 5, 0, 70)),
+    ('chicken breast', 'protein', 'freezer', (165, 31, 0, 4, 0, 75)),
+    ('salmon', 'protein', 'freezer', (208, 20, 0, 13, 0, 60)),
+    ('beef', 'protein', 'freezer', (250, 26, 0, 15, 0, 70)),
+    ('tofu', 'protein', 'fridge', (80, 8, 2, 5, 0, 10)),
+    ('apple', 'fruits', 'shelf', (95, 0.5, 25, 0.3, 19, 2)),
+    ('banana', 'fruits', 'shelf', (105, 1.3, 27, 0.4, 14, 1)),
+    ('orange', 'fruits', 'shelf', (62, 1.2, 15, 0.2, 12, 0)),
+    ('strawberries', 'fruits', 'fridge', (50, 1, 12, 0.5, 7, 1)),
+    ('tomato', 'vegetables', 'fridge', (22, 1, 5, 0.2, 3, 6)),
+    ('carrot', 'vegetables', 'fridge', (25, 0.6, 6, 0.1, 3, 42)),
+    ('spinach', 'vegetables', 'fridge', (7, 0.9, 1, 0.1, 0, 24)),
+    ('broccoli', 'vegetables', 'fridge', (55, 3.7, 11, 0.6, 2, 33)),
+    ('potato', 'vegetables', 'shelf', (160, 4, 37, 0.2, 2, 17)),
+    ('onion', 'vegetables', 'shelf', (44, 1.2, 10, 0.1, 5, 4)),
+    ('garlic', 'vegetables', 'shelf', (4, 0.2, 1, 0, 0, 1)),
+    ('rice', 'grains', 'shelf', (206, 4.3, 45, 0.4, 0, 2)),
+    ('pasta', 'grains', 'shelf', (220, 8, 43, 1.3, 1, 1)),
+    ('bread', 'grains', 'shelf', (80, 3, 15, 1, 2, 150)),
+    ('oats', 'grains', 'shelf', (150, 5, 27, 3, 1, 0)),
+    ('olive oil', 'pantry', 'shelf', (120, 0, 0, 14, 0, 0)),
+    ('chocolate', 'snacks', 'shelf', (210, 2, 24, 13, 20, 10)),
+    ('chips', 'snacks', 'shelf', (150, 2, 15, 10, 0, 170)),
+    ('cookies', 'snacks', 'shelf', (160, 2, 22, 7, 12, 110)),
+    ('ice cream', 'snacks', 'freezer', (270, 4, 31, 14, 28, 100)),
+    ('soda', 'drinks', 'fridge', (140, 0, 39, 0, 39, 45)),
+    ('orange juice', 'drinks', 'fridge', (110, 2, 26, 0, 21, 2)),
+    ('coffee', 'drinks', 'shelf', (2, 0.3, 0, 0, 0, 5)),
+]
+
+VARIANTS = ['', 'organic', 'fresh', 'whole', 'light', 'smoked', 'frozen', 'homemade',
+            'spicy', 'sweet', 'local', 'wild', 'roasted', 'dried', 'low-fat', 'greek']
+
+UNITS = ['piece', 'pack', 'bottle', 'kg', 'g', 'liter', 'can', 'box']
+
+AMOUNTS = ['1', '2', '1/2 cup', '2 cups', '1 tbsp', '2 tbsp', '1 tsp', '200g', '500g', 'a pinch of']
+
+MEAL_HOURS = {'breakfast': (6, 10), 'lunch': (11, 14), 'dinner': (18, 21), 'snacks': (9, 23)}
+
+METRIC_TYPES = {'weight': (72.0, 0.6), 'bmi': (23.5, 0.2), 'cholesterol': (180.0, 12.0)}
+
+
+def _round(value):
+    return round(value, 2)
+
+
+def _nutrition(base):
+    calories, protein, carbs, fats, sugar, sodium = base
+    return {
+        "calories": calories, "protein": protein, "carbs": carbs, "fats": fats,
+        "saturatedFats": _round(fats * 0.35), "sodium": sodium,
+        "cholesterol": 30 if fats > 5 else 0, "fiber": _round(carbs * 0.08), "sugar": sugar,
+    }
+
+
+def generate_foods(rng, count, today):
+    """Yield `count` foods spread over the base foods, storage types and expiry dates."""
+    for i in range(count):
+        name, category, storage, base = BASE_FOODS[i % len(BASE_FOODS)]
+        variant = VARIANTS[(i // len(BASE_FOODS)) % len(VARIANTS)]
+        suffix = i // (len(BASE_FOODS) * len(VARIANTS))
+        full_name = ' '.join(p for p in (variant, name) if p) + (' #%d' % suffix if suffix else '')
+        purchased = today - timedelta(days=rng.randint(0, 30))
+        yield {
+            "id": "food-%d" % i,
+            "name": full_name.title(),
+            "storageType": storage,
+            "quantity": rng.randint(1, 6),
+            "unit": rng.choice(UNITS),
+            "purchaseDate": purchased.isoformat(),
+            "expiryDate": (today + timedelta(days=rng.randint(-10, 120))).date().isoformat(),
+            "category": category,
+            "nutrition": _nutrition(base),
+        }
+
+
+def generate_recipes(rng, count):
+    """Yield `count` recipes whose ingredients mention the base foods."""
+    for i in range(count):
+        ingredients = rng.sample(BASE_FOODS, rng.randint(3, 10))
+        main = ingredients[0][0]
+        yield {
+            "id": "recipe-%d" % i,
+            "name": "%s %s %d" % (rng.choice(VARIANTS[1:]).title(), main.title(), i),
+            "ingredients": ["%s %s" % (rng.choice(AMOUNTS), food[0]) for food in ingredients],
+            "instructions": "Prepare the %s and combine everything. Cook for %d minutes."
+                            % (main, rng.randint(5, 60)),
+            "servings": rng.randint(1, 6),
+            "prepTime": rng.randint(5, 90),
+        }
+
+
+def generate_meals(rng, count, foods, days, today):
+    """Yield `count` meals spread evenly over the last `days` days, oldest first.
+
+    Each meal lists one to four stored foods and carries the nutrition the
+    API would have computed for it.
+    """
+    first_day = today - timedelta(days=days - 1)
+    per_day = count / days
+    for i in range(count):
+        day = first_day + timedelta(days=int(i / per_day))
+        meal_type = rng.choice(list(MEAL_HOURS))
+        start, end = MEAL_HOURS[meal_type]
+        moment = day.replace(hour=rng.randint(start, end), minute=rng.randint(0, 59), second=0)
+        items = []
+        nutrition = dict.fromkeys(NUTRITION_FIELDS, 0)
+        for food in rng.sample(foods, rng.randint(1, 4)):
+            quantity = rng.randint(1, 2)
+            items.append({"id": food['id'], "name": food['name'], "quantity": quantity})
+            for key in NUTRITION_FIELDS:
+                nutrition[key] = _round(nutrition[key] + food['nutrition'][key] * quantity)
+        yield {
+            "id": "meal-%d" % i,
+            "mealType": meal_type,
+            "foods": items,
+            "date": moment.isoformat(),
+            "time": moment.strftime('%H:%M'),
+            "nutrition": nutrition,
+        }
+
+
+def generate_steps(rng, days, today):
+    """Yield one to three step entries per day for the last `days` days."""
+    first_day = today - timedelta(days=days - 1)
+    n = 0
+    for d in range(days):
+        day = first_day + timedelta(days=d)
+        for _ in range(rng.randint(1, 3)):
+            moment = day.replace(hour=rng.randint(7, 22), minute=rng.randint(0, 59), second=0)
+            yield {"id": "steps-%d" % n, "steps": rng.randint(500, 9000), "date": moment.isoformat()}
+            n += 1
+
+
+def generate_health_metrics(rng, days, today):
+    """Yield a daily weight and weekly BMI and cholesterol readings that drift slowly."""
+    first_day = today - timedelta(days=days - 1)
+    values = {metric: mean for metric, (mean, _) in METRIC_TYPES.items()}
+    n = 0
+    for d in range(days):
+        day = first_day + timedelta(days=d, hours=7)
+        for metric, (mean, spread) in METRIC_TYPES.items():
+            if metric != 'weight' and d % 7:
+                continue
+            values[metric] += rng.uniform(-spread, spread) + (mean - values[metric]) * 0.05
+            yield {"id": "metric-%d" % n, "type": metric, "value": _round(values[metric]),
+                   "date": day.isoformat()}
+            n += 1
+
+
+def write_dataset(path, seed=0, foods=1000, recipes=100, meals=20000, days=180, today=None):
+    """Write a synthetic data file and return the number of records per collection.
+
+    Args:
+        path: Data file to (over)write.
+        seed: Random seed; the same arguments always produce the same file.
+        foods, recipes, meals: Number of records to generate.
+        days: How many days of meals, steps and health metrics to cover,
+            ending today.
+        today: Last day covered (default: now); fixed for reproducible files.
+    """
+    rng = random.Random(seed)
+    today = (today or datetime.now()).replace(hour=0, minute=0, second=0, microsecond=0)
+    food_list = list(generate_foods(rng, foods, today))
+    collections = {
+        'foods': food_list,
+        'recipes': generate_recipes(rng, recipes),
+        'meals': generate_meals(rng, meals, food_list, days, today),
+        'healthMetrics': generate_health_metrics(rng, days, today),
+        'steps': generate_steps(rng, days, today),
+    }
+
+    counts = {}
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{')
+        for i, name in enumerate(COLLECTIONS):
+            f.write('%s\n%s: [' % (',' if i else '', json.dumps(name)))
+            count = 0
+            for record in collections.get(name, ()):
+                f.write(('\n' if count == 0 else ',\n') + json.dumps(record))
+                count += 1
+            f.write(']')
+            counts[name] = count
+        f.write('\n}\n')
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write a seeded synthetic Fridgy data file.')
+    parser.add_argument('path', help='data file to write')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    counts = write_dataset(args.path, seed=args.seed, **SCALES[args.scale])
+    for name, count in counts.items():
+        print('%-16s %d records' % (name, count))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+"""Drive the API with Flask's test client and report latency, throughput and memory.
+
+Each scenario sends one kind of request `--requests` times (after a few
+untimed warm-up requests) against a data file from `dataset.py`. Results
+hold p50/p95/p99 and mean latency in milliseconds and requests per second
+per scenario, plus load time and peak RSS for the run. `--out` saves them
+as JSON; `--compare` prints the change of each scenario's p50 and p95
+against an earlier saved run.
+
+The serialized-response cache is off by default so reads measure the work
+behind each endpoint; pass `--response-cache` to measure cached reads.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import backend.app as app_mod
+from backend import data_service
+from backend.bench.dataset import SCALES, write_dataset
+
+# Untimed requests sent before each scenario
+WARMUP_REQUESTS = 3
+
+
+def peak_rss_mb():
+    """Return the peak resident set size of this process in MiB, or None if unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def percentile(sorted_values, fraction):
+    """Return the `fraction` percentile (0..1) of sorted values (interpolated)."""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    low, high = sorted_values[lower], sorted_values[upper]
+    return low + (high - low) * (position - lower)
+
+
+def scenarios(today):
+    """Return `(name, method, path, body factory)` for every benchmarked request.
+
+    Body factories take the request number, so write scenarios create
+    distinct records.
+    """
+    day = today.date().isoformat()
+    week_ago = (today - timedelta(days=6)).date().isoformat()
+    return [
+        ('health', 'GET', '/api/health', None),
+        ('foods.list', 'GET', '/api/foods', None),
+        ('foods.list.page', 'GET', '/api/foods?limit=50&fields=id,name,expiryDate',
+         None),
+        ('meals.list.range', 'GET',
+         '/api/meals?from=%s&to=%s&order=desc' % (week_ago, day), None),
+        ('meals.list.page', 'GET', '/api/meals?limit=100&order=desc', None),
+        ('recipes.list', 'GET', '/api/recipes', None),
+        ('health-metrics.list', 'GET',
+         '/api/health-metrics?type=weight&from=%s' % week_ago, None),
+        ('reminders', 'GET', '/api/reminders', None),
+        ('recommendations', 'GET', '/api/recommendations?limit=20', None),
+        ('nutrition.daily', 'GET', '/api/nutrition/daily?date=%s' % day, None),
+        ('nutrition.trends', 'GET', '/api/nutrition/trends?days=30', None),
+        ('stats', 'GET', '/api/stats?days=30', None),
+        ('dashboard', 'GET', '/api/dashboard?days=30', None),
+        ('steps.day', 'GET', '/api/steps?date=%s' % day, None),
+        ('steps.range', 'GET', '/api/steps?from=%s&to=%s' % (week_ago, day), None),
+        ('health-metrics.trends', 'GET',
+         '/api/health-metrics/trends?types=weight,bmi&days=90', None),
+        ('food-addictions.analysis', 'GET', '/api/food-addictions/analysis?days=30',
+         None),
+        ('foods.create', 'POST', '/api/foods', lambda n: {
+            "name": "Bench Food %d" % n, "storageType": "fridge", "quantity": 1,
+            "unit": "piece", "expiryDate": day, "category": "bench",
+            "nutrition": {"calories": 100, "protein": 5, "sugar": 3}}),
+        ('meals.create', 'POST', '/api/meals', lambda n: {
+            "mealType": "lunch",
+            "foods": [{"id": "food-%d" % (n % 50), "quantity": 1}, "Milk"]}),
+        ('steps.create', 'POST', '/api/steps', lambda n: {"steps": 1000 + n}),
+        ('meals.batch', 'POST', '/api/meals/batch', lambda n: [
+            {"mealType": "snacks", "foods": [{"id": "food-%d" % i}]}
+            for i in range(20)]),
+    ]
+
+
+def run_scenario(client, method, path, body, requests):
+    """Send one request shape `requests` times and return its timing summary."""
+    def send(n):
+        response = client.open(path, method=method, json=body(n) if body else None)
+        if response.status_code >= 400:
+            raise RuntimeError('%s %s returned %d'
+                               % (method, path, response.status_code))
+        # Drain streamed bodies so their serialization is timed too
+        response.get_data()
+
+    for n in range(WARMUP_REQUESTS):
+        send(n)
+    timings = []
+    started = time.perf_counter()
+    for n in range(requests):
+        t0 = time.perf_counter()
+        send(WARMUP_REQUESTS + n)
+        timings.append((time.perf_counter() - t0) * 1000)
+    elapsed = time.perf_counter() - started
+    timings.sort()
+    return {
+        "requests": requests,
+        "p50Ms": round(percentile(timings, 0.50), 3),
+        "p95Ms": round(percentile(timings, 0.95), 3),
+        "p99Ms": round(percentile(timings, 0.99), 3),
+        "meanMs": round(sum(timings) / len(timings), 3),
+        "maxMs": round(timings[-1], 3),
+        "throughputRps": round(requests / elapsed, 1) if elapsed else None,
+    }
+
+
+def _git_commit():
+    try:
+        done = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(__file__))
+        return done.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(data_file, storage_mode='json', requests=50, only=None,
+                   response_cache=False):
+    """Benchmark every scenario against `data_file` and return the results dict.
+
+    Args:
+        data_file: Data file to benchmark against; write scenarios change it.
+        storage_mode: 'json', 'journal', 'sqlite' or 'partitioned'. For
+            'sqlite' the JSON file is first migrated into a database next to
+            it; 'partitioned' splits it on first use.
+        requests: Timed requests per scenario.
+        only: Optional list of scenario names to run.
+        response_cache: Keep the serialized-response cache on.
+    """
+    saved = {name: getattr(app_mod, name)
+             for name in ('DATA_FILE', 'STORAGE_MODE', 'RESPONSE_CACHE_ENTRIES')}
+    app_mod.DATA_FILE = data_file
+    app_mod.STORAGE_MODE = storage_mode
+    if not response_cache:
+        app_mod.RESPONSE_CACHE_ENTRIES = 0
+    data_service.invalidate_cache(data_file)
+    try:
+        started = time.perf_counter()
+        if storage_mode == 'sqlite':
+            from backend.storage.sqlite_storage import migrate_from_json
+            migrate_from_json(data_file)
+        data_service.get_document()
+        load_ms = (time.perf_counter() - started) * 1000
+
+        results = {}
+        today = datetime.now()
+        with app_mod.app.test_client() as client:
+            for name, method, path, body in scenarios(today):
+                if only and name not in only:
+                    continue
+                results[name] = run_scenario(client, method, path, body, requests)
+    finally:
+        data_service.invalidate_cache(data_file)
+        for name, value in saved.items():
+            setattr(app_mod, name, value)
+
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.now().isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "storageMode": storage_mode,
+        "responseCache": response_cache,
+        "dataFileBytes": os.path.getsize(data_file),
+        "loadMs": round(load_ms, 1),
+        "peakRssMb": peak_rss_mb(),
+        "scenarios": results,
+    }
+
+
+def compare(previous, current):
+    """Return report lines with each scenario's p50/p95 change since `previous`."""
+    lines = ['%-28s %12s %12s' % ('scenario', 'p50 change', 'p95 change')]
+    for name, now in current['scenarios'].items():
+        before = previous.get('scenarios', {}).get(name)
+        if before is None:
+            lines.append('%-28s %12s %12s' % (name, 'new', 'new'))
+            continue
+        changes = ['%+11.1f%%' % ((now[key] / before[key] - 1) * 100) if before[key]
+                   else '%12s' % '-' for key in ('p50Ms', 'p95Ms')]
+        lines.append('%-28s %s %s' % (name, changes[0], changes[1]))
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the Fridgy API.')
+    parser.add_argument('--data',
+                        help='existing data file to copy and benchmark against '
+                             '(default: generate one with --scale and --seed)')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--storage', default='json',
+                        choices=('json', 'journal', 'sqlite', 'partitioned'))
+    parser.add_argument('--requests', type=int, default=50,
+                        help='timed requests per scenario')
+    parser.add_argument('--only', help='comma-separated scenario names to run')
+    parser.add_argument('--response-cache', action='store_true',
+                        help='keep the response cache on')
+    parser.add_argument('--out', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        data_file = os.path.join(workdir, 'food_data.json')
+        if args.data:
+            with open(args.data, 'rb') as src, open(data_file, 'wb') as dst:
+                dst.write(src.read())
+            dataset = {"source": os.path.abspath(args.data)}
+        else:
+            counts = write_dataset(data_file, seed=args.seed, **SCALES[args.scale])
+            dataset = {"scale": args.scale, "seed": args.seed, "records": counts}
+        only = [n for n in args.only.split(',') if n] if args.only else None
+        results = run_benchmarks(data_file, args.storage, args.requests, only,
+                                 args.response_cache)
+    results['dataset'] = dataset
+
+    print('%-28s %9s %9s %9s %10s'
+          % ('scenario', 'p50 ms', 'p95 ms', 'p99 ms', 'req/s'))
+    for name, r in results['scenarios'].items():
+        print('%-28s %9.2f %9.2f %9.2f %10.1f'
+              % (name, r['p50Ms'], r['p95Ms'], r['p99Ms'], r['throughputRps']))
+    print('load %.0f ms, peak RSS %s MiB' % (results['loadMs'], results['peakRssMb']))
+
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            previous = json.load(f)
+        print('\n'.join(compare(previous, results)))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,52 @@
-import json
+import itertools
 import os
 import uuid
 from datetime import datetime, timedelta
 
+from backend import metrics
+from backend.archive import ARCHIVED, Archive, is_archivable
+from backend.households import HOUSEHOLDS_DIR, current_household, household_file
+from backend.indexes.timeline import Timeline
+from backend.metrics import timed
+from backend.storage import create_storage
+from backend.storage.base import PREFIX_END, working_copy
+from backend.storage.pool import StorePool
+
 DATA_FILE = 'food_data.json'
 
+# Storage backend name: 'json', 'journal', 'sqlite' or 'partitioned'
+# (see backend/storage/)
+STORAGE_MODE = 'json'
+
+# Milliseconds a write waits for concurrent writes to share its flush (0 = off)
+WRITE_BATCH_MS = 0
+
+# Data file format: 'json', 'compact' or 'msgpack'
+# (see backend/storage/serialization.py)
+SNAPSHOT_FORMAT = 'json'
+
+# Most storage backends (households) kept in memory, and their total size
+# on disk in MiB (0 = no limit)
+STORE_POOL_SIZE = 64
+STORE_POOL_MB = 512
+
+# Storage backends, keyed by (storage mode, data file path)
+_pool = StorePool()
+
+# Archives of old history (see backend/archive.py), keyed by data file path
+_archives = StorePool()
+
 def _get_data_file():
     """Return the path to the data file.
 
     Priority:
+    - The household's file, if the current request names a household.
     - If `backend.app.DATA_FILE` exists (tests set this via monkeypatch), use it.
     - Otherwise use module-level DATA_FILE (defaults to file in current folder).
     """
+    household = current_household()
+    if household is not None:
+        return household_file(_get_setting('HOUSEHOLDS_DIR', HOUSEHOLDS_DIR), household)
     # Try to read an override from the backend package (if available).
     try:
         # Import lazily to avoid circular imports at module import time.
@@ -21,91 +56,389 @@ def _get_data_file():
         # If import fails (running outside package), fall back to local DATA_FILE
         return DATA_FILE
 
-def load_data():
+def _get_setting(name, default):
+    """Return `backend.app.<name>` if set (tests monkeypatch these), else `default`."""
     try:
-        data_file = _get_data_file()
-        if not os.path.exists(data_file):
-            sample_data = {
-                "foods": [
-                    {
-                        "id": "1",
-                        "name": "Milk",
-                        "storageType": "fridge",
-                        "quantity": 1,
-                        "unit": "bottle",
-                        "purchaseDate": datetime.now().isoformat(),
-                        "expiryDate": "2024-12-15",
-                        "category": "dairy",
-                        "nutrition": {
-                            "calories": 150,
-                            "protein": 8,
-                            "carbs": 12,
-                            "fats": 8,
-                            "saturatedFats": 5,
-                            "sodium": 120,
-                            "cholesterol": 30,
-                            "fiber": 0,
-                            "sugar": 12
-                        }
-                    },
-                    {
-                        "id": "2", 
-                        "name": "Apples",
-                        "storageType": "shelf",
-                        "quantity": 5,
-                        "unit": "pieces",
-                        "purchaseDate": datetime.now().isoformat(),
-                        "expiryDate": "2024-12-20",
-                        "category": "fruits",
-                        "nutrition": {
-                            "calories": 95,
-                            "protein": 0.5,
-                            "carbs": 25,
-                            "fats": 0.3,
-                            "saturatedFats": 0.1,
-                            "sodium": 2,
-                            "cholesterol": 0,
-                            "fiber": 4,
-                            "sugar": 19
-                        }
-                    }
-                ],
-                "recipes": [],
-                "meals": [],
-                "healthMetrics": [],
-                "sharedRecipes": [],
-                "foodAddictions": [],
-                "steps": []
-            }
-            save_data(sample_data)
-            return sample_data
-
-        with open(data_file, 'r') as f:
-            data = json.load(f)
-            if 'steps' not in data:
-                data['steps'] = []
-                save_data(data)
-            return data
-    except json.JSONDecodeError:
-        # Return a safe default structure if file is corrupted
-        default = {"foods": [], "recipes": [], "meals": [], "healthMetrics": [], "sharedRecipes": [], "foodAddictions": [], "steps": []}
-        save_data(default)
-        return default
+        import backend.app as app_mod
+        return getattr(app_mod, name, default)
     except Exception:
-        # On other errors (permission, etc.) return an empty structure to keep the API up
-        return {"foods": [], "recipes": [], "meals": [], "healthMetrics": [], "sharedRecipes": [], "foodAddictions": [], "steps": []}
+        return default
+
+def _get_storage_mode():
+    return _get_setting('STORAGE_MODE', STORAGE_MODE)
+
+def _store_key():
+    return (_get_storage_mode(), _get_data_file())
+
+def get_storage():
+    """Return the storage backend for the current data file and mode.
+
+    Backends are kept in a bounded LRU pool; the least recently used are
+    closed and dropped once there are more than STORE_POOL_SIZE of them or
+    their files add up to more than STORE_POOL_MB.
+    """
+    key = _store_key()
+
+    def create():
+        batch_window = _get_setting('WRITE_BATCH_MS', WRITE_BATCH_MS) / 1000.0
+        snapshot_format = _get_setting('SNAPSHOT_FORMAT', SNAPSHOT_FORMAT)
+        return create_storage(key[0], key[1], _sample_data, batch_window,
+                              snapshot_format)
+
+    return _pool.get(key, create, _get_setting('STORE_POOL_SIZE', STORE_POOL_SIZE),
+                     _get_setting('STORE_POOL_MB', STORE_POOL_MB) * 1024 * 1024)
+
+def store_pool_stats():
+    """Return the store pool's size, hits, misses, evictions and hit rate."""
+    return _pool.stats()
+
+def _store_pool_gauges():
+    stats = _pool.stats()
+    return [
+        ('fridgy_store_pool_resident', 'gauge',
+         'Storage backends (households) held in memory.', stats['resident']),
+        ('fridgy_store_pool_resident_bytes', 'gauge',
+         'On-disk size of the resident backends.', stats['residentBytes']),
+        ('fridgy_store_pool_hits_total', 'counter',
+         'Store lookups served by a resident backend.', stats['hits']),
+        ('fridgy_store_pool_misses_total', 'counter',
+         'Store lookups that opened a backend.', stats['misses']),
+        ('fridgy_store_pool_evictions_total', 'counter',
+         'Backends closed to stay within the pool limits.', stats['evictions']),
+    ]
+
+metrics.add_gauges(_store_pool_gauges)
 
+def invalidate_cache(data_file=None):
+    """Drop the in-memory state for `data_file` (or for every data file)."""
+    _pool.discard(lambda key: data_file is None or key[1] == data_file)
+
+def _sample_data():
+    """Return the document written when no data file exists yet."""
+    return {
+        "foods": [
+            {
+                "id": "1",
+                "name": "Milk",
+                "storageType": "fridge",
+                "quantity": 1,
+                "unit": "bottle",
+                "purchaseDate": datetime.now().isoformat(),
+                "expiryDate": "2024-12-15",
+                "category": "dairy",
+                "nutrition": {
+                    "calories": 150,
+                    "protein": 8,
+                    "carbs": 12,
+                    "fats": 8,
+                    "saturatedFats": 5,
+                    "sodium": 120,
+                    "cholesterol": 30,
+                    "fiber": 0,
+                    "sugar": 12
+                }
+            },
+            {
+                "id": "2", 
+                "name": "Apples",
+                "storageType": "shelf",
+                "quantity": 5,
+                "unit": "pieces",
+                "purchaseDate": datetime.now().isoformat(),
+                "expiryDate": "2024-12-20",
+                "category": "fruits",
+                "nutrition": {
+                    "calories": 95,
+                    "protein": 0.5,
+                    "carbs": 25,
+                    "fats": 0.3,
+                    "saturatedFats": 0.1,
+                    "sodium": 2,
+                    "cholesterol": 0,
+                    "fiber": 4,
+                    "sugar": 19
+                }
+            }
+        ],
+        "recipes": [],
+        "meals": [],
+        "healthMetrics": [],
+        "sharedRecipes": [],
+        "foodAddictions": [],
+        "steps": []
+    }
+
+
+@timed('load')
+def load_data(readonly=False):
+    """Return the whole data document.
+
+    Backends keep the parsed document in memory and only re-read storage
+    after it changed, including changes made by other processes.
+
+    Args:
+        readonly: When True, return the shared cached document itself. This
+            is free, but callers must not modify it. GET handlers use this.
+            Otherwise a working copy is returned that can be changed and
+            passed to `save_data`.
+    """
+    data = get_storage().load()
+    return data if readonly else working_copy(data)
+
+@timed('save')
 def save_data(data):
-    try:
-        data_file = _get_data_file()
-        # Ensure directory exists (for absolute temp paths used in tests)
-        dirpath = os.path.dirname(data_file)
-        if dirpath and not os.path.exists(dirpath):
-            os.makedirs(dirpath, exist_ok=True)
-        with open(data_file, 'w') as f:
-            json.dump(data, f, indent=2)
-    except Exception:
-        raise
+    """Replace the whole stored document with `data`.
+
+    Prefer `insert_record`, `update_record` and `delete_record` for single
+    changes: the journal and SQLite backends then only write that record.
+    """
+    get_storage().replace(data)
+
+@timed('save')
+def insert_record(collection, record):
+    """Append `record` to `collection` and persist it."""
+    return get_storage().apply({"op": "insert", "collection": collection,
+                                "record": record})
+
+@timed('save')
+def update_record(collection, record_id, changes):
+    """Merge `changes` into the record with `record_id`.
+
+    Returns:
+        The updated record, or None if no record has that id.
+    """
+    return get_storage().apply({"op": "update", "collection": collection,
+                                "id": record_id, "changes": changes})
+
+@timed('save')
+def delete_record(collection, record_id):
+    """Remove the record with `record_id`. Returns True if one was removed."""
+    return get_storage().apply({"op": "delete", "collection": collection,
+                                "id": record_id})
+
+@timed('save')
+def apply_changes(entries):
+    """Persist several mutation entries together and return one result per entry.
+
+    Entries have the form taken by `Document.apply`. They are written with
+    one file write (json), one fsync (journal) or one transaction (sqlite).
+    """
+    return get_storage().apply_many(entries)
+
+@timed('load')
+def list_records(collection):
+    """Return every record of `collection` (shared, read-only)."""
+    return get_storage().list_records(collection)
+
+@timed('load')
+def get_record(collection, record_id):
+    """Return the record with `record_id`, or None."""
+    return get_storage().get_record(collection, record_id)
+
+@timed('load')
+def find_records(collection, **equals):
+    """Return records whose fields equal the keyword arguments, e.g. `type='weight'`."""
+    return get_storage().find_records(collection, **equals)
+
+@timed('load')
+def query_range(collection, field, start=None, end=None, **equals):
+    """Return records with `start <= record[field] < end` (ISO dates sort as text)."""
+    return get_storage().query_range(collection, field, start, end, **equals)
+
+@timed('load')
+def query_prefix(collection, field, prefix, **equals):
+    """Return records whose `field` starts with `prefix`, e.g. all meals of one day."""
+    return get_storage().query_prefix(collection, field, prefix, **equals)
+
+@timed('load')
+def records_in_period(collection, prefix):
+    """Return the records of the day, month or year `prefix`, oldest first.
+
+    `prefix` is e.g. '2024-05-01', '2024-05' or '2024'.
+
+    Uses the `Timeline` index when the document is in memory. Otherwise the
+    backend answers the query itself, so the partitioned one reads only the
+    months involved instead of loading everything. Archived records of the
+    period are included.
+    """
+    records = None
+    if is_document_loaded():
+        records = get_index(Timeline).in_period(collection, prefix)
+    if records is None:
+        records = _sorted_by_date(query_prefix(collection, 'date', prefix))
+    archived = _archived_records(collection, prefix, prefix + PREFIX_END)
+    return _sorted_by_date(archived + records) if archived else records
+
+def _sorted_by_date(records, reverse=False):
+    return sorted(records, reverse=reverse,
+                  key=lambda r: r.get('date') if isinstance(r.get('date'), str) else '')
+
+def _archived_records(collection, start, end, **equals):
+    """Return archived `collection` records with `start <= date < end` and `equals`."""
+    if collection not in ARCHIVED:
+        return []
+    records = get_archive().records(collection, start, end)
+    if equals:
+        records = [r for r in records if all(r.get(k) == v for k, v in equals.items())]
+    return records
+
+def is_document_loaded():
+    """Return True if the whole document is in memory, so indexes are cheap to use."""
+    return get_storage().has_document()
+
+def data_version():
+    """Return `(store key, version)` for the current data.
+
+    The version changes whenever the stored data does, including changes
+    made by other processes, and is read without loading the data.
+    """
+    return _store_key(), get_storage().version()
+
+@timed('load')
+def get_document():
+    """Return the current in-memory `Document` (shared, read-only).
+
+    Handlers that combine several reads use it to work from one consistent
+    snapshot, e.g. `document.records('foods')` and `document.index(...)`.
+    """
+    return get_storage().document()
+
+def select_records(collection, start=None, end=None, order=None, **equals):
+    """Return an iterator over records matching equality filters and a `date` window.
+
+    Records are filtered as the iterator is consumed, except when `order`
+    asks for sorting, which needs them all first.
+
+    Args:
+        start, end: Keep records with `start <= date < end` (ISO strings).
+            With either, archived records in the window are included
+            (before the live ones in stored order).
+        order: None for stored order, 'asc' or 'desc' to sort by `date`.
+        **equals: Field filters, e.g. `mealType='lunch'`.
+    """
+    if start is not None or end is not None:
+        records = get_storage().iter_records(collection, 'date', start, end, **equals)
+        archived = _archived_records(collection, start, end, **equals)
+        if archived:
+            records = itertools.chain(archived, records)
+    else:
+        records = get_storage().iter_records(collection, **equals)
+    if order is not None:
+        records = iter(_sorted_by_date(records, reverse=order == 'desc'))
+    return records
+
+def list_page(collection, fields=None, limit=None, after=None, **query):
+    """Return `(records, next_position)` for one page of `select_records` results.
+
+    Args:
+        fields: Field names to keep in each record (all when None).
+        limit: Page size (the whole result when None).
+        after: `(offset, id)` of the last record of the previous page. If
+            records were added or removed since, the page resumes after
+            the record with that id when it can still be found.
+        **query: Passed to `select_records`.
+
+    Returns:
+        The page, and the `(offset, id)` to pass as `after` for the next
+        page, or None when this is the last one. Without a `limit` the page
+        is an iterator producing (and projecting) records as it is consumed
+        and the position is always None; otherwise it is a list.
+    """
+    records = select_records(collection, **query)
+    first = 0
+    if after is not None:
+        records, first = _resume(records, after, limit)
+    if limit is None:
+        page, next_position = records, None
+    else:
+        page = list(itertools.islice(records, limit))
+        more = next(records, None) is not None
+        next_position = None
+        if more and page:
+            next_position = (first + len(page), page[-1].get('id'))
+    if fields is not None:
+        page = ({k: r[k] for k in fields if k in r} for r in page)
+        if limit is not None:
+            page = list(page)
+    return page, next_position
+
+def _resume(records, after, limit):
+    """Return `(records, first)`: records from `list_page`'s `after` position on.
+
+    `first` is the index of the first of them.
+
+    The cursor's record is normally still at `offset - 1`. Otherwise the
+    page starts after the first record with its id, or at `offset` if
+    there is none. Records scanned past are dropped except those that may
+    still be on the page (at most `limit + 1` of them).
+    """
+    offset, last_id = after
+    offset = max(offset, 0)
+    records = iter(records)
+    held, found, count = [], None, 0
+    room = None if limit is None else limit + 1
+    for i, record in enumerate(records):
+        count = i + 1
+        matches = record.get('id') == last_id
+        if i == offset - 1 and matches:
+            return records, offset
+        if found is None and matches:
+            if i >= offset:
+                return records, i + 1
+            found, held = i + 1, []
+        elif (found is not None or i >= offset) and (room is None or len(held) < room):
+            held.append(record)
+        if found is not None and i >= offset - 1:
+            return itertools.chain(held, records), found
+    return iter(held), found if found is not None else min(offset, count)
+
+@timed('load')
+def get_index(index_class):
+    """Return the derived index of type `index_class` for the current document.
+
+    The index is built on first use and updated incrementally by every
+    change made through this module.
+    """
+    return get_storage().index(index_class)
+
+def resident_stores():
+    """Return the storage backends in the store pool, for background jobs."""
+    return _pool.residents()
+
+def get_archive():
+    """Return the archive of old meals, steps and health metrics of the current data."""
+    data_file = _get_data_file()
+    return _archives.get(data_file, lambda: Archive(data_file),
+                         _get_setting('STORE_POOL_SIZE', STORE_POOL_SIZE))
+
+@timed('save')
+def archive_history(days, today=None):
+    """Move meals, steps and health metrics older than `days` days to the archive.
+
+    Records are written to the archive first and then deleted from the live
+    data with one write.
+
+    Args:
+        days: Days of history to keep live (records from `today - days` on stay).
+        today: Reference day (default: today).
+
+    Returns:
+        `{collection: number of records archived}`.
+    """
+    cutoff = ((today or datetime.now().date()) - timedelta(days=days)).isoformat()
+    archive = get_archive()
+    moved = {}
+    deletes = []
+    for collection in ARCHIVED:
+        records = [r for r in query_range(collection, 'date', None, cutoff)
+                   if is_archivable(r) and r.get('id') is not None]
+        archive.add(collection, records)
+        moved[collection] = len(records)
+        deletes += [{"op": "delete", "collection": collection, "id": r['id']}
+                    for r in records]
+    if deletes:
+        apply_changes(deletes)
+    return moved
 
 def generate_id():
     return uuid.uuid4().hex
\ No newline at end of file
@@ -0,0 +1,74 @@
+"""Per-household data files, selected per request.
+
+A request picks its household either with a URL prefix,
+
+    /h/<household>/api/foods
+
+or with the `X-Fridgy-Household` header on a plain `/api/...` URL. Its data
+then lives in `HOUSEHOLDS_DIR/<household>/food_data.json` (plus whatever
+files the storage mode keeps next to it). Requests naming no household use
+`DATA_FILE`, as before. Household ids are 1-64 letters, digits, `-` or `_`.
+
+Backends for the households in use are kept by the store pool in
+`data_service` (see `backend/storage/pool.py`).
+"""
+
+import os
+import re
+
+from flask import has_request_context, jsonify, request
+
+HEADER = 'X-Fridgy-Household'
+
+# WSGI environ key set by `HouseholdMiddleware` for prefixed URLs
+ENVIRON_KEY = 'fridgy.household'
+
+# Default directory holding one subdirectory per household (see backend/app.py)
+HOUSEHOLDS_DIR = os.path.join(os.path.dirname(__file__), 'households')
+
+_VALID_ID = re.compile(r'[A-Za-z0-9_-]{1,64}\Z')
+_PREFIX = re.compile(r'/h/([A-Za-z0-9_-]{1,64})(?=/)')
+
+
+def is_valid_id(household):
+    return isinstance(household, str) and _VALID_ID.match(household) is not None
+
+
+def household_file(directory, household):
+    """Return the data file of `household` under `directory`. Raises ValueError for invalid ids."""
+    if not is_valid_id(household):
+        raise ValueError('Invalid household id: %r' % (household,))
+    return os.path.join(directory, household, 'food_data.json')
+
+
+def current_household():
+    """Return the household of the request being handled, or None (no request, or none named)."""
+    if not has_request_context():
+        return None
+    return request.environ.get(ENVIRON_KEY) or request.headers.get(HEADER) or None
+
+
+class HouseholdMiddleware:
+    """Moves a leading `/h/<household>` from the path into the environ."""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        match = _PREFIX.match(environ.get('PATH_INFO', ''))
+        if match:
+            environ[ENVIRON_KEY] = match.group(1)
+            environ['SCRIPT_NAME'] = environ.get('SCRIPT_NAME', '') + match.group(0)
+            environ['PATH_INFO'] = environ['PATH_INFO'][match.end():]
+        return self.wsgi_app(environ, start_response)
+
+
+def init_app(app):
+    """Install the URL prefix middleware and reject requests naming an invalid household."""
+    app.wsgi_app = HouseholdMiddleware(app.wsgi_app)
+
+    @app.before_request
+    def check_household():
+        household = current_household()
+        if household is not None and not is_valid_id(household):
+            return jsonify({"error": "Invalid household id"}), 400
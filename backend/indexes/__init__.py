@@ -0,0 +1,5 @@
+"""Derived indexes kept in sync with the in-memory data document.
+
+Each module holds one `DerivedIndex` subclass (see backend/storage/document.py).
+Routes get the current instance through `data_service.get_index`.
+"""
@@ -0,0 +1,191 @@
+"""Columnar copies of the step and health metric time series.
+
+Each collection is held as parallel columns: the day (days since
+1970-01-01), the timestamp (seconds since 1970-01-01 00:00, naive), a
+category code and a float value. With NumPy installed, window filters and
+group-bys run as array operations; without it the same queries run as
+plain loops over the columns and return identical results.
+"""
+
+from datetime import datetime
+
+from backend.indexes.timeline import parse_datetime
+from backend.storage.document import DerivedIndex
+
+try:
+    import numpy as np
+except ImportError:  # optional; the pure-Python path is used instead
+    np = None
+
+EPOCH = datetime(1970, 1, 1)
+
+# Collection -> (numeric value field, category field or None)
+SERIES = {
+    'steps': ('steps', None),
+    'healthMetrics': ('value', 'type'),
+}
+
+
+def to_seconds(value):
+    """Return an ISO date or datetime (string or object) as seconds since EPOCH, or None."""
+    value = parse_datetime(value)
+    return None if value is None else (value - EPOCH).total_seconds()
+
+
+def _number(value):
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else 0.0
+
+
+class _Columns:
+    """Parallel column lists for one collection, with cached NumPy arrays."""
+
+    def __init__(self):
+        self.rows = []
+        self.seconds = []
+        self.day = []
+        self.code = []
+        self.value = []
+        self._arrays = None
+
+    def append(self, record, seconds, code, value):
+        self.rows.append(record)
+        self.seconds.append(seconds)
+        self.day.append(int(seconds // 86400))
+        self.code.append(code)
+        self.value.append(value)
+        self._arrays = None
+
+    def arrays(self):
+        if self._arrays is None:
+            self._arrays = {
+                'seconds': np.asarray(self.seconds, dtype=np.float64),
+                'day': np.asarray(self.day, dtype=np.int64),
+                'code': np.asarray(self.code, dtype=np.int64),
+                'value': np.asarray(self.value, dtype=np.float64),
+            }
+        return self._arrays
+
+
+class TimeSeriesColumns(DerivedIndex):
+    """Columnar step and health metric series, queried by time window."""
+
+    collections = tuple(SERIES)
+
+    def __init__(self, document):
+        super().__init__(document)
+        # Category value -> integer code (-1 means no category)
+        self._codes = {}
+        self._columns = {}
+        self._stale = set(SERIES)
+
+    def on_change(self, collection, old, new):
+        if old is None and collection not in self._stale:
+            self._add(collection, new)
+        else:
+            # Updates and deletes rebuild the collection on its next query
+            self._stale.add(collection)
+
+    def _add(self, collection, record):
+        seconds = to_seconds(record.get('date'))
+        if seconds is None:
+            return
+        value_field, category_field = SERIES[collection]
+        code = -1
+        if category_field is not None:
+            category = record.get(category_field)
+            if isinstance(category, str):
+                code = self._codes.setdefault(category, len(self._codes))
+        self._columns[collection].append(record, seconds, code, _number(record.get(value_field, 0)))
+
+    def _get(self, collection):
+        """Return the columns of `collection`, rebuilding them if stale (caller holds the lock)."""
+        if collection in self._stale:
+            self._columns[collection] = _Columns()
+            for record in self.document.records(collection):
+                self._add(collection, record)
+            self._stale.discard(collection)
+        return self._columns[collection]
+
+    def _select(self, columns, since=None, first_day=None, categories=None):
+        """Return the row positions, in stored order, matching every given filter."""
+        codes = None
+        if categories is not None:
+            codes = [self._codes[c] for c in categories if c in self._codes]
+            if not codes:
+                return []
+        if np is not None:
+            arrays = columns.arrays()
+            mask = np.ones(len(columns.rows), dtype=bool)
+            if since is not None:
+                mask &= arrays['seconds'] >= since
+            if first_day is not None:
+                mask &= arrays['day'] >= first_day
+            if codes is not None:
+                mask &= np.isin(arrays['code'], codes)
+            return np.flatnonzero(mask)
+        codes = None if codes is None else set(codes)
+        return [i for i in range(len(columns.rows))
+                if (since is None or columns.seconds[i] >= since)
+                and (first_day is None or columns.day[i] >= first_day)
+                and (codes is None or columns.code[i] in codes)]
+
+    def window(self, collection, since=None, category=None):
+        """Return `(records, value_total)` for records dated at or after datetime `since`.
+
+        Args:
+            collection: 'steps' or 'healthMetrics'.
+            since: Earliest timestamp to include (all records when None).
+            category: Only include records of this type (health metrics).
+        """
+        since_seconds = None if since is None else to_seconds(since)
+        categories = None if category is None else [category]
+        with self.document.lock:
+            columns = self._get(collection)
+            positions = self._select(columns, since=since_seconds, categories=categories)
+            if np is not None:
+                total = float(columns.arrays()['value'][positions].sum())
+            else:
+                total = sum(columns.value[i] for i in positions)
+            records = [columns.rows[i] for i in positions]
+        return records, total
+
+    def latest_per_day(self, collection, first_day, category):
+        """Return `{YYYY-MM-DD: record}` with the latest `category` record of each day from date `first_day` on.
+
+        Ties on the timestamp go to the record stored first.
+        """
+        return self.latest_per_day_by_category(collection, first_day, [category])[category]
+
+    def latest_per_day_by_category(self, collection, first_day, categories):
+        """Return `{category: {YYYY-MM-DD: record}}` for several categories in one pass."""
+        first = (datetime.combine(first_day, datetime.min.time()) - EPOCH).days
+        latest = {}
+        with self.document.lock:
+            columns = self._get(collection)
+            positions = self._select(columns, first_day=first, categories=categories)
+            if np is not None:
+                arrays = columns.arrays()
+                positions = np.asarray(positions, dtype=np.int64)
+                codes = arrays['code'][positions]
+                days = arrays['day'][positions]
+                # Sort by category, day, timestamp, then reverse stored order, so
+                # the last row of each (category, day) group is the one to keep
+                order = np.lexsort((-positions, arrays['seconds'][positions], days, codes))
+                codes, days, positions = codes[order], days[order], positions[order]
+                if len(days):
+                    changes = (codes[1:] != codes[:-1]) | (days[1:] != days[:-1])
+                    for i in np.flatnonzero(np.append(changes, True)):
+                        latest[int(codes[i]), int(days[i])] = columns.rows[positions[i]]
+            else:
+                best = {}
+                for i in positions:
+                    key = (columns.code[i], columns.day[i])
+                    if key not in best or columns.seconds[i] > best[key]:
+                        best[key] = columns.seconds[i]
+                        latest[key] = columns.rows[i]
+            names = {code: name for name, code in self._codes.items()}
+        result = {category: {} for category in categories}
+        for (code, day), record in latest.items():
+            iso_day = datetime.fromordinal(EPOCH.toordinal() + day).date().isoformat()
+            result[names[code]][iso_day] = record
+        return result
@@ -0,0 +1,105 @@
+"""Per-day food consumption counters behind /api/food-addictions/analysis.
+
+For every day with meals the index keeps how many meals included each food.
+Meal writes add to or subtract from the counters of the meal's day, so an
+analysis over the last N days reads at most N day buckets instead of the
+meal history. Sugar, fat and sodium intake come from `NutritionRollup`,
+which keeps the same kind of per-day counters for nutrition.
+
+Foods are keyed by case-folded name (or id, for entries without a name),
+so "Chocolate" and "chocolate" count as one food.
+"""
+
+from collections import Counter
+
+from backend.indexes.rollups import day_key
+from backend.storage.document import DerivedIndex
+
+
+def food_key(item):
+    """Return `(key, display name)` for a meal's food entry, or None."""
+    if isinstance(item, dict):
+        item = item.get('name') or item.get('id') or item.get('foodId')
+    if not isinstance(item, str) or not item.strip():
+        return None
+    name = item.strip()
+    return name.casefold(), name
+
+
+def meal_food_keys(meal):
+    """Return `{food key: display name}` for the foods of one meal (each food once)."""
+    foods = meal.get('foods')
+    keys = {}
+    if isinstance(foods, list):
+        for item in foods:
+            key = food_key(item)
+            if key is not None:
+                keys[key[0]] = key[1]
+    return keys
+
+
+def streaks(days, last_day):
+    """Return `(current, longest)` runs of consecutive days in the sorted `days`.
+
+    The current streak is the run ending on `last_day` (or the day before,
+    so a streak is not broken before today's meals are logged).
+
+    Args:
+        days: Sorted list of `date` objects.
+        last_day: The `date` the analysis ends on.
+    """
+    longest = run = 0
+    previous = None
+    for day in days:
+        run = run + 1 if previous is not None and (day - previous).days == 1 else 1
+        longest = max(longest, run)
+        previous = day
+    current = run if previous is not None and (last_day - previous).days <= 1 else 0
+    return current, longest
+
+
+class ConsumptionIndex(DerivedIndex):
+    """Day -> Counter of food keys, counting the meals each food was part of."""
+
+    collections = ('meals',)
+
+    def __init__(self, document):
+        super().__init__(document)
+        self._days = {}
+        # Food key -> most recently seen spelling, for display
+        self._names = {}
+        for meal in document.records('meals'):
+            self._add(meal, 1)
+
+    def on_change(self, collection, old, new):
+        if old is not None:
+            self._add(old, -1)
+        if new is not None:
+            self._add(new, 1)
+
+    def _add(self, meal, sign):
+        day = day_key(meal)
+        if day is None:
+            return
+        # A food listed twice in one meal still counts as one meal
+        keys = meal_food_keys(meal)
+        if not keys:
+            return
+        counts = self._days.setdefault(day, Counter())
+        for key, name in keys.items():
+            counts[key] += sign
+            if counts[key] <= 0:
+                del counts[key]
+            if sign > 0:
+                self._names[key] = name
+        if not counts:
+            del self._days[day]
+
+    def counts_between(self, days):
+        """Return `{day: {food key: meals}}` copies for the YYYY-MM-DD strings in `days`."""
+        with self.document.lock:
+            return {day: dict(self._days[day]) for day in days if day in self._days}
+
+    def name(self, key):
+        """Return how a food key was last spelled in a meal."""
+        return self._names.get(key, key)
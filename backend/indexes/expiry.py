@@ -0,0 +1,126 @@
+"""Foods sorted by expiry date, behind /api/reminders and the expiring-soon count.
+
+Expiry dates are parsed when a food is added or changed, and foods are kept
+in expiry order, so "expiring within N days" is a read of the front of the
+index and comes back already sorted. Foods without a parseable expiry date
+are left out.
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from backend.indexes.timeline import SortedRecords, parse_datetime
+from backend.storage.document import DerivedIndex
+
+logger = logging.getLogger('fridgy')
+
+# Default /api/reminders window, in days
+REMINDER_DAYS = 7
+
+# Reminder lists (one per window) cached per index
+REMINDER_CACHE_WINDOWS = 8
+
+
+class ExpiryIndex(DerivedIndex):
+    """Foods ordered by parsed `expiryDate`."""
+
+    collections = ('foods',)
+
+    def __init__(self, document):
+        super().__init__(document)
+        self._foods = SortedRecords()
+        # Bumped on every change so cached reminder lists can be checked
+        self._version = 0
+        # days_window -> (day, version, reminders) of the lists built
+        self._reminders = {}
+        for food in document.records('foods'):
+            self._add(food)
+
+    def on_change(self, collection, old, new):
+        seq = None
+        if old is not None:
+            seq = self._foods.remove(old)
+        if new is not None:
+            self._add(new, seq)
+        self._version += 1
+
+    def _add(self, food, seq=None):
+        expiry = parse_datetime(food.get('expiryDate'))
+        if expiry is not None:
+            self._foods.add(food, expiry, seq)
+
+    def expiring_before(self, end):
+        """Return `(expiry datetime, food)` pairs expiring before datetime `end`, soonest first."""
+        with self.document.lock:
+            return self._foods.items(end=end)
+
+    def count_expiring_by(self, moment):
+        """Return how many foods expire at or before datetime `moment`."""
+        with self.document.lock:
+            # The smallest key after every (moment, seq) key
+            return self._foods.bounds(end=moment + timedelta(microseconds=1))[1]
+
+    def reminders(self, today, days_window=REMINDER_DAYS):
+        """Return reminder entries for foods expiring on or before `today + days_window`.
+
+        The list for each window is cached until the foods change or the
+        day rolls over.
+        """
+        with self.document.lock:
+            cached = self._reminders.get(days_window)
+            if cached is not None and cached[:2] == (today, self._version):
+                return cached[2]
+            end = datetime.combine(today + timedelta(days=days_window + 1), datetime.min.time())
+            reminders = []
+            for expiry, food in self.expiring_before(end):
+                days_until = (expiry.date() - today).days
+                reminders.append({
+                    'food': food,
+                    'expiryDate': expiry.date().isoformat(),
+                    'daysUntilExpiry': days_until,
+                    'priority': 'high' if days_until <= 3 else 'medium'
+                })
+            self._reminders.pop(days_window, None)
+            if len(self._reminders) >= REMINDER_CACHE_WINDOWS:
+                # Forget the window built longest ago
+                del self._reminders[next(iter(self._reminders))]
+            self._reminders[days_window] = (today, self._version, reminders)
+            return reminders
+
+
+def sweep_reminders(stores, today, windows=(REMINDER_DAYS,)):
+    """Build the reminder lists of `windows` for `today` in the `ExpiryIndex` of each storage backend."""
+    for storage in stores:
+        try:
+            index = storage.index(ExpiryIndex)
+            for days_window in windows:
+                index.reminders(today, days_window)
+        except Exception:
+            logger.exception('Reminder sweep failed for %s', storage.data_file)
+
+
+def start_sweeper(get_stores, windows=(REMINDER_DAYS,)):
+    """Start a daemon thread that rebuilds the reminder lists just after each midnight.
+
+    Stores that are not resident then build theirs on their first read.
+
+    Args:
+        get_stores: Callable returning the resident storage backends
+            (normally `data_service.resident_stores`).
+        windows: Reminder windows to precompute, in days.
+    """
+    def sweep():
+        while True:
+            now = datetime.now()
+            midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+            time.sleep((midnight - now).total_seconds() + 1)
+            try:
+                sweep_reminders(get_stores(), datetime.now().date(), windows)
+            except Exception:
+                logger.exception('Reminder sweep failed')
+
+    thread = threading.Thread(target=sweep, name='fridgy-reminder-sweeper', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,125 @@
+"""Lookup of stored foods by id and by case-folded name, for meal nutrition.
+
+A meal lists its foods by id (`{"id": ...}` or `{"foodId": ...}`) or by
+name (a plain string or `{"name": ...}`). Names match case-insensitively
+and, as with the scan this replaces, the first stored food with a name wins.
+Each food's nutrition is turned into a vector over `NUTRITION_FIELDS` the
+first time it is needed and kept until the food changes.
+"""
+
+from backend.indexes.rollups import NUTRITION_FIELDS
+from backend.storage.document import DerivedIndex
+
+
+def _fold(name):
+    return name.casefold() if isinstance(name, str) else None
+
+
+def _vector(nutrition):
+    if not isinstance(nutrition, dict):
+        return None
+    return tuple(nutrition.get(field, 0) for field in NUTRITION_FIELDS)
+
+
+class FoodLookup(DerivedIndex):
+    """Foods by id and by folded name, plus memoized nutrition vectors."""
+
+    collections = ('foods',)
+
+    def __init__(self, document):
+        super().__init__(document)
+        self._by_id = {}
+        # Folded name -> {food id: food}; several foods may share a name
+        self._by_name = {}
+        # Food id -> position, so the first stored food wins a shared name
+        self._order = {}
+        self._next_order = 0
+        # Food id -> nutrition vector, filled on first use
+        self._vectors = {}
+
+        for food in document.records('foods'):
+            self._add(food)
+
+    def on_change(self, collection, old, new):
+        if old is not None:
+            self._remove(old, keep_order=new is not None)
+        if new is not None:
+            self._add(new)
+
+    def _add(self, food):
+        food_id = food.get('id')
+        if food_id is None:
+            return
+        self._by_id[food_id] = food
+        if food_id not in self._order:
+            self._order[food_id] = self._next_order
+            self._next_order += 1
+        name = _fold(food.get('name'))
+        if name is not None:
+            self._by_name.setdefault(name, {})[food_id] = food
+
+    def _remove(self, food, keep_order=False):
+        food_id = food.get('id')
+        self._by_id.pop(food_id, None)
+        self._vectors.pop(food_id, None)
+        if not keep_order:
+            self._order.pop(food_id, None)
+        name = _fold(food.get('name'))
+        foods = self._by_name.get(name)
+        if foods is not None:
+            foods.pop(food_id, None)
+            if not foods:
+                del self._by_name[name]
+
+    def by_id(self, food_id):
+        """Return the stored food with `food_id`, or None."""
+        return self._by_id.get(food_id)
+
+    def by_name(self, name):
+        """Return the first stored food named `name` (ignoring case), or None."""
+        foods = self._by_name.get(_fold(name))
+        if not foods:
+            return None
+        if len(foods) == 1:
+            return next(iter(foods.values()))
+        return foods[min(foods, key=self._order.__getitem__)]
+
+    def resolve(self, item):
+        """Return the stored food a meal's food entry refers to, or None."""
+        if isinstance(item, str):
+            return self.by_name(item)
+        if not isinstance(item, dict):
+            return None
+        food_id = item.get('id') or item.get('foodId')
+        if food_id:
+            return self.by_id(food_id)
+        if item.get('name'):
+            return self.by_name(item['name'])
+        return None
+
+    def nutrition_vector(self, food):
+        """Return the nutrition of a stored food as a tuple over `NUTRITION_FIELDS`, or None."""
+        food_id = food.get('id')
+        vector = self._vectors.get(food_id)
+        if vector is None:
+            vector = _vector(food.get('nutrition'))
+            if vector is not None and food_id is not None:
+                self._vectors[food_id] = vector
+        return vector
+
+    def meal_nutrition(self, items):
+        """Return the total nutrition of a meal's food entries, each scaled by its quantity.
+
+        Entries that do not match a stored food with nutrition count as zero.
+        """
+        totals = [0] * len(NUTRITION_FIELDS)
+        with self.document.lock:
+            for item in items:
+                food = self.resolve(item)
+                vector = food and self.nutrition_vector(food)
+                if not vector:
+                    continue
+                quantity = item.get('quantity', 1) if isinstance(item, dict) else 1
+                for i, value in enumerate(vector):
+                    totals[i] += value * quantity
+        return dict(zip(NUTRITION_FIELDS, totals))
@@ -0,0 +1,186 @@
+"""Inverted ingredient index behind /api/recommendations.
+
+Food names and recipe ingredients are normalized to sets of stemmed word
+tokens ("2 ripe Tomatoes" -> {"ripe", "tomato"}). An ingredient counts as
+available when some food's tokens are a subset of the ingredient's tokens
+("oil" covers "olive oil") or the other way round ("pasta" is covered by
+"whole wheat pasta"), mirroring the substring match this replaces.
+
+Recipes are only scored if one of their ingredient tokens belongs to a food
+in storage, so recipes that share nothing with the pantry are never looked at.
+"""
+
+import heapq
+import re
+from collections import Counter, defaultdict
+from itertools import combinations
+
+from backend.storage.document import DerivedIndex
+
+# Words that describe amounts or preparation rather than the ingredient
+STOP_WORDS = {
+    'a', 'an', 'and', 'of', 'or', 'the', 'to', 'for', 'with', 'taste',
+    'cup', 'cups', 'tbsp', 'tsp', 'tablespoon', 'tablespoons', 'teaspoon', 'teaspoons',
+    'g', 'kg', 'mg', 'ml', 'l', 'oz', 'lb', 'lbs', 'pinch', 'dash', 'handful', 'piece', 'pieces',
+    'clove', 'cloves', 'slice', 'slices', 'can', 'cans', 'pack', 'package',
+    'chopped', 'diced', 'sliced', 'minced', 'grated', 'fresh', 'large', 'small', 'medium',
+}
+
+# Ingredients with more tokens than this only match foods on their first tokens
+MAX_SUBSET_TOKENS = 6
+
+_WORD = re.compile(r'[a-z]+')
+
+
+def _stem(word):
+    """Strip common English plural endings so 'tomatoes' and 'tomato' match."""
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 4 and word.endswith(('oes', 'ses', 'xes', 'ches', 'shes')):
+        return word[:-2]
+    if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    """Return the normalized token set of a food name or ingredient line."""
+    if isinstance(text, dict):
+        text = text.get('name', '')
+    if not isinstance(text, str):
+        return frozenset()
+    return frozenset(_stem(w) for w in _WORD.findall(text.lower()) if w not in STOP_WORDS)
+
+
+class IngredientIndex(DerivedIndex):
+    """Token postings for recipe ingredients plus the token sets of stored foods."""
+
+    collections = ('foods', 'recipes')
+
+    def __init__(self, document):
+        super().__init__(document)
+        # Food token set -> number of foods with exactly that set
+        self._food_sets = Counter()
+        # Token -> Counter of food token sets containing it
+        self._food_sets_by_token = defaultdict(Counter)
+        # Recipe id -> tuple of ingredient token sets
+        self._recipes = {}
+        # Recipe id -> position, used to break score ties in stored order
+        self._order = {}
+        self._next_order = 0
+        # Token -> set of recipe ids with an ingredient containing it
+        self._recipes_by_token = defaultdict(set)
+
+        for food in document.records('foods'):
+            self._add_food(food)
+        for recipe in document.records('recipes'):
+            self._add_recipe(recipe)
+
+    def on_change(self, collection, old, new):
+        if collection == 'foods':
+            if old is not None:
+                self._remove_food(old)
+            if new is not None:
+                self._add_food(new)
+        else:
+            if old is not None:
+                self._remove_recipe(old, keep_order=new is not None)
+            if new is not None:
+                self._add_recipe(new)
+
+    def _add_food(self, food):
+        tokens = tokenize(food.get('name'))
+        if not tokens:
+            return
+        self._food_sets[tokens] += 1
+        for token in tokens:
+            self._food_sets_by_token[token][tokens] += 1
+
+    def _remove_food(self, food):
+        tokens = tokenize(food.get('name'))
+        if not tokens or not self._food_sets[tokens]:
+            return
+        self._food_sets[tokens] -= 1
+        if not self._food_sets[tokens]:
+            del self._food_sets[tokens]
+        for token in tokens:
+            sets = self._food_sets_by_token[token]
+            sets[tokens] -= 1
+            if not sets[tokens]:
+                del sets[tokens]
+            if not sets:
+                del self._food_sets_by_token[token]
+
+    def _add_recipe(self, recipe):
+        recipe_id = recipe.get('id')
+        if recipe_id is None or 'ingredients' not in recipe:
+            return
+        ingredients = tuple(tokenize(ing) for ing in recipe.get('ingredients') or [])
+        self._recipes[recipe_id] = ingredients
+        if recipe_id not in self._order:
+            self._order[recipe_id] = self._next_order
+            self._next_order += 1
+        for tokens in ingredients:
+            for token in tokens:
+                self._recipes_by_token[token].add(recipe_id)
+
+    def _remove_recipe(self, recipe, keep_order=False):
+        recipe_id = recipe.get('id')
+        ingredients = self._recipes.pop(recipe_id, ())
+        if not keep_order:
+            self._order.pop(recipe_id, None)
+        for tokens in ingredients:
+            for token in tokens:
+                ids = self._recipes_by_token.get(token)
+                if ids is not None:
+                    ids.discard(recipe_id)
+                    if not ids:
+                        del self._recipes_by_token[token]
+
+    def is_available(self, tokens):
+        """Return True if some stored food covers the ingredient `tokens` (or vice versa)."""
+        if not tokens:
+            return False
+        # A food whose tokens are all in the ingredient ("oil" for "olive oil")
+        subset_source = sorted(tokens)[:MAX_SUBSET_TOKENS]
+        for size in range(1, len(subset_source) + 1):
+            for subset in combinations(subset_source, size):
+                if frozenset(subset) in self._food_sets:
+                    return True
+        # A food whose name contains every ingredient token ("whole wheat pasta" for "pasta")
+        rarest = min(tokens, key=lambda t: len(self._food_sets_by_token.get(t, ())))
+        return any(tokens <= food_tokens for food_tokens in self._food_sets_by_token.get(rarest, ()))
+
+    def recommend(self, limit=None, min_score=None):
+        """Return `(recipe_id, score)` pairs, best first, for recipes with at least one match.
+
+        Args:
+            limit: Return at most this many recipes (all when None).
+            min_score: Skip recipes scoring below this fraction of available ingredients.
+        """
+        with self.document.lock:
+            candidates = set()
+            for token in self._food_sets_by_token:
+                candidates.update(self._recipes_by_token.get(token, ()))
+
+            availability = {}
+            scored = []
+            for recipe_id in candidates:
+                ingredients = self._recipes[recipe_id]
+                matches = 0
+                for tokens in ingredients:
+                    if tokens not in availability:
+                        availability[tokens] = self.is_available(tokens)
+                    matches += availability[tokens]
+                if not matches:
+                    continue
+                score = matches / len(ingredients)
+                if min_score is not None and score < min_score:
+                    continue
+                scored.append((score, self._order[recipe_id], recipe_id))
+
+        if limit is None:
+            scored.sort(key=lambda item: (-item[0], item[1]))
+        else:
+            scored = heapq.nsmallest(limit, scored, key=lambda item: (-item[0], item[1]))
+        return [(recipe_id, score) for score, _, recipe_id in scored]
@@ -0,0 +1,145 @@
+"""Per-day nutrition rollups behind the nutrition and stats endpoints.
+
+For every day with meals the rollup keeps the meal count and the nutrition
+totals, overall and per meal type. Meal inserts, updates and deletes adjust
+the affected day in place, so trend and stats queries cost O(days in the
+window) instead of O(every meal ever logged).
+"""
+
+from bisect import bisect_left, insort
+
+from backend.storage.document import DerivedIndex
+
+NUTRITION_FIELDS = ('calories', 'protein', 'carbs', 'fats', 'saturatedFats',
+                    'sodium', 'cholesterol', 'fiber', 'sugar')
+
+
+def _number(value):
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else 0
+
+
+def empty_summary():
+    """Return a summary with no meals: `{"count", "totals", "byMealType"}`."""
+    return {"count": 0, "totals": dict.fromkeys(NUTRITION_FIELDS, 0), "byMealType": {}}
+
+
+def add_meal(summary, meal, sign=1):
+    """Add (`sign=1`) or subtract (`sign=-1`) one meal to a summary."""
+    nutrition = meal.get('nutrition') or {}
+    meal_type = meal.get('mealType')
+    if not isinstance(meal_type, str):
+        meal_type = None
+    by_type = summary['byMealType'].get(meal_type)
+    if by_type is None:
+        by_type = summary['byMealType'][meal_type] = {
+            "count": 0, "totals": dict.fromkeys(NUTRITION_FIELDS, 0)}
+    summary['count'] += sign
+    by_type['count'] += sign
+    for key in NUTRITION_FIELDS:
+        value = _number(nutrition.get(key, 0)) * sign
+        summary['totals'][key] += value
+        by_type['totals'][key] += value
+
+
+def merge_summary(target, other):
+    """Add the counts and totals of summary `other` into `target`."""
+    target['count'] += other['count']
+    for key in NUTRITION_FIELDS:
+        target['totals'][key] += other['totals'][key]
+    for meal_type, part in other['byMealType'].items():
+        by_type = target['byMealType'].get(meal_type)
+        if by_type is None:
+            by_type = target['byMealType'][meal_type] = {
+                "count": 0, "totals": dict.fromkeys(NUTRITION_FIELDS, 0)}
+        by_type['count'] += part['count']
+        for key in NUTRITION_FIELDS:
+            by_type['totals'][key] += part['totals'][key]
+
+
+def summarize_meals(meals):
+    """Return the summary of a list of raw meals."""
+    summary = empty_summary()
+    for meal in meals:
+        add_meal(summary, meal)
+    return summary
+
+
+def day_key(meal):
+    """Return the YYYY-MM-DD day a meal belongs to, or None if it has no date."""
+    date = meal.get('date')
+    return date[:10] if isinstance(date, str) and date else None
+
+
+class NutritionRollup(DerivedIndex):
+    """Day -> nutrition summary, plus the days in sorted order for range reads."""
+
+    collections = ('meals',)
+
+    def __init__(self, document):
+        super().__init__(document)
+        self.rebuild()
+
+    def rebuild(self):
+        """Recompute every day from the raw meals.
+
+        Updates are applied as additions and subtractions, so floating point
+        totals can drift slightly over time; rebuilding resets them.
+        """
+        with self.document.lock:
+            days = {}
+            for meal in self.document.records('meals'):
+                key = day_key(meal)
+                if key is not None:
+                    add_meal(days.setdefault(key, empty_summary()), meal)
+            self._days = days
+            self._sorted_days = sorted(days)
+        return len(days)
+
+    def on_change(self, collection, old, new):
+        if old is not None:
+            self._add(old, -1)
+        if new is not None:
+            self._add(new, 1)
+
+    def _add(self, meal, sign):
+        key = day_key(meal)
+        if key is None:
+            return
+        summary = self._days.get(key)
+        if summary is None:
+            summary = self._days[key] = empty_summary()
+            insort(self._sorted_days, key)
+        add_meal(summary, meal, sign)
+        if summary['count'] <= 0:
+            del self._days[key]
+            del self._sorted_days[bisect_left(self._sorted_days, key)]
+
+    def day(self, key):
+        """Return a copy of the summary for one YYYY-MM-DD day."""
+        summary = empty_summary()
+        with self.document.lock:
+            if key in self._days:
+                merge_summary(summary, self._days[key])
+        return summary
+
+    def days_between(self, start=None, end=None):
+        """Return `{day: summary copy}` for days with `start <= day < end`.
+
+        Bounds are compared as strings, so prefixes work too: `start='2024-05'`,
+        `end='2024-06'` selects May 2024.
+        """
+        result = {}
+        with self.document.lock:
+            lo = 0 if start is None else bisect_left(self._sorted_days, start)
+            hi = len(self._sorted_days) if end is None else bisect_left(self._sorted_days, end)
+            for key in self._sorted_days[lo:hi]:
+                summary = result[key] = empty_summary()
+                merge_summary(summary, self._days[key])
+        return result
+
+    def summarize(self, start=None, end=None):
+        """Return one summary combining every day with `start <= day < end`."""
+        summary = empty_summary()
+        for part in self.days_between(start, end).values():
+            merge_summary(summary, part)
+        return summary
@@ -0,0 +1,142 @@
+"""Time-sorted views of the meal, step and health metric collections.
+
+Each record's `date` is parsed once, when the record is indexed, and the
+records are kept sorted by that timestamp. Window reads bisect the sorted
+keys, so they cost O(log n + records in the window) however much history
+has been logged.
+"""
+
+from bisect import bisect_left
+from datetime import date, datetime, time, timedelta
+
+from backend.storage.document import DerivedIndex
+
+
+def parse_datetime(value):
+    """Return an ISO date/datetime string, `date` or `datetime` as a naive datetime, or None."""
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    if isinstance(value, date):
+        return datetime.combine(value, time())
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value).replace(tzinfo=None)
+        except ValueError:
+            return None
+    return None
+
+
+def prefix_window(prefix):
+    """Return the `[start, end)` datetimes covered by 'YYYY', 'YYYY-MM' or 'YYYY-MM-DD', or None."""
+    try:
+        if len(prefix) == 10:
+            start = datetime.fromisoformat(prefix)
+            return start, start + timedelta(days=1)
+        if len(prefix) == 7:
+            start = datetime.strptime(prefix, '%Y-%m')
+            return start, (start + timedelta(days=31)).replace(day=1)
+        if len(prefix) == 4:
+            start = datetime.strptime(prefix, '%Y')
+            return start, start.replace(year=start.year + 1)
+    except (TypeError, ValueError, OverflowError):
+        pass
+    return None
+
+
+class SortedRecords:
+    """Records kept sorted by a timestamp, with O(log n) range reads.
+
+    Keys are `(timestamp, sequence)` pairs; the sequence keeps records with
+    equal timestamps in the order they were added.
+    """
+
+    def __init__(self):
+        self._keys = []
+        self._records = []
+        # id(record) -> key for records currently held
+        self._key_of = {}
+        self._next_seq = 0
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, record, stamp, seq=None):
+        if seq is None:
+            seq = self._next_seq
+            self._next_seq += 1
+        key = (stamp, seq)
+        if not self._keys or self._keys[-1] < key:
+            # New entries are usually the latest ones
+            self._keys.append(key)
+            self._records.append(record)
+        else:
+            pos = bisect_left(self._keys, key)
+            self._keys.insert(pos, key)
+            self._records.insert(pos, record)
+        self._key_of[id(record)] = key
+
+    def remove(self, record):
+        """Remove `record` and return its sequence number (None if it was not held)."""
+        key = self._key_of.pop(id(record), None)
+        if key is None:
+            return None
+        pos = bisect_left(self._keys, key)
+        del self._keys[pos]
+        del self._records[pos]
+        return key[1]
+
+    def bounds(self, start=None, end=None):
+        """Return the `(lo, hi)` positions of timestamps `start <= t < end`."""
+        lo = 0 if start is None else bisect_left(self._keys, (start,))
+        hi = len(self._keys) if end is None else bisect_left(self._keys, (end,))
+        return lo, hi
+
+    def between(self, start=None, end=None):
+        lo, hi = self.bounds(start, end)
+        return self._records[lo:hi]
+
+    def items(self, start=None, end=None):
+        """Return `(timestamp, record)` pairs for timestamps `start <= t < end`."""
+        lo, hi = self.bounds(start, end)
+        return [(key[0], record) for key, record in zip(self._keys[lo:hi], self._records[lo:hi])]
+
+
+class Timeline(DerivedIndex):
+    """Records of each time-series collection sorted by their parsed `date`."""
+
+    collections = ('meals', 'steps', 'healthMetrics')
+
+    def __init__(self, document):
+        super().__init__(document)
+        self._sorted = {}
+        for name in self.collections:
+            self._sorted[name] = SortedRecords()
+            for record in document.records(name):
+                self._add(name, record)
+
+    def on_change(self, collection, old, new):
+        seq = None
+        if old is not None:
+            seq = self._sorted[collection].remove(old)
+        if new is not None:
+            # An update keeps the record's place among equal timestamps
+            self._add(collection, new, seq)
+
+    def _add(self, collection, record, seq=None):
+        stamp = parse_datetime(record.get('date'))
+        if stamp is not None:
+            self._sorted[collection].add(record, stamp, seq)
+
+    def window(self, collection, start=None, end=None):
+        """Return the records dated `start <= date < end`, oldest first.
+
+        Bounds may be datetimes, dates or ISO strings; None leaves that side open.
+        """
+        start, end = parse_datetime(start), parse_datetime(end)
+        with self.document.lock:
+            return self._sorted[collection].between(start, end)
+
+    def in_period(self, collection, prefix):
+        """Return the records of the day, month or year `prefix`, or None if it names none."""
+        bounds = prefix_window(prefix)
+        return None if bounds is None else self.window(collection, *bounds)
@@ -0,0 +1,96 @@
+"""Query parameters shared by the collection GET endpoints.
+
+`GET /api/foods`, `/api/meals`, `/api/recipes` and `/api/health-metrics`
+accept:
+
+- `from`, `to`: first and last day (or other ISO prefix) of `date`, inclusive
+- field filters such as `mealType=lunch` (which ones depends on the endpoint)
+- `order`: `asc` or `desc` to sort by `date` instead of stored order
+- `fields`: comma-separated fields to return, e.g. `fields=id,name`
+- `limit`, `cursor`: cursor pagination; with either of them the response is
+  `{"items": [...], "nextCursor": "..." | null}` instead of a plain list
+
+Unpaged lists are streamed (see `backend/streaming.py`) when the client
+asks for NDJSON (`Accept: application/x-ndjson`), passes `stream=1`, or the
+result has more than `STREAM_MIN_RECORDS` records. Streamed records are
+filtered and projected as they are sent, not collected first.
+
+Filtering runs in the data layer, so the SQLite backend answers it in SQL.
+"""
+
+import base64
+import itertools
+import json
+
+from flask import jsonify, request
+
+from backend.data_service import list_page
+from backend.storage.base import PREFIX_END
+from backend.streaming import stream_records, wants_ndjson
+
+# Largest page a client may ask for
+MAX_PAGE_SIZE = 1000
+
+# Unpaged results larger than this are streamed instead of built in memory
+STREAM_MIN_RECORDS = 1000
+
+
+def _encode_cursor(position):
+    raw = json.dumps({"o": position[0], "id": position[1]}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def _decode_cursor(cursor):
+    """Return the `(offset, id)` in `cursor`, or raise ValueError."""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        offset = data['o']
+    except Exception:
+        raise ValueError('invalid cursor')
+    if not isinstance(offset, int):
+        raise ValueError('invalid cursor')
+    return offset, data.get('id')
+
+
+def list_response(collection, filters=()):
+    """Return the response for a collection GET, applying the query parameters.
+
+    Args:
+        collection: Collection to list.
+        filters: Names of the equality filters this endpoint accepts.
+    """
+    args = request.args
+    query = {name: args[name] for name in filters if name in args}
+    if 'from' in args:
+        query['start'] = args['from']
+    if 'to' in args:
+        query['end'] = args['to'] + PREFIX_END
+
+    order = args.get('order')
+    if order not in (None, 'asc', 'desc'):
+        return jsonify({"error": "order must be 'asc' or 'desc'"}), 400
+    fields = [f for f in args['fields'].split(',') if f] if 'fields' in args else None
+
+    paged = 'limit' in args or 'cursor' in args
+    try:
+        limit = int(args['limit']) if 'limit' in args else None
+        after = _decode_cursor(args['cursor']) if 'cursor' in args else None
+    except ValueError:
+        return jsonify({"error": "limit must be a number and cursor must come from nextCursor"}), 400
+    if paged:
+        limit = MAX_PAGE_SIZE if limit is None else limit
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            return jsonify({"error": "limit must be between 1 and %d" % MAX_PAGE_SIZE}), 400
+
+    items, next_position = list_page(collection, fields=fields, limit=limit, after=after,
+                                     order=order, **query)
+    if not paged:
+        # Look ahead just far enough to tell whether the result is large
+        head = list(itertools.islice(items, STREAM_MIN_RECORDS + 1))
+        if wants_ndjson() or args.get('stream') == '1' or len(head) > STREAM_MIN_RECORDS:
+            return stream_records(itertools.chain(head, items))
+        return jsonify(head)
+    return jsonify({
+        "items": items,
+        "nextCursor": None if next_position is None else _encode_cursor(next_position)
+    })
@@ -0,0 +1,295 @@
+"""Request metrics in Prometheus text format, plus an opt-in sampling profiler.
+
+`init_app` installs `before_request`/`after_request` hooks that record, per
+endpoint (the URL rule, e.g. `/api/foods/<food_id>`):
+
+- request counts by method and status, and a latency histogram
+- how that latency splits into phases: `load` (reading data through
+  `data_service`), `save` (writing through it), `encode` (JSON
+  serialization) and `handler` (everything else)
+- request and response body bytes
+
+Storage backends add the bytes they read from and write to disk, and the
+data service adds the store pool's residency and hit counts. Everything is
+served by `GET /api/metrics` (see `render`).
+
+With `PROFILE_EVERY` set to N (`FRIDGY_PROFILE_EVERY`), every Nth request
+runs under cProfile and its stats are dumped to `PROFILE_DIR` as
+`<time>-<endpoint>.prof`, readable with `python -m pstats`.
+"""
+
+import cProfile
+import functools
+import itertools
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from flask import g, request
+from flask.json.provider import DefaultJSONProvider
+
+logger = logging.getLogger('fridgy')
+
+# Upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PHASES = ('load', 'save', 'encode', 'handler')
+
+# Default profiling settings (see backend/app.py)
+PROFILE_EVERY = 0
+PROFILE_DIR = os.path.join(os.path.dirname(__file__), 'profiles')
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observed values."""
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += value
+        self.count += 1
+
+
+class Registry:
+    """Counters and histograms keyed by label tuples, shared by all threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.requests = {}      # (endpoint, method, status) -> count
+        self.latency = {}       # endpoint -> Histogram
+        self.phases = {}        # (endpoint, phase) -> Histogram
+        self.body_bytes = {}    # (endpoint, direction) -> bytes
+        self.storage_bytes = {'read': 0, 'written': 0}
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    def record_request(self, endpoint, method, status, seconds, phases, bytes_in, bytes_out):
+        with self._lock:
+            key = (endpoint, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.latency.setdefault(endpoint, Histogram()).observe(seconds)
+            for phase, value in phases.items():
+                self.phases.setdefault((endpoint, phase), Histogram()).observe(value)
+            for direction, size in (('in', bytes_in), ('out', bytes_out)):
+                if size:
+                    key = (endpoint, direction)
+                    self.body_bytes[key] = self.body_bytes.get(key, 0) + size
+
+    def add_storage_bytes(self, direction, size):
+        with self._lock:
+            self.storage_bytes[direction] += size
+
+
+registry = Registry()
+
+# Callables returning `(name, type, help, value)` samples added to `render`
+_gauges = []
+
+# Phase totals of the request being handled by this thread
+_local = threading.local()
+
+
+def add_gauges(collect):
+    """Have `render` include the samples returned by `collect()` (e.g. store pool stats)."""
+    _gauges.append(collect)
+
+
+def count_storage_bytes(direction, size):
+    """Add `size` bytes read from (`'read'`) or written to (`'written'`) disk by storage."""
+    registry.add_storage_bytes(direction, size)
+
+
+@contextmanager
+def phase(name):
+    """Attribute the time spent in the block to phase `name` of the current request.
+
+    Nested phases are part of the outermost one (a save that re-reads the
+    file is all `save`). Outside a request this only runs the block.
+    """
+    phases = getattr(_local, 'phases', None)
+    if phases is None or _local.active is not None:
+        yield
+        return
+    _local.active = name
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases[name] = phases.get(name, 0.0) + time.perf_counter() - started
+        _local.active = None
+
+
+def timed(name):
+    """Decorator form of `phase`."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider with serialization counted as the `encode` phase."""
+
+    def dumps(self, obj, **kwargs):
+        with phase('encode'):
+            return super().dumps(obj, **kwargs)
+
+
+class _Sampler:
+    """Picks every Nth request for profiling; one profile runs at a time."""
+
+    def __init__(self):
+        self._counter = itertools.count(1)
+        self._busy = threading.Lock()
+
+    def start(self, every):
+        if not every or next(self._counter) % every or not self._busy.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler (e.g. a debugger) is already active
+            self._busy.release()
+            return None
+        return profiler
+
+    def finish(self, profiler, endpoint, directory):
+        profiler.disable()
+        try:
+            os.makedirs(directory, exist_ok=True)
+            name = '%s-%s.prof' % (datetime.now().strftime('%Y%m%d-%H%M%S-%f'),
+                                   re.sub(r'[^A-Za-z0-9]+', '_', endpoint).strip('_') or 'root')
+            profiler.dump_stats(os.path.join(directory, name))
+        except OSError as e:
+            logger.error('Could not write profile to %s: %s', directory, e)
+        finally:
+            self._busy.release()
+
+
+_sampler = _Sampler()
+
+
+def _endpoint():
+    # The rule, not the path, so ids do not create a series per record
+    return request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+
+
+def init_app(app, get_setting):
+    """Install the request hooks and JSON provider on `app`.
+
+    Args:
+        app: The Flask app.
+        get_setting: `get_setting(name, default)` for PROFILE_EVERY and
+            PROFILE_DIR, read on each request so they can be changed at run time.
+    """
+    app.json_provider_class = TimedJSONProvider
+    app.json = TimedJSONProvider(app)
+
+    @app.before_request
+    def start_request_metrics():
+        g.metrics_started = time.perf_counter()
+        _local.phases = {}
+        _local.active = None
+        g.metrics_profiler = _sampler.start(get_setting('PROFILE_EVERY', PROFILE_EVERY))
+
+    @app.after_request
+    def record_request_metrics(response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        measured = _local.phases
+        _local.phases = None
+        phases = {name: measured.get(name, 0.0) for name in PHASES}
+        phases['handler'] = max(elapsed - sum(measured.values()), 0.0)
+        endpoint = _endpoint()
+
+        # Streamed bodies are sent later and their size is not known here
+        bytes_out = 0 if response.is_streamed else response.calculate_content_length() or 0
+        registry.record_request(endpoint, request.method, response.status_code, elapsed,
+                                phases, request.content_length or 0, bytes_out)
+        return response
+
+    @app.teardown_request
+    def finish_request_profile(exc):
+        # Runs even when after_request hooks are skipped (an error
+        # propagated, or another hook raised), so the sampler is always freed
+        _local.phases = None
+        profiler = g.pop('metrics_profiler', None)
+        if profiler is not None:
+            _sampler.finish(profiler, _endpoint(), get_setting('PROFILE_DIR', PROFILE_DIR))
+
+
+def _labels(**labels):
+    return '{%s}' % ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                             for k, v in labels.items())
+
+
+def _histogram_lines(name, histogram, **labels):
+    lines = []
+    for bound, count in zip(BUCKETS, histogram.counts):
+        lines.append('%s_bucket%s %d' % (name, _labels(**labels, le=repr(bound)), count))
+    lines.append('%s_bucket%s %d' % (name, _labels(**labels, le='+Inf'), histogram.count))
+    lines.append('%s_sum%s %.6f' % (name, _labels(**labels), histogram.total))
+    lines.append('%s_count%s %d' % (name, _labels(**labels), histogram.count))
+    return lines
+
+
+def render():
+    """Return every metric in the Prometheus text exposition format."""
+    with registry._lock:
+        lines = [
+            '# HELP fridgy_requests_total Requests handled, by endpoint, method and status.',
+            '# TYPE fridgy_requests_total counter',
+        ]
+        for (endpoint, method, status), count in sorted(registry.requests.items()):
+            lines.append('fridgy_requests_total%s %d' % (
+                _labels(endpoint=endpoint, method=method, status=status), count))
+
+        lines += ['# HELP fridgy_request_duration_seconds Request latency, by endpoint.',
+                  '# TYPE fridgy_request_duration_seconds histogram']
+        for endpoint, histogram in sorted(registry.latency.items()):
+            lines += _histogram_lines('fridgy_request_duration_seconds', histogram, endpoint=endpoint)
+
+        lines += ['# HELP fridgy_request_phase_seconds Time per request spent in each phase '
+                  '(load, save, encode, handler), by endpoint.',
+                  '# TYPE fridgy_request_phase_seconds histogram']
+        for (endpoint, name), histogram in sorted(registry.phases.items()):
+            lines += _histogram_lines('fridgy_request_phase_seconds', histogram,
+                                      endpoint=endpoint, phase=name)
+
+        lines += ['# HELP fridgy_http_body_bytes_total Request (in) and response (out) body bytes.',
+                  '# TYPE fridgy_http_body_bytes_total counter']
+        for (endpoint, direction), size in sorted(registry.body_bytes.items()):
+            lines.append('fridgy_http_body_bytes_total%s %d' % (
+                _labels(endpoint=endpoint, direction=direction), size))
+
+        lines += ['# HELP fridgy_storage_bytes_total Bytes read from and written to data files.',
+                  '# TYPE fridgy_storage_bytes_total counter']
+        for direction, size in sorted(registry.storage_bytes.items()):
+            lines.append('fridgy_storage_bytes_total%s %d' % (_labels(direction=direction), size))
+
+    for collect in _gauges:
+        for name, kind, help_text, value in collect():
+            lines += ['# HELP %s %s' % (name, help_text), '# TYPE %s %s' % (name, kind),
+                      '%s %s' % (name, value)]
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,121 @@
+"""Conditional GETs and a cache of serialized responses, keyed on the data version.
+
+Views wrapped with `conditional` answer `If-None-Match` with 304 after one
+cheap version check (a file stat, or one SQLite query), before any data is
+loaded. Otherwise the serialized body is served from a bounded LRU keyed by
+(path, query args, Accept header, data version), so repeated GETs of unchanged data are
+neither recomputed nor re-serialized.
+"""
+
+import functools
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from flask import Response, current_app, request
+
+from backend import data_service
+
+# Default number of serialized bodies kept (0 disables body caching)
+RESPONSE_CACHE_ENTRIES = 256
+
+
+class ResponseCache:
+    """Thread-safe LRU of `(body bytes, mimetype)` pairs."""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry, max_entries):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = ResponseCache()
+
+# Store key -> (version, time this process first saw it), for Last-Modified
+_first_seen = {}
+_first_seen_lock = threading.Lock()
+
+
+def _last_modified(store, version):
+    with _first_seen_lock:
+        seen = _first_seen.get(store)
+        if seen is None or seen[0] != version:
+            seen = _first_seen[store] = (version, time.time())
+        return seen[1]
+
+
+def conditional(clock=None):
+    """Make a GET view answer conditional requests and reuse serialized bodies.
+
+    Args:
+        clock: strftime format for the part of the current time the view's
+            output depends on (e.g. '%Y-%m-%d' for views that use "today"),
+            or None for views that only depend on the data.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET':
+                return view(*args, **kwargs)
+
+            # Read the version before running the view, so a body is never
+            # stored under a version newer than the data it was built from
+            store, version = data_service.data_version()
+            # Accept is part of the key: it picks JSON or NDJSON output
+            key = (request.path, tuple(sorted(request.args.items(multi=True))),
+                   request.headers.get('Accept'), store, version,
+                   datetime.now().strftime(clock) if clock else None)
+            etag = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+            last_modified = _last_modified(store, version)
+
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+            else:
+                entry = _cache.get(key)
+                if entry is None:
+                    response = current_app.make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    if response.is_streamed:
+                        # Buffering would defeat streaming; only validators apply
+                        return _with_validators(response, etag, last_modified)
+                    entry = (response.get_data(), response.mimetype)
+                    max_entries = data_service._get_setting('RESPONSE_CACHE_ENTRIES', RESPONSE_CACHE_ENTRIES)
+                    if max_entries > 0:
+                        _cache.put(key, entry, max_entries)
+                response = Response(entry[0], mimetype=entry[1])
+
+            return _with_validators(response, etag, last_modified)
+        return wrapper
+    return decorator
+
+
+def _with_validators(response, etag, last_modified):
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    # Clients may keep the body but must revalidate before using it
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept')
+    return response
@@ -0,0 +1,121 @@
+from flask import Blueprint, jsonify, request
+from flask_cors import cross_origin
+from datetime import date, datetime, timedelta
+from backend.data_service import get_archive, get_index
+from backend.listing import list_response
+from backend.response_cache import conditional
+from backend.indexes.consumption import ConsumptionIndex, streaks
+from backend.indexes.rollups import NutritionRollup, empty_summary, merge_summary
+
+addictions_bp = Blueprint('addictions', __name__)
+
+# Longest analysis window, in days
+MAX_ANALYSIS_DAYS = 366
+
+# Daily amounts above which a day counts as high intake
+SUGAR_LIMIT_G = 50
+SODIUM_LIMIT_MG = 2300
+
+# A food eaten on at least this many consecutive days is flagged
+STREAK_ALERT_DAYS = 3
+
+# Foods listed in `foods`, most frequent first
+TOP_FOODS = 20
+
+
+@addictions_bp.route('/food-addictions', methods=['GET', 'OPTIONS'])
+@cross_origin()
+@conditional()
+def get_food_addictions():
+    if request.method == 'GET':
+        return list_response('foodAddictions')
+
+
+@addictions_bp.route('/food-addictions/analysis', methods=['GET', 'OPTIONS'])
+@cross_origin()
+@conditional(clock='%Y-%m-%d')
+def analyze_food_addictions():
+    """Return consumption patterns over the last `days` days, today included.
+
+    Query params:
+    - days: window length (default 30, at most MAX_ANALYSIS_DAYS)
+
+    The response has per-day sugar, fat and sodium series with their daily
+    averages, how many meals included each food (`foodFrequency`), and the
+    most frequent foods with their current and longest daily streaks.
+    """
+    if request.method == 'GET':
+        try:
+            days = int(request.args.get('days', 30))
+        except ValueError:
+            return jsonify({"error": "days must be a number"}), 400
+        if not 1 <= days <= MAX_ANALYSIS_DAYS:
+            return jsonify({"error": "days must be between 1 and %d" % MAX_ANALYSIS_DAYS}), 400
+        return jsonify(_analysis(datetime.now().date(), days))
+
+
+def _analysis(today, days):
+    first_day = today - timedelta(days=days-1)
+    day_keys = [(first_day + timedelta(days=i)).isoformat() for i in range(days)]
+    end = (today + timedelta(days=1)).isoformat()
+    totals_per_day = get_index(NutritionRollup).days_between(day_keys[0], end)
+    consumption = get_index(ConsumptionIndex)
+    counts_per_day = consumption.counts_between(day_keys)
+
+    # Archived days count too, from their day summaries
+    archived_names = {}
+    for key, archived in get_archive().days('meals', day_keys[0], end).items():
+        merge_summary(totals_per_day.setdefault(key, empty_summary()), archived)
+        counts = counts_per_day.setdefault(key, {})
+        for food, meals in archived.get('foods', {}).items():
+            counts[food] = counts.get(food, 0) + meals
+        archived_names.update(archived.get('foodNames', {}))
+
+    def name(food):
+        # The live spelling, else the archived one
+        spelled = consumption.name(food)
+        return spelled if spelled != food else archived_names.get(food, food)
+
+    series = {"sugar": [], "fats": [], "sodium": []}
+    for key in day_keys:
+        values = totals_per_day[key]['totals'] if key in totals_per_day else {}
+        for field, points in series.items():
+            points.append({"date": key, "amount": values.get(field, 0)})
+
+    frequency = {}
+    days_eaten = {}
+    for key in day_keys:
+        for food, meals in counts_per_day.get(key, {}).items():
+            frequency[food] = frequency.get(food, 0) + meals
+            days_eaten.setdefault(food, []).append(date.fromisoformat(key))
+
+    foods = []
+    for food in sorted(frequency, key=lambda f: (-frequency[f], f))[:TOP_FOODS]:
+        current, longest = streaks(days_eaten[food], today)
+        foods.append({
+            "name": name(food),
+            "meals": frequency[food],
+            "days": len(days_eaten[food]),
+            "currentStreak": current,
+            "longestStreak": longest,
+            "flagged": longest >= STREAK_ALERT_DAYS
+        })
+
+    def average(points):
+        return sum(p['amount'] for p in points) / days
+
+    return {
+        "period": days,
+        "from": day_keys[0],
+        "to": day_keys[-1],
+        "sugarTracking": series['sugar'],
+        "fatTracking": series['fats'],
+        "sodiumTracking": series['sodium'],
+        "averageSugar": average(series['sugar']),
+        "averageFat": average(series['fats']),
+        "averageSodium": average(series['sodium']),
+        "highSugarDays": sum(1 for p in series['sugar'] if p['amount'] > SUGAR_LIMIT_G),
+        "highSodiumDays": sum(1 for p in series['sodium'] if p['amount'] > SODIUM_LIMIT_MG),
+        "foodFrequency": {name(f): n for f, n in frequency.items()},
+        "foods": foods
+    }
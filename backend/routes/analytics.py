@@ -1,75 +1,85 @@
 from flask import Blueprint, jsonify, request
 from flask_cors import cross_origin
+from collections import Counter
 from datetime import datetime, timedelta
-from backend.data_service import load_data
+from backend.data_service import (get_archive, get_document, get_index,
+                                  is_document_loaded, records_in_period)
+from backend.response_cache import conditional
+from backend.indexes.columns import TimeSeriesColumns
+from backend.indexes.expiry import ExpiryIndex
+from backend.indexes.ingredients import IngredientIndex
+from backend.indexes.timeline import Timeline
+from backend.indexes.rollups import (NUTRITION_FIELDS, NutritionRollup, empty_summary,
+                                     merge_summary, summarize_meals)
+from backend.storage.base import PREFIX_END
 
 analytics_bp = Blueprint('analytics', __name__)
 
+MEAL_TYPES = ('breakfast', 'lunch', 'dinner', 'snacks')
+
+# The dashboard lists foods expiring within this many days
+DASHBOARD_REMINDER_DAYS = 3
+
 @analytics_bp.route('/recommendations', methods=['GET', 'OPTIONS'])
 @cross_origin()
+@conditional()
 def get_recommendations():
+    """Return recipes ranked by the share of their ingredients in storage.
+
+    Query params:
+    - limit: maximum number of recipes to return (default: all)
+    - minScore: minimum match score between 0 and 1 (default: any match)
+    """
     if request.method == 'GET':
-        data = load_data()
-        foods = data['foods']
-        recipes = data['recipes']
-        
+        try:
+            limit = request.args.get('limit')
+            limit = int(limit) if limit is not None else None
+            min_score = request.args.get('minScore')
+            min_score = float(min_score) if min_score is not None else None
+        except ValueError:
+            return jsonify({"error": "limit and minScore must be numbers"}), 400
+
+        index = get_index(IngredientIndex)
         recommendations = []
-        for recipe in recipes:
-            if 'ingredients' not in recipe:
+        for recipe_id, score in index.recommend(limit, min_score):
+            recipe = index.document.get('recipes', recipe_id)
+            if recipe is None:
+                # Deleted while we were scoring
                 continue
-            available_ingredients = [f['name'].lower() for f in foods]
-            recipe_ingredients = [ing.lower() for ing in recipe.get('ingredients', [])]
-
-            matches = sum(1 for ing in recipe_ingredients 
-                        if any(ing in avail or avail in ing for avail in available_ingredients))
-            
-            if matches > 0:
-                recipe_copy = recipe.copy()
-                recipe_copy['matchScore'] = matches / len(recipe_ingredients) if recipe_ingredients else 0
-                recommendations.append(recipe_copy)
-        
-        # Sort by match score
-        recommendations.sort(key=lambda x: x.get('matchScore', 0), reverse=True)
+            recipe_copy = recipe.copy()
+            recipe_copy['matchScore'] = score
+            recommendations.append(recipe_copy)
         return jsonify(recommendations)
 
 @analytics_bp.route('/nutrition/daily', methods=['GET', 'OPTIONS'])
 @cross_origin()
+@conditional(clock='%Y-%m-%d')
 def get_daily_nutrition():
     if request.method == 'GET':
         date = request.args.get('date', datetime.now().strftime('%Y-%m-%d'))
-        data = load_data()
-        meals = [m for m in data['meals'] if m.get('date', '').startswith(date)]
-        
-        totals = {
-            "calories": 0,
-            "protein": 0,
-            "carbs": 0,
-            "fats": 0,
-            "saturatedFats": 0,
-            "sodium": 0,
-            "cholesterol": 0,
-            "fiber": 0,
-            "sugar": 0
-        }
-        
-        by_meal_type = {
-            "breakfast": totals.copy(),
-            "lunch": totals.copy(),
-            "dinner": totals.copy(),
-            "snacks": totals.copy()
-        }
-        
-        for meal in meals:
-            nutrition = meal.get('nutrition', {})
-            meal_type = meal.get('mealType', 'snacks')
+        meals = records_in_period('meals', date)
+
+        if len(date) <= 10 and is_document_loaded():
+            # Whole days (or months, years): read the rollup and the
+            # archived day summaries
+            summary = get_index(NutritionRollup).summarize(date, date + PREFIX_END)
+            archived_days = get_archive().days('meals', date, date + PREFIX_END)
+            for archived in archived_days.values():
+                merge_summary(summary, archived)
+        else:
+            # Part of a day is finer than the rollup, and building the rollup
+            # would load every partition; total the meals themselves
+            summary = summarize_meals(meals)
+
+        totals = summary['totals']
+        by_meal_type = {meal_type: dict.fromkeys(NUTRITION_FIELDS, 0)
+                        for meal_type in MEAL_TYPES}
+        for meal_type, part in summary['byMealType'].items():
             if meal_type not in by_meal_type:
                 meal_type = 'snacks'
-            
-            for key in totals:
-                value = nutrition.get(key, 0)
-                totals[key] += value
-                by_meal_type[meal_type][key] += value
-        
+            for key in NUTRITION_FIELDS:
+                by_meal_type[meal_type][key] += part['totals'][key]
+
         return jsonify({
             "date": date,
             "totals": totals,
@@ -80,6 +90,7 @@ def get_daily_nutrition():
 
 @analytics_bp.route('/nutrition/trends', methods=['GET', 'OPTIONS'])
 @cross_origin()
+@conditional(clock='%Y-%m-%d')
 def get_nutrition_trends():
     """Return nutrition totals per day for the last `days` days.
 
@@ -92,115 +103,209 @@ def get_nutrition_trends():
         except Exception:
             days = 30
 
-        data = load_data()
-        meals = data.get('meals', [])
-
-        totals_per_day = {}
-        for m in meals:
-            d = m.get('date', '')
-            if not d:
-                continue
-            date_key = d.split('T')[0]
-            nutrition = m.get('nutrition', {})
-            if date_key not in totals_per_day:
-                totals_per_day[date_key] = {"calories": 0, "protein": 0, "carbs": 0, "fats": 0}
-            for key in ["calories", "protein", "carbs", "fats"]:
-                totals_per_day[date_key][key] += nutrition.get(key, 0)
-
-        # Build list for the requested days (oldest -> newest)
-        trends = []
         today = datetime.now()
-        for i in range(days-1, -1, -1):
-            day = (today - timedelta(days=i)).date()
-            key = day.isoformat()
-            values = totals_per_day.get(key, {"calories": 0, "protein": 0, "carbs": 0, "fats": 0})
-            trends.append({"date": key, "calories": values["calories"], "protein": values["protein"], "carbs": values["carbs"], "fats": values["fats"]})
+        first_day = (today - timedelta(days=days-1)).date().isoformat()
+        live_days = get_index(NutritionRollup).days_between(first_day)
+        totals_per_day = _with_archived_days(live_days, first_day)
+        return jsonify(_nutrition_trends(totals_per_day, today, days))
+
+
+def _with_archived_days(meal_days, start):
+    """Add archived day summaries from `start` on to the live day rollups `meal_days`.
+
+    `meal_days` is changed in place and returned.
+    """
+    for day, archived in get_archive().days('meals', start).items():
+        summary = meal_days.get(day)
+        if summary is None:
+            summary = meal_days[day] = empty_summary()
+        merge_summary(summary, archived)
+    return meal_days
+
+
+def _nutrition_trends(totals_per_day, today, days):
+    """Build the trend list of the requested days, oldest first, from day rollups."""
+    trends = []
+    for i in range(days-1, -1, -1):
+        day = (today - timedelta(days=i)).date()
+        key = day.isoformat()
+        values = totals_per_day[key]['totals'] if key in totals_per_day else {}
+        trends.append({"date": key, "calories": values.get("calories", 0),
+                       "protein": values.get("protein", 0),
+                       "carbs": values.get("carbs", 0), "fats": values.get("fats", 0)})
+    return trends
 
-        return jsonify(trends)
+
+@analytics_bp.route('/nutrition/rollups/rebuild', methods=['POST', 'OPTIONS'])
+@cross_origin()
+def rebuild_nutrition_rollups():
+    """Recompute the daily nutrition rollups from the raw meals."""
+    if request.method == 'POST':
+        days = get_index(NutritionRollup).rebuild()
+        return jsonify({"days": days})
 
 @analytics_bp.route('/stats', methods=['GET', 'OPTIONS'])
 @cross_origin()
+@conditional(clock='%Y-%m-%d %H:%M')
 def get_stats():
     if request.method == 'GET':
-        days = int(request.args.get('days', 30))
-        data = load_data()
-        cutoff_date = (datetime.now() - timedelta(days=days)).isoformat()
-        
-        # Food stats
-        foods = data['foods']
-        today = datetime.now()
-        expiring_soon = [f for f in foods if 
-                        datetime.fromisoformat(f.get('expiryDate', '9999-12-31')) <= 
-                        today + timedelta(days=3)]
-        
-        # Meal stats
-        meals = [m for m in data['meals'] if m.get('date', '') >= cutoff_date]
-        total_meals = len(meals)
-        
-        # Nutrition stats
-        total_nutrition = {
-            "calories": 0,
-            "protein": 0,
-            "carbs": 0,
-            "fats": 0,
-            "saturatedFats": 0,
-            "sodium": 0,
-            "cholesterol": 0,
-            "fiber": 0,
-            "sugar": 0
-        }
-        for meal in meals:
-            nutrition = meal.get('nutrition', {})
-            for key in total_nutrition:
-                total_nutrition[key] += nutrition.get(key, 0)
-        
-        # Calculate averages
-        avg_nutrition = {k: v / len(meals) if meals else 0 for k, v in total_nutrition.items()}
-        
-        # Health metrics
-        health_metrics = [h for h in data['healthMetrics'] if h.get('date', '') >= cutoff_date]
-        
-        # Steps stats
-        steps_data = data.get('steps', [])
-        recent_steps = [s for s in steps_data if s.get('date', '') >= cutoff_date]
-        total_steps = sum(s.get('steps', 0) for s in recent_steps)
-        avg_steps = total_steps / len(recent_steps) if recent_steps else 0
-        
+        try:
+            days = int(request.args.get('days', 30))
+        except Exception:
+            days = 30
+        document = get_document()
+        now = datetime.now()
+        return jsonify(_stats(document, days, now, _meal_days(document, now, days)))
+
+
+@analytics_bp.route('/dashboard', methods=['GET', 'OPTIONS'])
+@cross_origin()
+@conditional(clock='%Y-%m-%d %H:%M')
+def get_dashboard():
+    """Return everything the dashboard shows in one response.
+
+    Stats, nutrition trends and reminders are computed from one snapshot of
+    the data and share the per-day meal rollups of the period.
+
+    Query params:
+    - days: period in days (default 30)
+    """
+    if request.method == 'GET':
+        try:
+            days = int(request.args.get('days', 30))
+        except Exception:
+            days = 30
+        document = get_document()
+        now = datetime.now()
+        meal_days = _meal_days(document, now, days)
         return jsonify({
-            "period": days,
-            "foods": {
-                "total": len(foods),
-                "expiringSoon": len(expiring_soon),
-                "byStorage": {
-                    "fridge": len([f for f in foods if f.get('storageType') == 'fridge']),
-                    "shelf": len([f for f in foods if f.get('storageType') == 'shelf']),
-                    "freezer": len([f for f in foods if f.get('storageType') == 'freezer'])
-                }
-            },
-            "meals": {
-                "total": total_meals,
-                "byType": {
-                    "breakfast": len([m for m in meals if m.get('mealType') == 'breakfast']),
-                    "lunch": len([m for m in meals if m.get('mealType') == 'lunch']),
-                    "dinner": len([m for m in meals if m.get('mealType') == 'dinner']),
-                    "snacks": len([m for m in meals if m.get('mealType') == 'snacks'])
-                }
-            },
-            "nutrition": {
-                "total": total_nutrition,
-                "average": avg_nutrition
-            },
-            "healthMetrics": {
-                "count": len(health_metrics),
-                "entries": health_metrics[-10:] if health_metrics else []
-            },
-            "steps": {
-                "total": total_steps,
-                "average": avg_steps,
-                "entries": len(recent_steps)
-            },
-            "recipes": {
-                "total": len(data['recipes']),
-                "shared": len(data['sharedRecipes'])
+            "stats": _stats(document, days, now, meal_days),
+            "nutritionTrends": _nutrition_trends(meal_days, now, days),
+            "reminders": document.index(ExpiryIndex).reminders(now.date(),
+                                                               DASHBOARD_REMINDER_DAYS)
+        })
+
+
+def _archived_cutoff_day(archive, collection, cutoff, next_day):
+    """Return the archived records of the cutoff day from `cutoff` on.
+
+    There are none unless that day is archived.
+    """
+    if not archive.has_day(collection, cutoff.date().isoformat()):
+        return []
+    return archive.records(collection, cutoff.isoformat(), next_day.isoformat())
+
+
+def _meal_days(document, now, days):
+    """Return the day rollups of the last `days` whole days, without the cutoff day.
+
+    These are the full days of the stats period and exactly the days of the
+    nutrition trends, so both can share them.
+    """
+    cutoff_day = (now - timedelta(days=days)).date().isoformat()
+    start = cutoff_day + PREFIX_END
+    live_days = document.index(NutritionRollup).days_between(start)
+    return _with_archived_days(live_days, start)
+
+
+def _stats(document, days, now, meal_days):
+    """Compute the /api/stats payload from `document` and the period's day rollups.
+
+    Archived history counts too: whole days from the archive's day
+    summaries, and the cutoff day from its archived records, if it has any.
+    """
+    cutoff = now - timedelta(days=days)
+    archive = get_archive()
+    cutoff_day = cutoff.date().isoformat()
+
+    # Food stats
+    foods = document.records('foods')
+    expiring_soon = document.index(ExpiryIndex).count_expiring_by(
+        now + timedelta(days=3))
+    by_storage = Counter(f.get('storageType') for f in foods)
+
+    # Meal stats: whole days after the cutoff come from the rollup, the
+    # cutoff day itself from its meals, since only part of it counts
+    summary = empty_summary()
+    for part in meal_days.values():
+        merge_summary(summary, part)
+    next_day = datetime.combine(cutoff.date() + timedelta(days=1), datetime.min.time())
+    cutoff_meals = document.index(Timeline).window('meals', cutoff, next_day)
+    merge_summary(summary, summarize_meals(cutoff_meals))
+    cutoff_meals = _archived_cutoff_day(archive, 'meals', cutoff, next_day)
+    merge_summary(summary, summarize_meals(cutoff_meals))
+    total_meals = summary['count']
+    meals_by_type = summary['byMealType']
+
+    # Nutrition stats
+    total_nutrition = summary['totals']
+
+    # Calculate averages
+    avg_nutrition = {k: v / total_meals if total_meals else 0
+                     for k, v in total_nutrition.items()}
+
+    # Health metrics and steps
+    series = document.index(TimeSeriesColumns)
+    health_metrics, _ = series.window('healthMetrics', since=cutoff)
+    recent_steps, total_steps = series.window('steps', since=cutoff)
+    step_entries = len(recent_steps)
+    health_count = len(health_metrics)
+
+    after_cutoff = cutoff_day + PREFIX_END
+    for part in archive.days('steps', after_cutoff).values():
+        step_entries += part['count']
+        total_steps += part['total']
+    for entry in _archived_cutoff_day(archive, 'steps', cutoff, next_day):
+        step_entries += 1
+        total_steps += entry.get('steps') or 0
+    archived_days = archive.days('healthMetrics', after_cutoff)
+    health_count += sum(part['count'] for part in archived_days.values())
+    health_count += len(_archived_cutoff_day(archive, 'healthMetrics', cutoff,
+                                             next_day))
+    if len(health_metrics) < 10 and health_count > len(health_metrics):
+        # Fill the latest entries from the archive
+        missing = 10 - len(health_metrics)
+        latest = archive.latest('healthMetrics', cutoff.isoformat(), missing)
+        health_metrics = latest + health_metrics
+
+    if total_steps == int(total_steps):
+        total_steps = int(total_steps)
+    avg_steps = total_steps / step_entries if step_entries else 0
+
+    return {
+        "period": days,
+        "foods": {
+            "total": len(foods),
+            "expiringSoon": expiring_soon,
+            "byStorage": {
+                "fridge": by_storage['fridge'],
+                "shelf": by_storage['shelf'],
+                "freezer": by_storage['freezer']
+            }
+        },
+        "meals": {
+            "total": total_meals,
+            "byType": {
+                meal_type: meals_by_type[meal_type]['count']
+                if meal_type in meals_by_type else 0
+                for meal_type in MEAL_TYPES
             }
-        })
\ No newline at end of file
+        },
+        "nutrition": {
+            "total": total_nutrition,
+            "average": avg_nutrition
+        },
+        "healthMetrics": {
+            "count": health_count,
+            "entries": health_metrics[-10:] if health_metrics else []
+        },
+        "steps": {
+            "total": total_steps,
+            "average": avg_steps,
+            "entries": step_entries
+        },
+        "recipes": {
+            "total": len(document.records('recipes')),
+            "shared": len(document.records('sharedRecipes'))
+        }
+    }
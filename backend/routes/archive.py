@@ -0,0 +1,54 @@
+from flask import Blueprint, jsonify, request
+from flask_cors import cross_origin
+from backend.archive import ARCHIVED
+from backend.data_service import _get_setting, archive_history, get_archive
+from backend.storage.base import PREFIX_END
+
+archive_bp = Blueprint('archive', __name__)
+
+# Default days of history kept live when archiving (see backend/app.py)
+ARCHIVE_AFTER_DAYS = 0
+
+
+@archive_bp.route('/archive', methods=['GET', 'OPTIONS'])
+@cross_origin()
+def get_archive_segments():
+    """Return the archive's segments with their record counts, date ranges and sizes."""
+    if request.method == 'GET':
+        return jsonify({"segments": get_archive().stats()})
+
+
+@archive_bp.route('/archive/run', methods=['POST', 'OPTIONS'])
+@cross_origin()
+def run_archive():
+    """Archive the meals, steps and health metrics older than `days` days.
+
+    Query params:
+    - days: days of history to keep live (default: FRIDGY_ARCHIVE_AFTER_DAYS)
+    """
+    if request.method == 'POST':
+        try:
+            days = int(request.args.get('days', _get_setting('ARCHIVE_AFTER_DAYS', ARCHIVE_AFTER_DAYS)))
+        except ValueError:
+            days = 0
+        if days <= 0:
+            return jsonify({"error": "days must be a positive integer"}), 400
+        return jsonify({"days": days, "archived": archive_history(days)})
+
+
+@archive_bp.route('/archive/<collection>', methods=['GET', 'OPTIONS'])
+@cross_origin()
+def get_archived_records(collection):
+    """Return archived records of `collection`, oldest first.
+
+    Only the monthly segments covering the window are decompressed.
+
+    Query params:
+    - from, to: first and last day (YYYY-MM-DD) to include
+    """
+    if request.method == 'GET':
+        if collection not in ARCHIVED:
+            return jsonify({"error": "Unknown archived collection"}), 404
+        start = request.args.get('from')
+        end = request.args['to'] + PREFIX_END if 'to' in request.args else None
+        return jsonify(get_archive().records(collection, start, end))
@@ -0,0 +1,49 @@
+from itertools import chain, islice
+from flask import Blueprint, jsonify, request
+from flask_cors import cross_origin
+from backend.archive import ARCHIVED
+from backend.data_service import get_archive, get_document
+from backend.response_cache import conditional
+from backend.streaming import stream_collections
+
+export_bp = Blueprint('export', __name__)
+
+@export_bp.route('/export', methods=['GET', 'OPTIONS'])
+@cross_origin()
+@conditional()
+def export_data():
+    """Stream every collection as one download.
+
+    The response is a JSON object of arrays, or NDJSON lines of
+    `{"collection", "record"}` when the client sends
+    `Accept: application/x-ndjson`.
+
+    Query params:
+    - collections: comma-separated collections to export (default: all)
+    """
+    if request.method == 'GET':
+        document = get_document()
+        names = document.collection_names()
+        if 'collections' in request.args:
+            requested = [c for c in request.args['collections'].split(',') if c]
+            unknown = [c for c in requested if c not in names]
+            if unknown:
+                return jsonify({"error": "Unknown collections: %s" % ', '.join(unknown)}), 400
+            names = requested
+
+        response = stream_collections([(name, _exported_records(document, name))
+                                       for name in names])
+        extension = 'ndjson' if response.mimetype != 'application/json' else 'json'
+        response.headers['Content-Disposition'] = 'attachment; filename=fridgy-export.%s' % extension
+        return response
+
+
+def _exported_records(document, name):
+    """Return the archived then the live records of `name`, read while they are sent."""
+    live = document.records(name)
+    # Updates and deletes replace the record list, but inserts append to it;
+    # stopping at today's length keeps the export one consistent snapshot
+    live = islice(live, len(live))
+    if name not in ARCHIVED:
+        return live
+    return chain(get_archive().iter_records(name), live)
@@ -1,87 +1,78 @@
 from flask import Blueprint, jsonify, request
 from flask_cors import cross_origin
-from backend.data_service import load_data, save_data, generate_id
+from datetime import datetime
+from backend.data_service import generate_id, insert_record, update_record, delete_record, get_index
+from backend.batch import delete_batch, insert_batch, read_items
+from backend.listing import list_response
+from backend.response_cache import conditional
+from backend.indexes.expiry import REMINDER_DAYS, ExpiryIndex
 
 foods_bp = Blueprint('foods', __name__)
 
 @foods_bp.route('/foods', methods=['GET', 'POST', 'OPTIONS'])
 @cross_origin()
+@conditional()
 def handle_foods():
     if request.method == 'GET':
-        data = load_data()
-        return jsonify(data['foods'])
+        return list_response('foods', filters=('storageType', 'category'))
     
     elif request.method == 'POST':
-        data = load_data()
         new_food = request.get_json()
         new_food['id'] = generate_id()
-        data['foods'].append(new_food)
-        save_data(data)
+        insert_record('foods', new_food)
         return jsonify(new_food), 201
 
+
+@foods_bp.route('/foods/batch', methods=['POST', 'OPTIONS'])
+@cross_origin()
+def add_foods_batch():
+    """Add several foods with one write; nothing is saved if any item is invalid."""
+    if request.method == 'POST':
+        foods, error = read_items(_validate_food)
+        if error:
+            return error
+        for food in foods:
+            food['id'] = generate_id()
+        return insert_batch('foods', foods)
+
+
+@foods_bp.route('/foods/batch/delete', methods=['POST', 'OPTIONS'])
+@cross_origin()
+def delete_foods_batch():
+    if request.method == 'POST':
+        return delete_batch('foods')
+
+
+def _validate_food(food):
+    if not isinstance(food.get('name'), str) or not food['name'].strip():
+        return 'name is required'
+    return None
+
+
 @foods_bp.route('/foods/<food_id>', methods=['DELETE', 'PUT', 'OPTIONS'])
 @cross_origin()
 def handle_food(food_id):
     if request.method == 'DELETE':
-        data = load_data()
-        data['foods'] = [f for f in data['foods'] if f['id'] != food_id]
-        save_data(data)
+        delete_record('foods', food_id)
         return jsonify({"message": "Food deleted"})
     
     elif request.method == 'PUT':
-        data = load_data()
-        updated_food = request.get_json()
-        for i, food in enumerate(data['foods']):
-            if food['id'] == food_id:
-                data['foods'][i].update(updated_food)
-                save_data(data)
-                return jsonify(data['foods'][i])
-        return jsonify({"error": "Food not found"}), 404
+        food = update_record('foods', food_id, request.get_json())
+        if food is None:
+            return jsonify({"error": "Food not found"}), 404
+        return jsonify(food)
 
 
 # Reminders endpoint: returns food items that are expiring soon
 @foods_bp.route('/reminders', methods=['GET', 'OPTIONS'])
 @cross_origin()
+@conditional(clock='%Y-%m-%d')
 def get_reminders():
     try:
-        days_window = int(request.args.get('days', 7))
+        days_window = int(request.args.get('days', REMINDER_DAYS))
     except Exception:
-        days_window = 7
-
-    data = load_data()
-    foods = data.get('foods', [])
-    reminders = []
-
-    from datetime import datetime
-
-    today = datetime.now().date()
-    for f in foods:
-        expiry = f.get('expiryDate')
-        if not expiry:
-            continue
-        # Try parsing date in ISO formats (date or datetime)
-        try:
-            if 'T' in expiry:
-                exp_dt = datetime.fromisoformat(expiry).date()
-            else:
-                exp_dt = datetime.fromisoformat(expiry).date()
-        except Exception:
-            try:
-                exp_dt = datetime.strptime(expiry, '%Y-%m-%d').date()
-            except Exception:
-                # skip unparseable dates
-                continue
-
-        days_until = (exp_dt - today).days
-        if days_until <= days_window:
-            priority = 'high' if days_until <= 3 else 'medium'
-            reminders.append({
-                'food': f,
-                'expiryDate': exp_dt.isoformat(),
-                'daysUntilExpiry': days_until,
-                'priority': priority
-            })
+        days_window = REMINDER_DAYS
 
-    # sort by days until expiry (soonest first)
-    reminders.sort(key=lambda r: r['daysUntilExpiry'])
-    return jsonify(reminders)
\ No newline at end of file
+    # Foods come back from the expiry index already sorted, soonest first
+    reminders = get_index(ExpiryIndex).reminders(datetime.now().date(), days_window)
+    return jsonify(reminders)
@@ -1,10 +1,19 @@
 from flask import Blueprint, jsonify, request
 from flask_cors import cross_origin
 from datetime import datetime, timedelta
-from backend.data_service import load_data, save_data, generate_id
+from backend.data_service import (records_in_period, generate_id, insert_record,
+                                  delete_record, get_archive, get_index)
+from backend.batch import delete_batch, insert_batch, is_number, read_items
+from backend.listing import list_response
+from backend.response_cache import conditional
+from backend.indexes.columns import TimeSeriesColumns
+from backend.indexes.timeline import Timeline, parse_datetime
 
 health_bp = Blueprint('health', __name__)
 
+# Longest range /api/steps?from=&to= answers in one request
+MAX_STEPS_RANGE_DAYS = 366
+
 @health_bp.route('/health', methods=['GET', 'OPTIONS'])
 @cross_origin()
 def health_check():
@@ -13,92 +22,191 @@ def health_check():
 
 @health_bp.route('/health-metrics', methods=['GET', 'POST', 'OPTIONS'])
 @cross_origin()
+@conditional()
 def handle_health_metrics():
     if request.method == 'GET':
-        data = load_data()
-        return jsonify(data['healthMetrics'])
+        return list_response('healthMetrics', filters=('type',))
     
     elif request.method == 'POST':
-        data = load_data()
         new_metric = request.get_json()
         new_metric['id'] = generate_id()
         new_metric['date'] = datetime.now().isoformat()
-        data['healthMetrics'].append(new_metric)
-        save_data(data)
+        insert_record('healthMetrics', new_metric)
         return jsonify(new_metric), 201
 
 
 @health_bp.route('/health-metrics/trends', methods=['GET', 'OPTIONS'])
 @cross_origin()
+@conditional(clock='%Y-%m-%d')
 def get_health_metrics_trends():
-    """Return time-series trend points for a given health metric type.
+    """Return time-series trend points for one or more health metric types.
 
     Query params:
-    - type: metric type string (e.g., 'weight', 'bmi', 'cholesterol')
+    - type: metric type string (e.g., 'weight', 'bmi', 'cholesterol'); the
+      response is that type's list of points
+    - types: comma-separated types ('weight,bmi,cholesterol'); the response
+      is `{type: points}` for every listed type, from one scan, even when
+      only one is listed. Repeating `type` does the same.
     - days: number of days to include (default 30)
     """
     if request.method == 'GET':
-        metric_type = request.args.get('type', 'weight')
+        if 'types' in request.args:
+            metric_types = [t.strip() for t in request.args['types'].split(',')
+                            if t.strip()]
+        else:
+            metric_types = request.args.getlist('type') or ['weight']
+        many = 'types' in request.args or len(metric_types) > 1
         try:
             days = int(request.args.get('days', 30))
         except Exception:
             days = 30
 
-        data = load_data()
-        metrics = [m for m in data.get('healthMetrics', []) if m.get('type') == metric_type]
+        today = datetime.now()
+        first_day = (today - timedelta(days=days-1)).date()
+        by_type = get_index(TimeSeriesColumns).latest_per_day_by_category(
+            'healthMetrics', first_day, metric_types)
+        _add_archived_latest(by_type, first_day.isoformat())
+
+        series = {metric_type: _trend_points(by_date, today, days)
+                  for metric_type, by_date in by_type.items()}
+        if not many:
+            return jsonify(series[metric_types[0]])
+        return jsonify(series)
+
 
-        # Build a map of date -> latest metric value for that date
-        by_date = {}
-        for m in metrics:
-            d = m.get('date', '')
-            if not d:
+def _add_archived_latest(by_type, start):
+    """Fill `{type: {day: entry}}` with the last archived value per day from `start` on.
+
+    The archive's day summaries are used, so no segment is read. Where a day
+    has both, the later entry wins.
+    """
+    for day, summary in get_archive().days('healthMetrics', start).items():
+        for metric_type, by_date in by_type.items():
+            part = summary['byType'].get(metric_type)
+            if part is None:
                 continue
-            # normalize to YYYY-MM-DD
-            date_key = d.split('T')[0]
-            # Keep the latest timestamp for the date
-            if date_key not in by_date or m.get('date', '') > by_date[date_key]['date']:
-                by_date[date_key] = { 'date': m.get('date'), 'value': m.get('value') }
-
-        # Build list for the requested days (oldest -> newest)
-        trends = []
-        today = datetime.now()
-        for i in range(days-1, -1, -1):
-            day = (today - timedelta(days=i)).date()
-            key = day.isoformat()
-            if key in by_date:
-                trends.append({ 'date': by_date[key]['date'], 'value': by_date[key]['value'] })
-            else:
-                # include a point with null value so charts keep the x-axis consistent
-                trends.append({ 'date': key, 'value': None })
+            date = part.get('lastDate', day)
+            live = by_date.get(day)
+            if live is None or str(live.get('date')) < date:
+                by_date[day] = {'date': date, 'value': part['last']}
+
 
-        return jsonify(trends)
+def _trend_points(by_date, today, days):
+    """Build the list of points for the requested days (oldest -> newest)."""
+    trends = []
+    for i in range(days-1, -1, -1):
+        day = (today - timedelta(days=i)).date()
+        key = day.isoformat()
+        if key in by_date:
+            trends.append({ 'date': by_date[key].get('date'),
+                            'value': by_date[key].get('value') })
+        else:
+            # include a point with null value so charts keep the x-axis consistent
+            trends.append({ 'date': key, 'value': None })
+    return trends
 
 @health_bp.route('/health-metrics/<metric_id>', methods=['DELETE', 'OPTIONS'])
 @cross_origin()
 def delete_health_metric(metric_id):
     if request.method == 'DELETE':
-        data = load_data()
-        data['healthMetrics'] = [m for m in data['healthMetrics'] if m['id'] != metric_id]
-        save_data(data)
+        delete_record('healthMetrics', metric_id)
         return jsonify({"message": "Metric deleted"})
 
+
+@health_bp.route('/health-metrics/batch/delete', methods=['POST', 'OPTIONS'])
+@cross_origin()
+def delete_health_metrics_batch():
+    if request.method == 'POST':
+        return delete_batch('healthMetrics')
+
 @health_bp.route('/steps', methods=['GET', 'POST', 'OPTIONS'])
 @cross_origin()
+@conditional(clock='%Y-%m-%d')
 def handle_steps():
+    """Return the steps of one day, or per-day totals for a range of days.
+
+    Query params:
+    - date: day (or month, year) to return entries for (default today)
+    - from, to: first and last day (YYYY-MM-DD) of a range; when either is
+      given the response is `{"from", "to", "days": [{"date", "total"}]}`
+      with one entry per day, oldest first
+    """
     if request.method == 'GET':
+        if 'from' in request.args or 'to' in request.args:
+            return _steps_range(request.args.get('from'), request.args.get('to'))
+
         date = request.args.get('date', datetime.now().strftime('%Y-%m-%d'))
-        data = load_data()
-        steps = [s for s in data.get('steps', []) if s.get('date', '').startswith(date)]
+        steps = records_in_period('steps', date)
         total = sum(s.get('steps', 0) for s in steps)
         return jsonify({"date": date, "total": total, "entries": steps})
     
     elif request.method == 'POST':
-        data = load_data()
-        if 'steps' not in data:
-            data['steps'] = []
         new_entry = request.get_json()
         new_entry['id'] = generate_id()
         new_entry['date'] = datetime.now().isoformat()
-        data['steps'].append(new_entry)
-        save_data(data)
-        return jsonify(new_entry), 201
\ No newline at end of file
+        insert_record('steps', new_entry)
+        return jsonify(new_entry), 201
+
+
+@health_bp.route('/steps/batch', methods=['POST', 'OPTIONS'])
+@cross_origin()
+def add_steps_batch():
+    """Import several step entries with one write.
+
+    Each item needs a numeric `steps`. Unlike the single POST, a given ISO
+    `date` is kept so past days can be imported; it defaults to now.
+    """
+    if request.method == 'POST':
+        entries, error = read_items(_validate_steps)
+        if error:
+            return error
+        now = datetime.now().isoformat()
+        for entry in entries:
+            entry['id'] = generate_id()
+            entry.setdefault('date', now)
+        return insert_batch('steps', entries)
+
+
+@health_bp.route('/steps/batch/delete', methods=['POST', 'OPTIONS'])
+@cross_origin()
+def delete_steps_batch():
+    if request.method == 'POST':
+        return delete_batch('steps')
+
+
+def _validate_steps(entry):
+    if not is_number(entry.get('steps')):
+        return 'steps must be a number'
+    if 'date' in entry and parse_datetime(entry['date']) is None:
+        return 'date must be an ISO date or datetime'
+    return None
+
+
+def _steps_range(from_param, to_param):
+    try:
+        last = (datetime.strptime(to_param, '%Y-%m-%d').date() if to_param
+                else datetime.now().date())
+        first = datetime.strptime(from_param, '%Y-%m-%d').date() if from_param else last
+    except ValueError:
+        return jsonify({"error": "from and to must be dates (YYYY-MM-DD)"}), 400
+    if first > last:
+        return jsonify({"error": "from must not be after to"}), 400
+    if (last - first).days >= MAX_STEPS_RANGE_DAYS:
+        error = "range must be at most %d days" % MAX_STEPS_RANGE_DAYS
+        return jsonify({"error": error}), 400
+
+    totals = {}
+    end = datetime.combine(last + timedelta(days=1), datetime.min.time())
+    for entry in get_index(Timeline).window('steps', first, end):
+        key = entry['date'][:10]
+        totals[key] = totals.get(key, 0) + entry.get('steps', 0)
+    archived_days = get_archive().days('steps', first.isoformat(),
+                                       end.date().isoformat())
+    for key, archived in archived_days.items():
+        totals[key] = totals.get(key, 0) + archived['total']
+
+    days = []
+    for i in range((last - first).days + 1):
+        key = (first + timedelta(days=i)).isoformat()
+        days.append({"date": key, "total": totals.get(key, 0)})
+    return jsonify({"from": first.isoformat(), "to": last.isoformat(), "days": days})
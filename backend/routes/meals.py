@@ -1,72 +1,72 @@
 from flask import Blueprint, jsonify, request
 from flask_cors import cross_origin
 from datetime import datetime
-from backend.data_service import load_data, save_data, generate_id
+from backend.data_service import generate_id, insert_record, delete_record, get_index
+from backend.batch import delete_batch, insert_batch, read_items
+from backend.listing import list_response
+from backend.response_cache import conditional
+from backend.indexes.foods import FoodLookup
 
 meals_bp = Blueprint('meals', __name__)
 
 @meals_bp.route('/meals', methods=['GET', 'POST', 'OPTIONS'])
 @cross_origin()
+@conditional()
 def handle_meals():
     if request.method == 'GET':
-        data = load_data()
-        return jsonify(data['meals'])
+        return list_response('meals', filters=('mealType',))
     
     elif request.method == 'POST':
-        data = load_data()
         new_meal = request.get_json()
-        new_meal['id'] = generate_id()
+        _prepare_meal(new_meal)
+        insert_record('meals', new_meal)
+        return jsonify(new_meal), 201
 
-        if 'date' not in new_meal:
-            new_meal['date'] = datetime.now().isoformat()
-        if 'time' not in new_meal:
-            new_meal['time'] = datetime.now().strftime('%H:%M')
 
-        if 'nutrition' not in new_meal or not new_meal['nutrition']:
-            nutrition = {
-                "calories": 0,
-                "protein": 0,
-                "carbs": 0,
-                "fats": 0,
-                "saturatedFats": 0,
-                "sodium": 0,
-                "cholesterol": 0,
-                "fiber": 0,
-                "sugar": 0
-            }
+@meals_bp.route('/meals/batch', methods=['POST', 'OPTIONS'])
+@cross_origin()
+def add_meals_batch():
+    """Add several meals with one write; nothing is saved if any item is invalid."""
+    if request.method == 'POST':
+        meals, error = read_items(_validate_meal)
+        if error:
+            return error
+        for meal in meals:
+            _prepare_meal(meal)
+        return insert_batch('meals', meals)
+
+
+@meals_bp.route('/meals/batch/delete', methods=['POST', 'OPTIONS'])
+@cross_origin()
+def delete_meals_batch():
+    if request.method == 'POST':
+        return delete_batch('meals')
+
+
+def _validate_meal(meal):
+    if 'foods' in meal and not isinstance(meal['foods'], list):
+        return 'foods must be a list'
+    if 'nutrition' in meal and meal['nutrition'] is not None and not isinstance(meal['nutrition'], dict):
+        return 'nutrition must be an object'
+    return None
+
+
+def _prepare_meal(new_meal):
+    """Fill in a new meal's id, date, time and (unless given) nutrition from its foods."""
+    new_meal['id'] = generate_id()
+
+    if 'date' not in new_meal:
+        new_meal['date'] = datetime.now().isoformat()
+    if 'time' not in new_meal:
+        new_meal['time'] = datetime.now().strftime('%H:%M')
+
+    if 'nutrition' not in new_meal or not new_meal['nutrition']:
+        new_meal['nutrition'] = get_index(FoodLookup).meal_nutrition(new_meal.get('foods') or [])
 
-            if 'foods' in new_meal:
-                foods_list = new_meal['foods']
-                for food_item in foods_list:
-                    if isinstance(food_item, str):
-                        food = next((f for f in data['foods'] if f['name'].lower() == food_item.lower()), None)
-                    else:
-                        food_id = food_item.get('id') or food_item.get('foodId')
-                        food_name = food_item.get('name')
-                        if food_id:
-                            food = next((f for f in data['foods'] if f['id'] == food_id), None)
-                        elif food_name:
-                            food = next((f for f in data['foods'] if f['name'].lower() == food_name.lower()), None)
-                        else:
-                            food = None
-                    
-                    if food and 'nutrition' in food:
-                        quantity = food_item.get('quantity', 1) if isinstance(food_item, dict) else 1
-                        food_nutrition = food['nutrition']
-                        for key in nutrition:
-                            nutrition[key] += food_nutrition.get(key, 0) * quantity
-            
-            new_meal['nutrition'] = nutrition
-        
-        data['meals'].append(new_meal)
-        save_data(data)
-        return jsonify(new_meal), 201
 
 @meals_bp.route('/meals/<meal_id>', methods=['DELETE', 'OPTIONS'])
 @cross_origin()
 def delete_meal(meal_id):
     if request.method == 'DELETE':
-        data = load_data()
-        data['meals'] = [m for m in data['meals'] if m['id'] != meal_id]
-        save_data(data)
+        delete_record('meals', meal_id)
         return jsonify({"message": "Meal deleted"})
\ No newline at end of file
@@ -0,0 +1,9 @@
+from flask import Blueprint, Response
+from backend.metrics import render
+
+metrics_bp = Blueprint('metrics', __name__)
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Return request and storage metrics in the Prometheus text format."""
+    return Response(render(), mimetype='text/plain; version=0.0.4')
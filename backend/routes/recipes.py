@@ -1,57 +1,50 @@
 from datetime import datetime
 from flask import Blueprint, jsonify, request
 from flask_cors import cross_origin
-from backend.data_service import load_data, save_data, generate_id
+from backend.data_service import list_records, get_record, generate_id, insert_record, update_record, delete_record
+from backend.listing import list_response
+from backend.response_cache import conditional
 
 recipes_bp = Blueprint('recipes', __name__)
 
 @recipes_bp.route('/recipes', methods=['GET', 'POST', 'OPTIONS'])
 @cross_origin()
+@conditional()
 def handle_recipes():
     if request.method == 'GET':
-        data = load_data()
-        return jsonify(data['recipes'])
+        return list_response('recipes', filters=('category',))
     
     elif request.method == 'POST':
-        data = load_data()
         new_recipe = request.get_json()
         new_recipe['id'] = generate_id()
-        data['recipes'].append(new_recipe)
-        save_data(data)
+        insert_record('recipes', new_recipe)
         return jsonify(new_recipe), 201
 
 @recipes_bp.route('/recipes/<recipe_id>', methods=['DELETE', 'GET', 'PUT', 'OPTIONS'])
 @cross_origin()
+@conditional()
 def handle_recipe(recipe_id):
     if request.method == 'DELETE':
-        data = load_data()
-        data['recipes'] = [r for r in data['recipes'] if r['id'] != recipe_id]
-        save_data(data)
+        delete_record('recipes', recipe_id)
         return jsonify({"message": "Recipe deleted"})
     
     elif request.method == 'GET':
-        data = load_data()
-        recipe = next((r for r in data['recipes'] if r['id'] == recipe_id), None)
+        recipe = get_record('recipes', recipe_id)
         if not recipe:
             return jsonify({"error": "Recipe not found"}), 404
         return jsonify(recipe)
     
     elif request.method == 'PUT':
-        data = load_data()
-        updated_recipe = request.get_json()
-        for i, recipe in enumerate(data['recipes']):
-            if recipe['id'] == recipe_id:
-                data['recipes'][i].update(updated_recipe)
-                save_data(data)
-                return jsonify(data['recipes'][i])
-        return jsonify({"error": "Recipe not found"}), 404
+        recipe = update_record('recipes', recipe_id, request.get_json())
+        if recipe is None:
+            return jsonify({"error": "Recipe not found"}), 404
+        return jsonify(recipe)
 
 @recipes_bp.route('/recipes/<recipe_id>/share', methods=['POST', 'OPTIONS'])
 @cross_origin()
 def share_recipe(recipe_id):
     if request.method == 'POST':
-        data = load_data()
-        recipe = next((r for r in data['recipes'] if r['id'] == recipe_id), None)
+        recipe = get_record('recipes', recipe_id)
         if not recipe:
             return jsonify({"error": "Recipe not found"}), 404
         
@@ -64,14 +57,13 @@ def share_recipe(recipe_id):
             "sharedAt": datetime.now().isoformat(),
             "isPublic": share_data.get('isPublic', True)
         }
-        data['sharedRecipes'].append(shared_recipe)
-        save_data(data)
+        insert_record('sharedRecipes', shared_recipe)
         return jsonify(shared_recipe), 201
 
 @recipes_bp.route('/recipes/shared', methods=['GET', 'OPTIONS'])
 @cross_origin()
+@conditional()
 def get_shared_recipes():
     if request.method == 'GET':
-        data = load_data()
-        public_recipes = [sr for sr in data['sharedRecipes'] if sr.get('isPublic', True)]
+        public_recipes = [sr for sr in list_records('sharedRecipes') if sr.get('isPublic', True)]
         return jsonify(public_recipes)
\ No newline at end of file
@@ -0,0 +1,39 @@
+"""Pluggable storage backends for the Fridgy data document.
+
+Every backend implements the `Storage` interface from `base.py`; the data
+service picks one by name (see `STORAGE_MODE` in `backend/app.py`).
+"""
+
+from backend.storage.base import COLLECTIONS, Storage
+from backend.storage.journal_storage import JournalStorage
+from backend.storage.json_storage import JsonStorage
+from backend.storage.partitioned_storage import PartitionedStorage
+from backend.storage.sqlite_storage import SqliteStorage
+
+BACKENDS = {
+    'json': JsonStorage,
+    'journal': JournalStorage,
+    'sqlite': SqliteStorage,
+    'partitioned': PartitionedStorage,
+}
+
+__all__ = ["BACKENDS", "COLLECTIONS", "Storage", "create_storage"]
+
+
+def create_storage(mode, data_file, default_data, batch_window=0.0, snapshot_format='json'):
+    """Return a new storage backend of the given mode for `data_file`.
+
+    Args:
+        batch_window: Seconds writes wait to be flushed together (0 = off).
+        snapshot_format: Format the json and journal backends write their
+            snapshot in: 'json', 'compact' or 'msgpack' (see serialization.py).
+    """
+    try:
+        backend_class = BACKENDS[mode]
+    except KeyError:
+        raise ValueError('Unknown storage mode: %r (expected one of %s)'
+                         % (mode, ', '.join(sorted(BACKENDS))))
+    storage = backend_class(data_file, default_data)
+    storage.batch_window = batch_window
+    storage.snapshot_format = snapshot_format
+    return storage
@@ -0,0 +1,192 @@
+"""Storage interface shared by all Fridgy storage backends."""
+
+import os
+import threading
+import time
+
+# Collections every data document contains
+COLLECTIONS = ('foods', 'recipes', 'meals', 'healthMetrics', 'sharedRecipes', 'foodAddictions', 'steps')
+
+# Upper bound appended to a prefix to turn "starts with" into a range query
+PREFIX_END = '\uffff'
+
+
+def empty_document():
+    return {name: [] for name in COLLECTIONS}
+
+
+def working_copy(data):
+    """Return a copy of the document whose collections can be modified.
+
+    Only the top-level dict and the collection lists are copied; records
+    are shared, so writers must replace a record instead of updating it in
+    place.
+    """
+    return {k: list(v) if isinstance(v, list) else v for k, v in data.items()}
+
+
+def file_size(path):
+    """Return the size of `path` in bytes, or 0 if it does not exist."""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _in_range(value, start, end):
+    if value is None:
+        return False
+    try:
+        return (start is None or value >= start) and (end is None or value < end)
+    except TypeError:
+        return False
+
+
+class _Batch:
+    """Mutation entries collected for one group commit."""
+
+    def __init__(self):
+        self.entries = []
+        self.results = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class Storage:
+    """Base class for storage backends.
+
+    Backends implement `document`, `replace` and `apply_many`. Lookups by id
+    use the document's id index; the other query methods scan, and backends
+    with real indexes override them. Records returned by any method are
+    shared and must not be modified.
+    """
+
+    # Seconds a write waits for concurrent writes to join it before flushing
+    # them together (0 disables batching)
+    batch_window = 0.0
+
+    # Snapshot format of file-based backends (see serialization.FORMATS)
+    snapshot_format = 'json'
+
+    def __init__(self, data_file, default_data):
+        self.data_file = data_file
+        self._default_data = default_data
+        self._batch_lock = threading.Lock()
+        self._open_batch = None
+
+    def document(self):
+        """Return the current in-memory `Document`, refreshed from storage if it changed."""
+        raise NotImplementedError
+
+    def version(self):
+        """Return a token that changes whenever the stored data changes.
+
+        Must be cheap: it is checked on every conditional GET, before (and
+        often instead of) loading anything.
+        """
+        raise NotImplementedError
+
+    def index(self, index_class):
+        """Return the derived index of type `index_class`, built on first use.
+
+        Backends that load lazily may build it from just the collections it
+        follows.
+        """
+        return self.document().index(index_class)
+
+    def has_document(self):
+        """Return True if the whole document is in memory (backends that load lazily may say False)."""
+        return True
+
+    def disk_bytes(self):
+        """Return the bytes of this backend's files on disk (the store pool's size measure)."""
+        return file_size(self.data_file)
+
+    def close(self):
+        """Write out anything kept only in memory; called when the store pool evicts this backend.
+
+        The backend may still be used afterwards by requests that already
+        hold it.
+        """
+
+    def load(self):
+        """Return the whole document as plain dicts and lists (shared, read-only)."""
+        return self.document().to_dict()
+
+    def replace(self, data):
+        """Replace the whole stored document with `data`."""
+        raise NotImplementedError
+
+    def apply_many(self, entries):
+        """Persist mutation entries in one write and return their `Document.apply` results."""
+        raise NotImplementedError
+
+    def apply(self, entry):
+        """Persist one mutation entry and return the `Document.apply` result.
+
+        With a `batch_window`, the first writer waits that long and then
+        flushes every entry that arrived meanwhile in a single `apply_many`
+        call; the other writers block until that flush is done.
+        """
+        if not self.batch_window:
+            return self.apply_many([entry])[0]
+
+        with self._batch_lock:
+            batch = self._open_batch
+            is_leader = batch is None
+            if is_leader:
+                batch = self._open_batch = _Batch()
+            index = len(batch.entries)
+            batch.entries.append(entry)
+
+        if is_leader:
+            time.sleep(self.batch_window)
+            with self._batch_lock:
+                self._open_batch = None
+            try:
+                batch.results = self.apply_many(batch.entries)
+            except Exception as e:
+                batch.error = e
+            batch.done.set()
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+        return batch.results[index]
+
+    def list_records(self, collection):
+        return self.document().records(collection)
+
+    def get_record(self, collection, record_id):
+        return self.document().get(collection, record_id)
+
+    def iter_records(self, collection, field=None, start=None, end=None, **equals):
+        """Return an iterator over the records `find_records` or `query_range` would return.
+
+        The records are read now but filtered as the iterator is consumed,
+        so a caller streaming them never holds the result as a list.
+        Backends that answer queries themselves return their results.
+
+        Args:
+            field: Field `start` and `end` apply to (None for no window).
+        """
+        records = self.list_records(collection)
+        return (r for r in records
+                if (field is None or _in_range(r.get(field), start, end))
+                and all(r.get(k) == v for k, v in equals.items()))
+
+    def find_records(self, collection, **equals):
+        """Return records whose fields equal the given values, in stored order."""
+        return list(self.iter_records(collection, **equals))
+
+    def query_range(self, collection, field, start=None, end=None, **equals):
+        """Return records with `start <= record[field] < end`, in stored order.
+
+        Either bound may be None. Extra keyword arguments are equality filters.
+        """
+        return list(self.iter_records(collection, field, start, end, **equals))
+
+    def query_prefix(self, collection, field, prefix, **equals):
+        """Return records whose string `field` starts with `prefix`."""
+        return self.query_range(collection, field, prefix, prefix + PREFIX_END, **equals)
@@ -0,0 +1,207 @@
+"""In-memory form of the data document, with an id index per collection."""
+
+import threading
+
+
+class Collection:
+    """The records of one collection in stored order, indexed by id.
+
+    Records live in a dict keyed by an increasing insertion key, which keeps
+    the stored order while making deletes O(1) without copying anything. A
+    second dict maps each record id to its insertion key, so lookups,
+    updates and deletes by id never scan the collection.
+    """
+
+    def __init__(self, records=()):
+        self._records = {}
+        self._keys_by_id = {}
+        # Extra insertion keys for ids that appear more than once (legacy data)
+        self._duplicate_keys = {}
+        self._next_key = 0
+        self._list = None
+        for record in records:
+            self.append(record)
+
+    def __len__(self):
+        return len(self._records)
+
+    def records(self):
+        """Return the records as a list (cached until the next update or delete)."""
+        if self._list is None:
+            self._list = list(self._records.values())
+        return self._list
+
+    def get(self, record_id):
+        key = self._keys_by_id.get(record_id)
+        return None if key is None else self._records[key]
+
+    def append(self, record):
+        key = self._next_key
+        self._next_key += 1
+        self._records[key] = record
+        self._index_add(record.get('id'), key)
+        if self._list is not None:
+            self._list.append(record)
+
+    def update(self, record_id, changes):
+        """Merge `changes` into the first record with `record_id` and return it (or None)."""
+        key = self._keys_by_id.get(record_id)
+        if key is None:
+            return None
+        record = {**self._records[key], **changes}
+        self._records[key] = record
+        if record.get('id') != record_id:
+            self._index_remove(record_id, key)
+            self._index_add(record.get('id'), key)
+        self._list = None
+        return record
+
+    def delete(self, record_id):
+        """Remove every record with `record_id`; return True if any was removed."""
+        return bool(self.pop(record_id))
+
+    def pop(self, record_id):
+        """Remove every record with `record_id` and return the removed records."""
+        key = self._keys_by_id.pop(record_id, None)
+        if key is None:
+            return []
+        removed = [self._records.pop(key)]
+        for extra in self._duplicate_keys.pop(record_id, ()):
+            removed.append(self._records.pop(extra))
+        self._list = None
+        return removed
+
+    def _index_add(self, record_id, key):
+        if record_id is None:
+            return
+        first = self._keys_by_id.get(record_id)
+        if first is None:
+            self._keys_by_id[record_id] = key
+            return
+        # Keep the earliest record as the one found by id
+        if key < first:
+            self._keys_by_id[record_id], key = key, first
+        self._duplicate_keys.setdefault(record_id, []).append(key)
+
+    def _index_remove(self, record_id, key):
+        extras = self._duplicate_keys.get(record_id)
+        if self._keys_by_id.get(record_id) == key:
+            if extras:
+                extras.sort()
+                self._keys_by_id[record_id] = extras.pop(0)
+            else:
+                del self._keys_by_id[record_id]
+        elif extras and key in extras:
+            extras.remove(key)
+        if extras == []:
+            del self._duplicate_keys[record_id]
+
+
+class DerivedIndex:
+    """Base class for data kept in sync with a document's collections.
+
+    Subclasses name the collections they follow in `collections`, build
+    themselves from the document in `__init__`, and receive every later
+    change through `on_change`. They are created on first use by
+    `Document.index` and dropped with the document when storage reloads.
+    """
+
+    collections = ()
+
+    def __init__(self, document):
+        self.document = document
+
+    def on_change(self, collection, old, new):
+        """Called after a change: `old` is None for inserts, `new` is None for deletes."""
+        raise NotImplementedError
+
+
+class Document:
+    """The data document, with each list-valued field held as a `Collection`."""
+
+    def __init__(self, data):
+        self._fields = {}
+        for name, value in data.items():
+            self._fields[name] = Collection(value) if isinstance(value, list) else value
+        self._dict = None
+        self._indexes = {}
+        # Held while changes are applied; index builds and index queries take
+        # it too, so they never see a change half-applied
+        self.lock = threading.RLock()
+
+    def index(self, index_class):
+        """Return the `index_class` instance for this document, building it on first use."""
+        index = self._indexes.get(index_class)
+        if index is None:
+            with self.lock:
+                index = self._indexes.get(index_class)
+                if index is None:
+                    index = self._indexes[index_class] = index_class(self)
+        return index
+
+    def collection(self, name):
+        """Return the `Collection` called `name`, creating it if needed."""
+        coll = self._fields.get(name)
+        if not isinstance(coll, Collection):
+            coll = self._fields[name] = Collection()
+            self._dict = None
+        return coll
+
+    def collection_names(self):
+        return [name for name, value in self._fields.items() if isinstance(value, Collection)]
+
+    def records(self, name):
+        coll = self._fields.get(name)
+        return coll.records() if isinstance(coll, Collection) else []
+
+    def get(self, name, record_id):
+        coll = self._fields.get(name)
+        return coll.get(record_id) if isinstance(coll, Collection) else None
+
+    def apply(self, entry):
+        """Apply a mutation entry in place.
+
+        Entries look like `{"op": "insert", "collection": "meals", "record": {...}}`,
+        `{"op": "update", "collection": ..., "id": ..., "changes": {...}}` or
+        `{"op": "delete", "collection": ..., "id": ...}`.
+
+        Returns the inserted or updated record, None when an update targets a
+        missing id, or a boolean telling whether a delete removed anything.
+        """
+        with self.lock:
+            name = entry['collection']
+            coll = self.collection(name)
+            op = entry['op']
+            if op == 'insert':
+                # Appends extend the cached record lists in place, so the
+                # cached dict view stays valid
+                coll.append(entry['record'])
+                self._notify(name, None, entry['record'])
+                return entry['record']
+            if op == 'update':
+                old = coll.get(entry['id'])
+                result = coll.update(entry['id'], entry['changes'])
+                if result is not None:
+                    self._notify(name, old, result)
+            elif op == 'delete':
+                removed = coll.pop(entry['id'])
+                for old in removed:
+                    self._notify(name, old, None)
+                result = bool(removed)
+            else:
+                raise ValueError('Unknown mutation operation: %s' % op)
+            if result:
+                self._dict = None
+            return result
+
+    def _notify(self, name, old, new):
+        for index in self._indexes.values():
+            if name in index.collections:
+                index.on_change(name, old, new)
+
+    def to_dict(self):
+        """Return the document as plain dicts and lists (shared, read-only)."""
+        if self._dict is None:
+            self._dict = {name: value.records() if isinstance(value, Collection) else value
+                          for name, value in self._fields.items()}
+        return self._dict
@@ -0,0 +1,95 @@
+"""File helpers shared by the file-based storage backends."""
+
+import logging
+import os
+import threading
+from datetime import datetime
+
+from backend.metrics import count_storage_bytes
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+logger = logging.getLogger('fridgy')
+
+
+def file_stamp(path):
+    """Return an identifier that changes whenever the file is rewritten, or None if missing."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def write_atomic(path, payload):
+    """Write `payload` (str or bytes) to a temp file and rename it over `path`.
+
+    Readers see either the old or the new file, never a partial one.
+    """
+    dirpath = os.path.dirname(path)
+    if dirpath and not os.path.exists(dirpath):
+        os.makedirs(dirpath, exist_ok=True)
+    tmp_path = '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+    mode = 'wb' if isinstance(payload, bytes) else 'w'
+    try:
+        with open(tmp_path, mode) as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+            count_storage_bytes('written', os.fstat(f.fileno()).st_size)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def quarantine(path):
+    """Move an unreadable data file aside so it can be inspected, and return its new path."""
+    target = '%s.corrupt-%s' % (path, datetime.now().strftime('%Y%m%d%H%M%S'))
+    os.replace(path, target)
+    logger.error('Data file %s could not be parsed; moved it to %s', path, target)
+    return target
+
+
+class FileLock:
+    """Exclusive advisory lock on `<path>.lock`, shared across processes.
+
+    Re-entrant within a thread. Uses `fcntl.flock` where available; on other
+    platforms it only serializes threads of the current process.
+    """
+
+    def __init__(self, path):
+        self.lock_file = path + '.lock'
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        try:
+            if self._depth == 0 and fcntl is not None:
+                dirpath = os.path.dirname(self.lock_file)
+                if dirpath and not os.path.exists(dirpath):
+                    os.makedirs(dirpath, exist_ok=True)
+                self._fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+        except BaseException:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+            self._lock.release()
+            raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            # Closing the descriptor releases the flock
+            os.close(self._fd)
+            self._fd = None
+        self._lock.release()
@@ -0,0 +1,252 @@
+"""Append-only journal storage: a JSON snapshot plus a write-ahead log.
+
+In journal mode the data file is a snapshot, and every mutation is appended
+as one compact JSON line to `<data file>.wal`. Loading replays the log on top
+of the snapshot. Once enough entries pile up, a background compaction folds
+the log back into the snapshot.
+
+Every entry carries a sequence number, and the snapshot records the last
+sequence number it contains, so replaying an entry twice is harmless.
+Sequence numbers are assigned under a cross-process file lock, so several
+worker processes can share one journal.
+"""
+
+import logging
+import os
+import threading
+
+from backend.metrics import count_storage_bytes
+from backend.storage.base import Storage, empty_document, file_size, working_copy
+from backend.storage.document import Document
+from backend.storage.files import FileLock, file_stamp, quarantine, write_atomic
+from backend.storage.serialization import decode_snapshot, dumps, encode_snapshot, loads
+
+logger = logging.getLogger('fridgy')
+
+# Number of log entries after which a background compaction is started
+COMPACT_EVERY = 1000
+
+# Key under which the snapshot stores the last folded sequence number
+SEQUENCE_KEY = 'journalSequence'
+
+
+class JournalStorage(Storage):
+    """Snapshot plus write-ahead log for one data file."""
+
+    def __init__(self, data_file, default_data):
+        super().__init__(data_file, default_data)
+        self.log_file = data_file + '.wal'
+        self._lock = threading.RLock()
+        self._file_lock = FileLock(data_file)
+        self._document = None
+        self._snapshot_stamp = None
+        self._log_ino = None
+        self._log_offset = 0
+        self._sequence = 0
+        self._pending = 0
+        self._is_compacting = False
+
+    def document(self):
+        """Return the current document, replaying any new log entries."""
+        with self._lock:
+            self._refresh()
+            return self._document
+
+    def version(self):
+        """Return the snapshot and log file stamps (compactions change it too)."""
+        if file_stamp(self.data_file) is None:
+            self.document()
+        return file_stamp(self.data_file), file_stamp(self.log_file)
+
+    def apply_many(self, entries):
+        """Durably log mutation entries with one write and fsync, then apply them in memory."""
+        with self._lock, self._file_lock:
+            self._refresh()
+            logged = []
+            for entry in entries:
+                logged.append(dict(entry, seq=self._sequence + len(logged) + 1))
+            payload = ''.join(dumps(e) + '\n' for e in logged)
+            fd = os.open(self.log_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                encoded = payload.encode('utf-8')
+                os.write(fd, encoded)
+                count_storage_bytes('written', len(encoded))
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            # The log offset is left alone: the next refresh re-reads these
+            # lines and skips them by sequence number.
+            results = [self._document.apply(e) for e in logged]
+            self._sequence = logged[-1]['seq']
+            self._pending += len(logged)
+            if self._pending >= COMPACT_EVERY and not self._is_compacting:
+                self._is_compacting = True
+                threading.Thread(target=self._compact_in_background, daemon=True).start()
+            return results
+
+    def replace(self, data):
+        """Replace the whole document with `data` (used by `save_data`)."""
+        with self._lock, self._file_lock:
+            self._refresh()
+            self._write_snapshot(data, self._sequence)
+            self._rewrite_log(self._sequence)
+            self._document = Document(data)
+
+    def disk_bytes(self):
+        return file_size(self.data_file) + file_size(self.log_file)
+
+    def close(self):
+        """Fold the log into the snapshot, so an idle data file is one file again."""
+        if self._pending and not self._is_compacting:
+            self.compact()
+
+    def compact(self):
+        """Fold the log into a new snapshot.
+
+        The snapshot is serialized outside the locks so writers are only
+        blocked while it is written and the log is trimmed. If another
+        compaction (in this or another process) replaced the snapshot with
+        a newer one meanwhile, this one is dropped instead of overwriting it.
+        """
+        with self._lock:
+            self._refresh()
+            snapshot = working_copy(self._document.to_dict())
+            sequence = self._sequence
+            stamp = self._snapshot_stamp
+        snapshot[SEQUENCE_KEY] = sequence
+        payload = encode_snapshot(snapshot, self.snapshot_format)
+        with self._lock, self._file_lock:
+            if file_stamp(self.data_file) != stamp and self._snapshot_sequence() >= sequence:
+                return
+            write_atomic(self.data_file, payload)
+            self._snapshot_stamp = file_stamp(self.data_file)
+            self._rewrite_log(sequence)
+
+    def _snapshot_sequence(self):
+        """Return the sequence number recorded in the snapshot on disk (0 if unreadable)."""
+        try:
+            with open(self.data_file, 'rb') as f:
+                raw = f.read()
+            count_storage_bytes('read', len(raw))
+            return decode_snapshot(raw).get(SEQUENCE_KEY, 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _compact_in_background(self):
+        try:
+            self.compact()
+        except Exception:
+            logger.exception('Journal compaction failed for %s', self.data_file)
+        finally:
+            self._is_compacting = False
+
+    def _write_snapshot(self, data, sequence):
+        snapshot = dict(data)
+        snapshot[SEQUENCE_KEY] = sequence
+        write_atomic(self.data_file, encode_snapshot(snapshot, self.snapshot_format))
+        with self._lock:
+            self._snapshot_stamp = file_stamp(self.data_file)
+
+    def _rewrite_log(self, sequence):
+        """Drop log entries already folded into the snapshot (caller holds the locks)."""
+        kept = [e for e in self._read_log(0)[0] if e['seq'] > sequence]
+        write_atomic(self.log_file, ''.join(
+            dumps(e) + '\n' for e in kept))
+        self._log_ino = file_stamp(self.log_file)[0]
+        self._log_offset = 0
+        self._pending = len(kept)
+
+    def _refresh(self):
+        """Bring the in-memory document up to date with the files on disk."""
+        stamp = file_stamp(self.data_file)
+        if self._document is None or stamp != self._snapshot_stamp:
+            self._load_snapshot()
+            self._snapshot_stamp = file_stamp(self.data_file)
+            self._log_ino = None
+            self._log_offset = 0
+
+        log_stamp = file_stamp(self.log_file)
+        if log_stamp is None:
+            return
+        if log_stamp[0] != self._log_ino or log_stamp[2] < self._log_offset:
+            # The log was replaced by a compaction; start from its beginning
+            self._log_ino = log_stamp[0]
+            self._log_offset = 0
+        if log_stamp[2] == self._log_offset:
+            return
+        entries, self._log_offset = self._read_log(self._log_offset)
+        for entry in entries:
+            if entry['seq'] > self._sequence:
+                self._document.apply(entry)
+                self._sequence = entry['seq']
+                self._pending += 1
+
+    def _load_snapshot(self):
+        with self._file_lock:
+            if not os.path.exists(self.data_file):
+                data = self._default_data()
+                self._write_snapshot(data, 0)
+            else:
+                try:
+                    with open(self.data_file, 'rb') as f:
+                        raw = f.read()
+                    count_storage_bytes('read', len(raw))
+                    data = decode_snapshot(raw)
+                except ValueError:
+                    # Keep the unreadable snapshot for inspection; the log is
+                    # replayed on top of an empty document
+                    quarantine(self.data_file)
+                    data = empty_document()
+                    self._write_snapshot(data, 0)
+        self._sequence = data.pop(SEQUENCE_KEY, 0)
+        data.setdefault('steps', [])
+        self._document = Document(data)
+        self._pending = 0
+
+    def _read_log(self, offset):
+        return read_log(self.log_file, offset)
+
+
+def read_log(log_file, offset=0):
+    """Return complete log entries from `offset` and the offset after them.
+
+    A trailing line without a newline is a write still in progress (or
+    torn by a crash) and is left for a later read.
+    """
+    try:
+        with open(log_file, 'rb') as f:
+            f.seek(offset)
+            chunk = f.read()
+    except FileNotFoundError:
+        return [], 0
+    count_storage_bytes('read', len(chunk))
+    end = chunk.rfind(b'\n') + 1
+    entries = [loads(line) for line in chunk[:end].splitlines() if line.strip()]
+    return entries, offset + end
+
+
+def read_journal(data_file):
+    """Return the data of a snapshot with its log replayed, without writing anything.
+
+    For copying the data elsewhere. Unlike loading through `JournalStorage`,
+    nothing is created, quarantined or compacted: a missing or unreadable
+    snapshot raises (FileNotFoundError, ValueError).
+    """
+    while True:
+        stamp = file_stamp(data_file)
+        with open(data_file, 'rb') as f:
+            raw = f.read()
+        count_storage_bytes('read', len(raw))
+        data = decode_snapshot(raw)
+        entries, _ = read_log(data_file + '.wal')
+        # A compaction in between may have dropped entries now in a newer snapshot
+        if file_stamp(data_file) == stamp:
+            break
+    sequence = data.pop(SEQUENCE_KEY, 0)
+    data.setdefault('steps', [])
+    document = Document(data)
+    for entry in entries:
+        if entry['seq'] > sequence:
+            document.apply(entry)
+            sequence = entry['seq']
+    return document.to_dict()
@@ -0,0 +1,114 @@
+"""Single JSON file storage, cached in memory between changes."""
+
+import os
+import threading
+
+from backend.metrics import count_storage_bytes
+from backend.storage.base import Storage, empty_document
+from backend.storage.document import Document
+from backend.storage.files import FileLock, file_stamp, quarantine, write_atomic
+from backend.storage.serialization import decode_snapshot, encode_snapshot
+
+
+class JsonStorage(Storage):
+    """The whole document in one JSON file, rewritten on every change.
+
+    The parsed document is kept in memory and revalidated against the file's
+    inode, mtime and size on every load, so edits made outside this process
+    are still picked up. Writes hold a cross-process lock for the whole
+    read-modify-write cycle and replace the file atomically.
+    """
+
+    def __init__(self, data_file, default_data):
+        super().__init__(data_file, default_data)
+        self._lock = threading.RLock()
+        self._file_lock = FileLock(data_file)
+        # (stamp, Document) of the last version read or written
+        self._cached = (None, None)
+
+    def document(self):
+        # A file that does not parse is recovered by `_refresh`; other errors
+        # (no codec for the snapshot format, permissions) propagate rather
+        # than being served as an empty document
+        stamp, document = self._cached
+        if document is not None and stamp == file_stamp(self.data_file):
+            return document
+        return self._refresh()
+
+    def version(self):
+        stamp = file_stamp(self.data_file)
+        if stamp is None:
+            # Creates the file with the default data
+            self.document()
+            stamp = file_stamp(self.data_file)
+        return stamp
+
+    def _refresh(self):
+        """Re-read the data file if it changed.
+
+        Holding the lock means concurrent requests that notice the same
+        change wait for one parse instead of each parsing the file.
+        """
+        with self._lock:
+            stamp, document = self._cached
+            current = file_stamp(self.data_file)
+            if document is not None and stamp == current:
+                return document
+            if current is None:
+                with self._file_lock:
+                    if file_stamp(self.data_file) is None:
+                        self._write(Document(self._default_data()))
+                        return self._cached[1]
+            try:
+                stamp, data = self._read()
+            except ValueError:
+                return self._recover()
+            data.setdefault('steps', [])
+            self._cached = (stamp, Document(data))
+            return self._cached[1]
+
+    def _read(self):
+        with open(self.data_file, 'rb') as f:
+            st = os.fstat(f.fileno())
+            raw = f.read()
+        count_storage_bytes('read', len(raw))
+        return (st.st_ino, st.st_mtime_ns, st.st_size), decode_snapshot(raw)
+
+    def _recover(self):
+        """Handle a data file that does not parse.
+
+        Writes are atomic, so this is real corruption rather than a torn
+        write. The file is re-read under the write lock in case a writer
+        just replaced it, and otherwise moved aside (never overwritten)
+        before starting from an empty document.
+        """
+        with self._file_lock:
+            try:
+                stamp, data = self._read()
+                self._cached = (stamp, Document(data))
+            except ValueError:
+                quarantine(self.data_file)
+                self._write(Document(empty_document()))
+            return self._cached[1]
+
+    def _write(self, document):
+        """Atomically write `document` and cache it (caller holds the file lock)."""
+        try:
+            write_atomic(self.data_file, encode_snapshot(document.to_dict(), self.snapshot_format))
+        except Exception:
+            # The in-memory document may hold changes the file does not
+            self._cached = (None, None)
+            raise
+        self._cached = (file_stamp(self.data_file), document)
+
+    def replace(self, data):
+        with self._lock, self._file_lock:
+            self._write(Document(data))
+
+    def apply_many(self, entries):
+        with self._lock, self._file_lock:
+            document = self._refresh()
+            results = [document.apply(entry) for entry in entries]
+            if any(results):
+                self._write(document)
+            return results
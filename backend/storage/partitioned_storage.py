@@ -0,0 +1,468 @@
+"""Partitioned storage: one file per collection, and per month for time series.
+
+Files live in a directory next to the data file (`food_data.parts/` for
+`food_data.json`):
+
+    manifest.json          version, collection names, partition generations
+    foods.json             one file per collection...
+    meals/2024-05.json     ...except meals, steps and healthMetrics, which
+    meals/undated.json     get one file per month of their `date`
+
+A write rewrites only the partitions its records belong to, then the
+manifest. Partitions are read lazily: date-window queries on a time series
+read only the months they cover, so the day view of /api/nutrition/daily
+opens one small file, and an insert reads only the partition of its record
+(an update or delete by id searches its collection's months, newest
+first). Derived indexes load just the collections they follow into the
+in-memory document; the rest is loaded when something needs the whole
+document. Once loaded, another process's writes are picked up by
+re-reading just the partitions whose generation changed in the manifest.
+
+Each file is replaced atomically, but a write touching several partitions
+is not atomic as a whole. The first use in a directory without a manifest
+splits the existing data file (and its journal, if any) into partitions.
+"""
+
+import logging
+import os
+import re
+import threading
+
+from backend.metrics import count_storage_bytes
+from backend.storage.base import PREFIX_END, Storage, _in_range, file_size
+from backend.storage.document import DerivedIndex, Document
+from backend.storage.files import FileLock, file_stamp, write_atomic
+from backend.storage.serialization import decode_snapshot, encode_snapshot
+
+logger = logging.getLogger('fridgy')
+
+# Collections split into one partition per month of `date`
+TIME_SERIES = ('meals', 'steps', 'healthMetrics')
+
+UNDATED = 'undated'
+
+_MONTH = re.compile(r'\d{4}-\d{2}')
+
+
+def partition_key(collection, record):
+    """Return the partition a record belongs to, e.g. 'foods' or 'meals/2024-05'."""
+    if collection not in TIME_SERIES:
+        return collection
+    date = record.get('date')
+    if isinstance(date, str) and _MONTH.match(date):
+        return '%s/%s' % (collection, date[:7])
+    return '%s/%s' % (collection, UNDATED)
+
+
+def _collection_of(key):
+    return key.split('/', 1)[0]
+
+
+def _month_overlaps(key, start, end):
+    """Return True if partition `key` may hold dates in `[start, end)`."""
+    month = key.split('/', 1)[1]
+    if month == UNDATED:
+        return True
+    return (start is None or start < month + PREFIX_END) and (end is None or month < end)
+
+
+class _AnyCollection:
+    def __contains__(self, name):
+        return True
+
+
+class PartitionTracker(DerivedIndex):
+    """Keeps the records of each partition in stored order and notes which changed.
+
+    Each partition maps an increasing slot number to a record, and each
+    record (by identity) maps to its partition and slot, so a change finds
+    its place without scanning.
+    """
+
+    collections = _AnyCollection()
+
+    def __init__(self, document):
+        super().__init__(document)
+        self.partitions = {}
+        self.dirty = set()
+        self._slots = {}
+        self._next_slot = 0
+        for name in document.collection_names():
+            self.add(name, document.records(name))
+
+    def add(self, collection, records):
+        """Track `records` of a collection just loaded into the document."""
+        for record in records:
+            self._append(partition_key(collection, record), record)
+
+    def _append(self, key, record):
+        self.partitions.setdefault(key, {})[self._next_slot] = record
+        self._slots[id(record)] = (key, self._next_slot)
+        self._next_slot += 1
+
+    def on_change(self, collection, old, new):
+        if old is not None:
+            key, slot = self._slots.pop(id(old))
+            self.dirty.add(key)
+            if new is not None and partition_key(collection, new) == key:
+                # Same partition: keep the record where it was
+                self.partitions[key][slot] = new
+                self._slots[id(new)] = (key, slot)
+                return
+            del self.partitions[key][slot]
+        if new is not None:
+            key = partition_key(collection, new)
+            self._append(key, new)
+            self.dirty.add(key)
+
+    def records(self, key):
+        return list(self.partitions.get(key, {}).values())
+
+
+class _PartitionEdits:
+    """Working copies of the partitions changed by one `apply_many` call.
+
+    A partition is copied once, on first use, into slot -> record with an
+    id -> slots map, so each entry then costs O(1) however many of them
+    touch the same partition. The stored partition lists are replaced, not
+    modified, since readers may hold them.
+    """
+
+    def __init__(self, read):
+        # Partition key -> records as stored
+        self._read = read
+        self._records = {}
+        self._ids = {}
+        self._next_slot = 0
+        self._changed = set()
+
+    def _open(self, key):
+        if key not in self._records:
+            self._records[key], self._ids[key] = {}, {}
+            for record in self._read(key):
+                self._add(key, record)
+
+    def _add(self, key, record):
+        slot = self._next_slot
+        self._next_slot += 1
+        self._records[key][slot] = record
+        self._ids[key].setdefault(record.get('id'), []).append(slot)
+
+    def has(self, key, record_id):
+        self._open(key)
+        return bool(self._ids[key].get(record_id))
+
+    def insert(self, key, record):
+        self._open(key)
+        self._add(key, record)
+        self._changed.add(key)
+
+    def update(self, collection, key, record_id, changes):
+        """Merge `changes` into the first record with `record_id` in `key`; return it."""
+        ids = self._ids[key]
+        slots = ids[record_id]
+        slot = slots.pop(0)
+        if not slots:
+            del ids[record_id]
+        record = {**self._records[key][slot], **changes}
+        new_key = partition_key(collection, record)
+        self._changed.add(key)
+        if new_key == key:
+            # Same partition: keep the record where it was
+            self._records[key][slot] = record
+            ids.setdefault(record.get('id'), []).append(slot)
+            ids[record.get('id')].sort()
+        else:
+            del self._records[key][slot]
+            self.insert(new_key, record)
+        return record
+
+    def delete(self, key, record_id):
+        """Remove every record with `record_id` from `key`."""
+        for slot in self._ids[key].pop(record_id):
+            del self._records[key][slot]
+        self._changed.add(key)
+
+    def changed_partitions(self):
+        """Return `{key: records}` of the partitions changed."""
+        return {key: list(self._records[key].values()) for key in self._changed}
+
+
+class PartitionedStorage(Storage):
+    """Collections split over several files, loaded lazily."""
+
+    def __init__(self, data_file, default_data):
+        super().__init__(data_file, default_data)
+        self.directory = os.path.splitext(data_file)[0] + '.parts'
+        self.manifest_file = os.path.join(self.directory, 'manifest.json')
+        self._lock = threading.RLock()
+        self._file_lock = FileLock(self.manifest_file)
+        self._manifest = None
+        self._manifest_stamp = None
+        # Partition key -> records, for partitions of collections not in the document
+        self._partitions = {}
+        # Holds the collections in `_loaded`, or all of them once `_complete`
+        self._document = None
+        self._loaded = set()
+        self._complete = False
+
+    def _path(self, key):
+        return os.path.join(self.directory, *key.split('/')) + '.json'
+
+    # -- reading -------------------------------------------------------
+
+    def _refresh(self):
+        """Re-read the manifest if it changed and forget partitions rewritten since (caller holds the lock)."""
+        stamp = file_stamp(self.manifest_file)
+        if stamp is None:
+            with self._file_lock:
+                if file_stamp(self.manifest_file) is None:
+                    self._initialize()
+            stamp = file_stamp(self.manifest_file)
+        if stamp == self._manifest_stamp:
+            return
+        with open(self.manifest_file, 'rb') as f:
+            raw = f.read()
+        count_storage_bytes('read', len(raw))
+        manifest = decode_snapshot(raw)
+
+        previous = self._manifest['partitions'] if self._manifest else {}
+        if self._document is not None:
+            # Keep the partitions that did not change; the document is rebuilt from them
+            tracker = self._document.index(PartitionTracker)
+            self._partitions.update((key, tracker.records(key)) for key in tracker.partitions)
+            self._forget_document()
+        for key in list(self._partitions):
+            if manifest['partitions'].get(key) != previous.get(key):
+                del self._partitions[key]
+        self._manifest, self._manifest_stamp = manifest, stamp
+
+    def _forget_document(self):
+        self._document = None
+        self._loaded = set()
+        self._complete = False
+
+    def _partition(self, key):
+        records = self._partitions.get(key)
+        if records is None:
+            try:
+                with open(self._path(key), 'rb') as f:
+                    raw = f.read()
+                count_storage_bytes('read', len(raw))
+                records = decode_snapshot(raw)
+            except FileNotFoundError:
+                records = []
+            self._partitions[key] = records
+        return records
+
+    def _keys(self, collection):
+        """Return the partition keys of `collection` in stored order (months ascending)."""
+        return sorted(k for k in self._manifest['partitions'] if _collection_of(k) == collection)
+
+    def _load(self, collections):
+        """Load every partition of `collections` into the document (caller holds the lock)."""
+        self._refresh()
+        if self._document is None:
+            self._document = Document(dict(self._manifest.get('fields', {})))
+            # The tracker holds the partition lists of the loaded collections
+            self._document.index(PartitionTracker)
+        tracker = self._document.index(PartitionTracker)
+        for name in collections:
+            if name in self._loaded:
+                continue
+            keys = self._keys(name)
+            records = [r for key in keys for r in self._partition(key)]
+            collection = self._document.collection(name)
+            for record in records:
+                collection.append(record)
+            tracker.add(name, records)
+            for key in keys:
+                self._partitions.pop(key, None)
+            self._loaded.add(name)
+        return self._document
+
+    def _is_loaded(self, collection):
+        return self._complete or collection in self._loaded
+
+    def has_document(self):
+        return self._complete
+
+    def document(self):
+        with self._lock:
+            self._refresh()
+            if not self._complete:
+                self._load(self._manifest['collections'])
+                self._complete = True
+            return self._document
+
+    def index(self, index_class):
+        """Build indexes from the collections they follow only, without loading the rest."""
+        collections = index_class.collections
+        if not isinstance(collections, (tuple, list)):
+            return super().index(index_class)
+        with self._lock:
+            return self._load(collections).index(index_class)
+
+    def disk_bytes(self):
+        with self._lock:
+            if self._manifest is None:
+                return 0
+            return file_size(self.manifest_file) + sum(file_size(self._path(k)) for k in self._manifest['partitions'])
+
+    def version(self):
+        stamp = file_stamp(self.manifest_file)
+        if stamp is None:
+            self.document()
+            stamp = file_stamp(self.manifest_file)
+        return stamp
+
+    def list_records(self, collection):
+        with self._lock:
+            self._refresh()
+            if self._is_loaded(collection):
+                return self._document.records(collection)
+            return [r for key in self._keys(collection) for r in self._partition(key)]
+
+    def get_record(self, collection, record_id):
+        with self._lock:
+            self._refresh()
+            if self._is_loaded(collection):
+                return self._document.get(collection, record_id)
+            return next((r for r in self.list_records(collection) if r.get('id') == record_id), None)
+
+    def iter_records(self, collection, field=None, start=None, end=None, **equals):
+        with self._lock:
+            self._refresh()
+            if not self._is_loaded(collection) and field == 'date' and collection in TIME_SERIES:
+                return iter(self.query_range(collection, field, start, end, **equals))
+            return super().iter_records(collection, field, start, end, **equals)
+
+    def query_range(self, collection, field, start=None, end=None, **equals):
+        """Read only the months covering the window while the collection is not loaded."""
+        with self._lock:
+            self._refresh()
+            if self._is_loaded(collection) or field != 'date' or collection not in TIME_SERIES:
+                return super().query_range(collection, field, start, end, **equals)
+            records = []
+            for key in self._keys(collection):
+                if not _month_overlaps(key, start, end):
+                    continue
+                records.extend(r for r in self._partition(key)
+                               if _in_range(r.get(field), start, end)
+                               and all(r.get(k) == v for k, v in equals.items()))
+            return records
+
+    # -- writing -------------------------------------------------------
+
+    def _initialize(self):
+        """Create the partitions from the existing data file, or the default data (caller holds the file lock)."""
+        if os.path.exists(self.data_file):
+            # Read-only: the source and its journal are left as they are
+            from backend.storage.journal_storage import read_journal
+            data = read_journal(self.data_file)
+            logger.info('Splitting %s into partitions in %s', self.data_file, self.directory)
+        else:
+            data = self._default_data()
+        self._write_all(data)
+
+    def _write_all(self, data):
+        # Generations are manifest versions, so a partition never gets an old one back
+        version = (self._manifest or {}).get('version', 0) + 1
+        collections = [name for name, value in data.items() if isinstance(value, list)]
+        partitions = {}
+        for name in collections:
+            for record in data[name]:
+                partitions.setdefault(partition_key(name, record), []).append(record)
+        for key, records in partitions.items():
+            write_atomic(self._path(key), encode_snapshot(records, self.snapshot_format))
+        # Remove partitions the new data no longer has
+        if self._manifest:
+            for key in self._manifest['partitions']:
+                if key not in partitions and os.path.exists(self._path(key)):
+                    os.remove(self._path(key))
+        self._write_manifest({
+            "version": version,
+            "collections": collections,
+            "fields": {k: v for k, v in data.items() if not isinstance(v, list)},
+            "partitions": dict.fromkeys(partitions, version),
+        })
+
+    def _write_manifest(self, manifest):
+        write_atomic(self.manifest_file, encode_snapshot(manifest, 'compact'))
+        self._manifest, self._manifest_stamp = manifest, file_stamp(self.manifest_file)
+
+    def replace(self, data):
+        with self._lock, self._file_lock:
+            self._refresh()
+            self._forget_document()
+            self._partitions = {}
+            self._write_all(data)
+
+    def apply_many(self, entries):
+        """Apply mutation entries and rewrite only the partitions they changed.
+
+        Entries for collections in the document are applied to it. The
+        others change the partitions directly, reading only the ones they
+        touch.
+        """
+        with self._lock, self._file_lock:
+            self._refresh()
+            try:
+                results = []
+                edits = _PartitionEdits(self._partition)
+                for entry in entries:
+                    if self._is_loaded(entry['collection']):
+                        results.append(self._document.apply(entry))
+                    else:
+                        results.append(self._apply_to_partitions(entry, edits))
+                changed = edits.changed_partitions()
+                self._partitions.update(changed)
+                if self._document is not None:
+                    tracker = self._document.index(PartitionTracker)
+                    dirty, tracker.dirty = tracker.dirty, set()
+                    changed.update((key, tracker.records(key)) for key in dirty)
+                if changed:
+                    self._write_partitions(changed)
+            except Exception:
+                # Memory may hold changes the files do not; reload on next use
+                self._forget_document()
+                self._partitions = {}
+                self._manifest_stamp = None
+                raise
+            return results
+
+    def _apply_to_partitions(self, entry, edits):
+        """Apply an entry for a collection not in the document to `edits` (a `_PartitionEdits`)."""
+        name, op = entry['collection'], entry['op']
+        if op == 'insert':
+            edits.insert(partition_key(name, entry['record']), entry['record'])
+            return entry['record']
+        if op not in ('update', 'delete'):
+            raise ValueError('Unknown mutation operation: %s' % op)
+        # Recent records change most, so search the newest months first
+        for key in reversed(self._keys(name)):
+            if not edits.has(key, entry['id']):
+                continue
+            if op == 'delete':
+                edits.delete(key, entry['id'])
+                return True
+            return edits.update(name, key, entry['id'], entry['changes'])
+        return False if op == 'delete' else None
+
+    def _write_partitions(self, partitions):
+        """Write `{key: records}` (removing empty partitions) and the manifest."""
+        manifest = dict(self._manifest, partitions=dict(self._manifest['partitions']))
+        manifest['version'] = manifest.get('version', 0) + 1
+        collections = list(manifest['collections'])
+        for key, records in sorted(partitions.items()):
+            if records:
+                write_atomic(self._path(key), encode_snapshot(records, self.snapshot_format))
+                manifest['partitions'][key] = manifest['version']
+            else:
+                manifest['partitions'].pop(key, None)
+                if os.path.exists(self._path(key)):
+                    os.remove(self._path(key))
+            if _collection_of(key) not in collections:
+                collections.append(_collection_of(key))
+        manifest['collections'] = collections
+        self._write_manifest(manifest)
@@ -0,0 +1,126 @@
+"""Bounded pool of storage backends, one per data file.
+
+Each backend keeps its data file's parsed document and derived indexes in
+memory, so with one data file per household only the recently used ones
+should stay resident. The pool is an LRU bounded by the number of backends
+and by their total size, measured as the bytes of their files on disk (a
+proxy for the parsed data, which is a small multiple of it). Evicted
+backends are closed, which folds any journal into its snapshot; the next
+request for that data file opens it again.
+
+The pool lock is only held to look up, insert and unlink entries. Loading,
+reading and writing go through each backend's own locks, so one
+household's slow load or write never holds up another's.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger('fridgy')
+
+# Seconds between re-measuring a resident backend's size
+SIZE_REFRESH_SECONDS = 5.0
+
+
+class _Entry:
+    __slots__ = ('storage', 'size', 'measured')
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.size = 0
+        self.measured = 0.0
+
+
+class StorePool:
+    """Thread-safe LRU of storage backends keyed by (storage mode, data file)."""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, create, max_entries=0, max_bytes=0):
+        """Return the backend for `key`, creating it with `create()` on a miss.
+
+        Args:
+            key: `(storage mode, data file)`.
+            create: Returns a new backend for `key`.
+            max_entries: Most backends kept resident (0 for no limit).
+            max_bytes: Most total bytes kept resident (0 for no limit). The
+                backend being returned is never evicted, even if it alone
+                exceeds the limit.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            else:
+                self.misses += 1
+        if entry is None:
+            # Backends may touch disk when created; do it outside the pool lock
+            created = _Entry(create())
+            with self._lock:
+                entry = self._entries.setdefault(key, created)
+                self._entries.move_to_end(key)
+
+        now = time.monotonic()
+        if now - entry.measured >= SIZE_REFRESH_SECONDS:
+            entry.measured = now
+            entry.size = entry.storage.disk_bytes()
+        evicted = self._evict(key, max_entries, max_bytes)
+        for storage in evicted:
+            self._close(storage)
+        return entry.storage
+
+    def _evict(self, keep, max_entries, max_bytes):
+        evicted = []
+        with self._lock:
+            total = sum(e.size for e in self._entries.values())
+            for key in list(self._entries):
+                over_count = max_entries and len(self._entries) > max_entries
+                over_bytes = max_bytes and total > max_bytes
+                if not (over_count or over_bytes):
+                    break
+                if key == keep:
+                    continue
+                entry = self._entries.pop(key)
+                total -= entry.size
+                self.evictions += 1
+                evicted.append(entry.storage)
+        return evicted
+
+    def _close(self, storage):
+        try:
+            storage.close()
+        except Exception:
+            logger.exception('Could not close evicted storage for %s', storage.data_file)
+
+    def residents(self):
+        """Return the resident backends, least recently used first (not counted as a use)."""
+        with self._lock:
+            return [entry.storage for entry in self._entries.values()]
+
+    def discard(self, match=None):
+        """Drop (without closing) the backends whose key satisfies `match(key)`, or all of them."""
+        with self._lock:
+            for key in list(self._entries):
+                if match is None or match(key):
+                    del self._entries[key]
+
+    def stats(self):
+        """Return residency and hit-rate counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "resident": len(self._entries),
+                "residentBytes": sum(e.size for e in self._entries.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hitRate": self.hits / lookups if lookups else None,
+            }
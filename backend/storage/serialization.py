@@ -0,0 +1,147 @@
+"""Encoding of data files, journal lines and SQLite documents.
+
+JSON goes through orjson when it is installed and the standard library
+otherwise; both read each other's output. Snapshots (the JSON data file, or
+the journal's snapshot) can be written in one of `FORMATS`:
+
+- `json`: indented JSON, as the app always wrote it (the default)
+- `compact`: JSON without whitespace, about half the size
+- `msgpack`: MessagePack after a `MSGPACK_MAGIC` header (needs `msgpack`)
+
+The format of an existing file is detected from its first bytes, so
+switching `FRIDGY_SNAPSHOT_FORMAT` needs no migration: files are rewritten in
+the new format on the next write, or right away with
+
+    python -m backend.storage.serialization convert food_data.json --format msgpack
+
+API responses are encoded by Flask's JSON provider and do not change.
+"""
+
+import argparse
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+FORMATS = ('json', 'compact', 'msgpack')
+
+# First bytes of a MessagePack snapshot; JSON files never start with them
+MSGPACK_MAGIC = b'\x00FRIDGY-MSGPACK-1\n'
+
+JSON_LIBRARY = 'orjson' if orjson is not None else 'json'
+
+
+def loads(data):
+    """Parse JSON from str or bytes. Raises ValueError on invalid input."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj):
+    """Return `obj` as compact JSON text."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj).decode('utf-8')
+        except TypeError:
+            # Values orjson rejects (e.g. integers above 64 bits)
+            pass
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False)
+
+
+def _json_bytes(obj, indent):
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+        except TypeError:
+            pass
+    if indent:
+        return json.dumps(obj, indent=2, ensure_ascii=False).encode('utf-8')
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def encode_snapshot(data, fmt='json'):
+    """Return the bytes of a snapshot of `data` in format `fmt`."""
+    if fmt == 'json':
+        return _json_bytes(data, indent=True)
+    if fmt == 'compact':
+        return _json_bytes(data, indent=False)
+    if fmt == 'msgpack':
+        if msgpack is None:
+            raise RuntimeError("The 'msgpack' snapshot format needs the msgpack package "
+                               "(pip install msgpack)")
+        return MSGPACK_MAGIC + msgpack.packb(data, use_bin_type=True)
+    raise ValueError('Unknown snapshot format: %r (expected one of %s)' % (fmt, ', '.join(FORMATS)))
+
+
+def detect_format(raw):
+    """Return 'msgpack' or 'json' (indented or not) for snapshot bytes."""
+    return 'msgpack' if raw.startswith(MSGPACK_MAGIC) else 'json'
+
+
+def decode_snapshot(raw):
+    """Parse snapshot bytes in any of `FORMATS`. Raises ValueError if they do not parse."""
+    if detect_format(raw) == 'msgpack':
+        if msgpack is None:
+            raise RuntimeError('The data file is a MessagePack snapshot; install msgpack to read it')
+        try:
+            return msgpack.unpackb(raw[len(MSGPACK_MAGIC):], raw=False, strict_map_key=False)
+        except Exception as e:
+            raise ValueError('Invalid MessagePack snapshot: %s' % e)
+    return loads(raw)
+
+
+def read_snapshot(path):
+    """Return `(data, size in bytes)` of the snapshot file at `path`."""
+    with open(path, 'rb') as f:
+        raw = f.read()
+    return decode_snapshot(raw), len(raw)
+
+
+def convert(src, dest=None, fmt='compact'):
+    """Rewrite the snapshot `src` in format `fmt`, to `dest` or in place.
+
+    Returns:
+        `(bytes before, bytes after)`.
+    """
+    from backend.storage.files import FileLock, write_atomic
+
+    dest = dest or src
+    with FileLock(dest):
+        data, before = read_snapshot(src)
+        payload = encode_snapshot(data, fmt)
+        write_atomic(dest, payload)
+    return before, len(payload)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Inspect or convert Fridgy data files.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    info = commands.add_parser('info', help='show the format and size of a data file')
+    info.add_argument('path')
+    conv = commands.add_parser('convert', help='rewrite a data file in another format')
+    conv.add_argument('path')
+    conv.add_argument('--format', choices=FORMATS, required=True)
+    conv.add_argument('--output', help='write here instead of replacing the file')
+    args = parser.parse_args(argv)
+
+    if args.command == 'info':
+        with open(args.path, 'rb') as f:
+            head = f.read(len(MSGPACK_MAGIC))
+        print('%s: %s, %d bytes (JSON library: %s)' % (
+            args.path, detect_format(head), os.path.getsize(args.path), JSON_LIBRARY))
+    else:
+        before, after = convert(args.path, args.output, args.format)
+        print('%s: %d -> %d bytes (%s)' % (args.output or args.path, before, after, args.format))
+
+
+if __name__ == '__main__':
+    main()
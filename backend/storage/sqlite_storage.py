@@ -0,0 +1,336 @@
+"""SQLite storage: one table per collection with indexed lookup columns.
+
+Each record is stored whole as JSON in a `doc` column. The fields used for
+lookups (`id`, `date`, `type`, `mealType`, `expiryDate`) are copied into
+their own columns and indexed, so id lookups, type filters and date windows
+are answered by the database instead of by scanning every record.
+
+Migrate an existing JSON data file with:
+
+    python -m backend.storage.sqlite_storage backend/food_data.json
+"""
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from backend.storage.base import COLLECTIONS, Storage, empty_document, file_size
+from backend.storage.document import Document
+from backend.storage.serialization import dumps, loads
+
+# Record fields copied into their own columns
+COLUMNS = ('id', 'date', 'type', 'mealType', 'expiryDate')
+
+# Indexes created per collection; a tuple is a composite index
+INDEXES = {
+    'foods': ('id', 'expiryDate'),
+    'recipes': ('id',),
+    'meals': ('id', 'date', 'mealType'),
+    'healthMetrics': ('id', 'date', ('type', 'date')),
+    'sharedRecipes': ('id',),
+    'foodAddictions': ('id',),
+    'steps': ('id', 'date'),
+}
+
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+def _table(collection):
+    if not _IDENTIFIER.match(collection):
+        raise ValueError('Invalid collection name: %r' % collection)
+    return '"%s"' % collection
+
+
+def _column_value(value):
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    return json.dumps(value)
+
+
+def _field_sql(field):
+    """Return the SQL expression that reads `field` from a record row."""
+    if field in COLUMNS:
+        return '"%s"' % field
+    if not _IDENTIFIER.match(field):
+        raise ValueError('Invalid field name: %r' % field)
+    return "json_extract(doc, '$.%s')" % field
+
+
+class SqliteStorage(Storage):
+    """Collections stored as SQLite tables next to the JSON data file.
+
+    The database lives at the data file path with a `.db` extension. A
+    version counter in the `meta` table is bumped by every write, so the
+    full document built by `document` is only rebuilt after a change.
+    """
+
+    def __init__(self, data_file, default_data, db_file=None):
+        super().__init__(data_file, default_data)
+        self.db_file = db_file or os.path.splitext(data_file)[0] + '.db'
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # Open connections of every thread, so `close` can reach them
+        self._connections = set()
+        self._document = None
+        self._version = None
+        self._created_tables = set()
+        self._initialize()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and conn not in self._connections:
+            # Closed by `close` (or left to this thread mid-transaction)
+            conn.close()
+            conn = None
+        if conn is None:
+            dirpath = os.path.dirname(self.db_file)
+            if dirpath and not os.path.exists(dirpath):
+                os.makedirs(dirpath, exist_ok=True)
+            # Used by one thread at a time, but closed from whichever calls `close`
+            conn = sqlite3.connect(self.db_file, isolation_level=None, timeout=30,
+                                   check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            with self._lock:
+                self._connections.add(conn)
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        """Close the connections of every thread and drop the cached document.
+
+        Threads that use the backend afterwards open new connections. A
+        connection in the middle of a transaction is left for its thread
+        to close when it next connects.
+        """
+        with self._lock:
+            connections, self._connections = self._connections, set()
+            self._document = None
+        for conn in connections:
+            if not conn.in_transaction:
+                conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def _initialize(self):
+        with self._transaction() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)')
+            for collection in COLLECTIONS:
+                self._create_table(conn, collection)
+            is_new = conn.execute("SELECT 1 FROM meta WHERE key = 'version'").fetchone() is None
+            if is_new:
+                conn.execute("INSERT INTO meta (key, value) VALUES ('version', 0)")
+                self._insert_document(conn, self._default_data())
+
+    def _create_table(self, conn, collection):
+        if collection in self._created_tables:
+            return
+        table = _table(collection)
+        columns = ', '.join('"%s"' % c for c in COLUMNS)
+        conn.execute('CREATE TABLE IF NOT EXISTS %s (seq INTEGER PRIMARY KEY, %s, doc TEXT NOT NULL)'
+                     % (table, columns))
+        for index in INDEXES.get(collection, ('id',)):
+            fields = index if isinstance(index, tuple) else (index,)
+            name = '"idx_%s_%s"' % (collection, '_'.join(fields))
+            conn.execute('CREATE INDEX IF NOT EXISTS %s ON %s (%s)'
+                         % (name, table, ', '.join('"%s"' % f for f in fields)))
+        self._created_tables.add(collection)
+
+    def _tables(self, conn):
+        rows = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name != 'meta'")
+        return [name for (name,) in rows]
+
+    def _insert_rows(self, conn, collection, records):
+        placeholders = ', '.join('?' * (len(COLUMNS) + 1))
+        conn.executemany(
+            'INSERT INTO %s (%s, doc) VALUES (%s)'
+            % (_table(collection), ', '.join('"%s"' % c for c in COLUMNS), placeholders),
+            ([_column_value(r.get(c)) for c in COLUMNS] + [dumps(r)] for r in records))
+
+    def _insert_document(self, conn, data):
+        for collection, records in data.items():
+            if not isinstance(records, list):
+                continue
+            self._create_table(conn, collection)
+            self._insert_rows(conn, collection, records)
+
+    def _read_version(self, conn):
+        return conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    def _bump_version(self, conn):
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+
+    def _select(self, sql, params=()):
+        return [loads(doc) for (doc,) in self._connect().execute(sql, params)]
+
+    def _fresh_document(self):
+        """Return the cached document if the database has not changed since."""
+        with self._lock:
+            document, version = self._document, self._version
+        if document is not None and version == self._read_version(self._connect()):
+            return document
+        return None
+
+    def has_document(self):
+        # Building the document reads every table; windowed reads are
+        # answered by SQL unless an up-to-date one is already cached
+        return self._fresh_document() is not None
+
+    def disk_bytes(self):
+        return file_size(self.db_file) + file_size(self.db_file + '-wal')
+
+    def version(self):
+        return self._read_version(self._connect())
+
+    def document(self):
+        conn = self._connect()
+        version = self._read_version(conn)
+        with self._lock:
+            if self._document is not None and self._version == version:
+                return self._document
+        data = empty_document()
+        for collection in self._tables(conn):
+            data[collection] = self._select('SELECT doc FROM %s ORDER BY seq' % _table(collection))
+        document = Document(data)
+        with self._lock:
+            self._document, self._version = document, version
+        return document
+
+    def replace(self, data):
+        with self._transaction() as conn:
+            for collection in self._tables(conn):
+                conn.execute('DELETE FROM %s' % _table(collection))
+            self._insert_document(conn, data)
+            self._bump_version(conn)
+        with self._lock:
+            self._document = None
+
+    def _apply_sql(self, conn, entry):
+        collection = entry['collection']
+        table = _table(collection)
+        self._create_table(conn, collection)
+        if entry['op'] == 'insert':
+            self._insert_rows(conn, collection, [entry['record']])
+            return entry['record']
+        if entry['op'] == 'update':
+            row = conn.execute('SELECT seq, doc FROM %s WHERE id = ? ORDER BY seq LIMIT 1'
+                               % table, (entry['id'],)).fetchone()
+            if row is None:
+                return None
+            record = {**loads(row[1]), **entry['changes']}
+            conn.execute('UPDATE %s SET %s, doc = ? WHERE seq = ?'
+                         % (table, ', '.join('"%s" = ?' % c for c in COLUMNS)),
+                         [_column_value(record.get(c)) for c in COLUMNS] + [dumps(record), row[0]])
+            return record
+        if entry['op'] == 'delete':
+            return conn.execute('DELETE FROM %s WHERE id = ?' % table, (entry['id'],)).rowcount > 0
+        raise ValueError('Unknown mutation operation: %s' % entry['op'])
+
+    def apply_many(self, entries):
+        """Apply mutation entries in one transaction.
+
+        `BEGIN IMMEDIATE` takes SQLite's write lock, so concurrent writers
+        in other processes are serialized by the database itself.
+        """
+        with self._transaction() as conn:
+            version = self._read_version(conn)
+            results = [self._apply_sql(conn, entry) for entry in entries]
+            if any(results):
+                self._bump_version(conn)
+
+        # Keep the cached document in step instead of rebuilding it
+        with self._lock:
+            if any(results) and self._document is not None and self._version == version:
+                for entry in entries:
+                    self._document.apply(entry)
+                self._version = version + 1
+        return results
+
+    def list_records(self, collection):
+        document = self._fresh_document()
+        if document is not None:
+            return document.records(collection)
+        if collection not in self._tables(self._connect()):
+            return []
+        return self._select('SELECT doc FROM %s ORDER BY seq' % _table(collection))
+
+    def get_record(self, collection, record_id):
+        records = self._select('SELECT doc FROM %s WHERE id = ? ORDER BY seq LIMIT 1'
+                               % _table(collection), (record_id,))
+        return records[0] if records else None
+
+    def query_range(self, collection, field, start=None, end=None, **equals):
+        clauses, params = [], []
+        for name, value in equals.items():
+            clauses.append('%s = ?' % _field_sql(name))
+            params.append(_column_value(value))
+        column = _field_sql(field)
+        clauses.append('%s IS NOT NULL' % column)
+        if start is not None:
+            clauses.append('%s >= ?' % column)
+            params.append(start)
+        if end is not None:
+            clauses.append('%s < ?' % column)
+            params.append(end)
+        return self._select('SELECT doc FROM %s WHERE %s ORDER BY seq'
+                            % (_table(collection), ' AND '.join(clauses)), params)
+
+    def iter_records(self, collection, field=None, start=None, end=None, **equals):
+        """Filter in SQL; the connection is per thread, so the rows are read now."""
+        if field is None:
+            return iter(self.find_records(collection, **equals))
+        return iter(self.query_range(collection, field, start, end, **equals))
+
+    def find_records(self, collection, **equals):
+        if not equals:
+            return list(self.list_records(collection))
+        clauses = ' AND '.join('%s = ?' % _field_sql(name) for name in equals)
+        params = [_column_value(v) for v in equals.values()]
+        return self._select('SELECT doc FROM %s WHERE %s ORDER BY seq'
+                            % (_table(collection), clauses), params)
+
+
+def migrate_from_json(json_file, db_file=None):
+    """Copy every collection of an existing JSON data file into SQLite.
+
+    A journal (`.wal`) next to the JSON file is replayed first, in memory:
+    the JSON file and its journal are only read. Any data already in the
+    database is replaced.
+
+    Returns:
+        A dict of collection name -> number of records copied.
+    """
+    from backend.storage.journal_storage import read_journal
+
+    data = read_journal(json_file)
+    storage = SqliteStorage(json_file, empty_document, db_file=db_file)
+    storage.replace(data)
+    return {name: len(records) for name, records in data.items() if isinstance(records, list)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Migrate a Fridgy JSON data file to SQLite.')
+    parser.add_argument('json_file', help='path to the existing food_data.json')
+    parser.add_argument('--db', dest='db_file', help='database path (default: JSON path with .db)')
+    args = parser.parse_args(argv)
+
+    counts = migrate_from_json(args.json_file, args.db_file)
+    for name, count in counts.items():
+        print('%-16s %d records' % (name, count))
+
+
+if __name__ == '__main__':
+    main()
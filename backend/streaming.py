@@ -0,0 +1,95 @@
+"""Streaming JSON and NDJSON responses.
+
+Records are serialized a chunk at a time while the response is being sent,
+so memory use does not grow with the size of the result and clients get
+the first bytes right away. Each record is encoded with the app's JSON
+provider, so items look exactly as they would in a `jsonify` response.
+"""
+
+import functools
+
+from flask import Response, current_app, request
+
+NDJSON = 'application/x-ndjson'
+
+# Records serialized per chunk sent to the client
+CHUNK_RECORDS = 200
+
+
+def wants_ndjson():
+    """Return True if the client prefers NDJSON over a JSON array."""
+    return request.accept_mimetypes.best_match(['application/json', NDJSON]) == NDJSON
+
+
+def _chunks(records, dumps, separator):
+    batch = []
+    for record in records:
+        batch.append(dumps(record))
+        if len(batch) >= CHUNK_RECORDS:
+            yield separator.join(batch)
+            batch = []
+    if batch:
+        yield separator.join(batch)
+
+
+def json_array(records, dumps):
+    """Yield a JSON array of `records` in chunks."""
+    yield '['
+    first = True
+    for chunk in _chunks(records, dumps, ','):
+        yield chunk if first else ',' + chunk
+        first = False
+    yield ']\n'
+
+
+def ndjson(records, dumps):
+    """Yield `records` as newline-delimited JSON in chunks."""
+    for chunk in _chunks(records, dumps, '\n'):
+        yield chunk + '\n'
+
+
+def stream_records(records, ndjson_format=None):
+    """Return a streamed response of `records`: NDJSON or a JSON array by content negotiation.
+
+    Args:
+        records: Iterable of records; iterated while the response is sent.
+        ndjson_format: Force NDJSON (True) or a JSON array (False); None
+            uses the request's Accept header.
+    """
+    if ndjson_format is None:
+        ndjson_format = wants_ndjson()
+    # Bound now: the generator runs after the request context is gone.
+    # Compact separators match what jsonify sends.
+    dumps = functools.partial(current_app.json.dumps, separators=(',', ':'))
+    if ndjson_format:
+        return Response(ndjson(records, dumps), mimetype=NDJSON)
+    return Response(json_array(records, dumps), mimetype='application/json')
+
+
+def stream_collections(collections, ndjson_format=None):
+    """Return a streamed response of several named collections.
+
+    Args:
+        collections: `(name, records)` pairs.
+        ndjson_format: As for `stream_records`. JSON output is one object of
+            arrays (`{"foods": [...], ...}`); NDJSON output has one
+            `{"collection": name, "record": {...}}` line per record.
+    """
+    if ndjson_format is None:
+        ndjson_format = wants_ndjson()
+    dumps = functools.partial(current_app.json.dumps, separators=(',', ':'))
+
+    if ndjson_format:
+        def lines():
+            for name, records in collections:
+                yield from ndjson(({"collection": name, "record": r} for r in records), dumps)
+        return Response(lines(), mimetype=NDJSON)
+
+    def document():
+        yield '{'
+        for i, (name, records) in enumerate(collections):
+            yield ('' if i == 0 else ',') + dumps(name) + ':'
+            for chunk in json_array(records, dumps):
+                yield chunk.rstrip('\n')
+        yield '}\n'
+    return Response(document(), mimetype='application/json')
@@ -5,17 +5,19 @@ Tests use a temporary data file to avoid affecting production data.
 """
 
 import json
+from datetime import datetime, timedelta
 import pytest
 import backend.app as app_mod
 from backend.app import app as flask_app
 
 
-@pytest.fixture
-def client(tmp_path, monkeypatch):
-    """Create a test client with isolated data file."""
+@pytest.fixture(params=["json", "journal", "sqlite", "partitioned"])
+def client(request, tmp_path, monkeypatch):
+    """Create a test client with isolated data file, once per storage backend."""
     # Use temporary file for test data
     data_file = tmp_path / "test_data.json"
     monkeypatch.setattr(app_mod, "DATA_FILE", str(data_file))
+    monkeypatch.setattr(app_mod, "STORAGE_MODE", request.param)
 
     with flask_app.test_client() as client:
         yield client
@@ -136,4 +138,520 @@ def test_recipe_recommendations(client):
     
     if len(recommendations) > 0:
         # Should have match score
-        assert 'matchScore' in recommendations[0]
\ No newline at end of file
+        assert 'matchScore' in recommendations[0]
+
+def test_recommendations_limit_and_min_score(client):
+    """Test top-k and minimum score filtering of recipe recommendations."""
+    client.post('/api/foods', json={"name": "Tomatoes", "quantity": 2})
+    client.post('/api/foods', json={"name": "Pasta", "quantity": 1})
+    client.post('/api/recipes', json={"name": "Tomato Pasta", "ingredients": ["2 tomatoes", "Pasta"]})
+    client.post('/api/recipes', json={"name": "Pasta Bake", "ingredients": ["Pasta", "Cheese", "Cream", "Ham"]})
+    client.post('/api/recipes', json={"name": "Salad", "ingredients": ["Lettuce"]})
+
+    recommendations = client.get('/api/recommendations').get_json()
+    assert [r['name'] for r in recommendations] == ['Tomato Pasta', 'Pasta Bake']
+    assert recommendations[0]['matchScore'] == 1.0
+
+    top = client.get('/api/recommendations?limit=1').get_json()
+    assert [r['name'] for r in top] == ['Tomato Pasta']
+
+    strong = client.get('/api/recommendations?minScore=0.5').get_json()
+    assert [r['name'] for r in strong] == ['Tomato Pasta']
+
+    assert client.get('/api/recommendations?limit=abc').status_code == 400
+
+
+def test_recommendations_follow_food_changes(client):
+    """Test that the ingredient index picks up foods added and removed after it was built."""
+    client.post('/api/recipes', json={"name": "Omelette", "ingredients": ["3 eggs", "Butter"]})
+    assert client.get('/api/recommendations').get_json() == []
+
+    egg = client.post('/api/foods', json={"name": "Egg", "quantity": 6}).get_json()
+    recommendations = client.get('/api/recommendations').get_json()
+    assert recommendations[0]['matchScore'] == 0.5
+
+    client.delete(f"/api/foods/{egg['id']}")
+    assert client.get('/api/recommendations').get_json() == []
+
+
+def test_nutrition_rollups_follow_meal_changes(client):
+    """Test that daily, trend and stats totals follow meal inserts and deletes."""
+    today = datetime.now().strftime('%Y-%m-%d')
+    before = client.get(f'/api/nutrition/daily?date={today}').get_json()
+
+    meal = {"mealType": "lunch", "date": today + "T12:00:00",
+            "nutrition": {"calories": 300, "protein": 20, "carbs": 30, "fats": 10}}
+    meal_id = client.post('/api/meals', json=meal).get_json()['id']
+
+    daily = client.get(f'/api/nutrition/daily?date={today}').get_json()
+    assert daily['totals']['calories'] == before['totals']['calories'] + 300
+    assert daily['byMealType']['lunch']['protein'] == before['byMealType']['lunch']['protein'] + 20
+
+    trends = client.get('/api/nutrition/trends?days=7').get_json()
+    assert trends[-1]['date'] == today
+    assert trends[-1]['calories'] == daily['totals']['calories']
+
+    stats = client.get('/api/stats?days=7').get_json()
+    assert stats['meals']['byType']['lunch'] >= 1
+
+    client.delete(f'/api/meals/{meal_id}')
+    after = client.get(f'/api/nutrition/daily?date={today}').get_json()
+    assert after['totals'] == before['totals']
+
+    response = client.post('/api/nutrition/rollups/rebuild')
+    assert response.status_code == 200
+    rebuilt = client.get('/api/stats?days=7').get_json()
+    assert rebuilt['meals']['total'] == stats['meals']['total'] - 1
+
+
+def test_reminders_follow_food_changes_in_expiry_order(client):
+    """Test that reminders come back soonest first and follow food updates and deletes."""
+    today = datetime.now().date()
+    later = client.post('/api/foods', json={
+        "name": "Yogurt", "expiryDate": (today + timedelta(days=5)).isoformat()}).get_json()
+    sooner = client.post('/api/foods', json={
+        "name": "Fish", "expiryDate": (today + timedelta(days=1)).isoformat()}).get_json()
+    client.post('/api/foods', json={"name": "Rice", "expiryDate": "not a date"})
+
+    def reminder_ids():
+        reminders = client.get('/api/reminders?days=7').get_json()
+        days = [r['daysUntilExpiry'] for r in reminders]
+        assert days == sorted(days)
+        return [r['food']['id'] for r in reminders]
+
+    ids = reminder_ids()
+    assert ids.index(sooner['id']) < ids.index(later['id'])
+    expiring = client.get('/api/stats').get_json()['foods']['expiringSoon']
+
+    client.put(f"/api/foods/{later['id']}", json={"expiryDate": (today + timedelta(days=30)).isoformat()})
+    client.delete(f"/api/foods/{sooner['id']}")
+    ids = reminder_ids()
+    assert later['id'] not in ids and sooner['id'] not in ids
+    assert client.get('/api/stats').get_json()['foods']['expiringSoon'] == expiring - 1
+
+
+def test_steps_range_and_multi_type_trends(client):
+    """Test that steps ranges give per-day totals and trends accept several types."""
+    client.post('/api/steps', json={"steps": 1200})
+    client.post('/api/steps', json={"steps": 800})
+    client.post('/api/health-metrics', json={"type": "weight", "value": 70})
+    client.post('/api/health-metrics', json={"type": "bmi", "value": 22})
+
+    today = datetime.now().date()
+    first = (today - timedelta(days=6)).isoformat()
+    response = client.get(f'/api/steps?from={first}&to={today.isoformat()}')
+    assert response.status_code == 200
+    days = response.get_json()['days']
+    assert len(days) == 7 and days[0]['date'] == first
+    assert days[-1] == {"date": today.isoformat(),
+                        "total": client.get('/api/steps').get_json()['total']}
+    assert client.get('/api/steps?from=yesterday').status_code == 400
+
+    trends = client.get('/api/health-metrics/trends?types=weight,bmi,cholesterol&days=7').get_json()
+    assert set(trends) == {'weight', 'bmi', 'cholesterol'}
+    assert trends['weight'][-1]['value'] == 70
+    assert trends['bmi'][-1]['value'] == 22
+    assert all(point['value'] is None for point in trends['cholesterol'])
+    single = client.get('/api/health-metrics/trends?type=weight&days=7').get_json()
+    assert single == trends['weight']
+    # The shape follows the parameter, not the number of types
+    assert client.get('/api/health-metrics/trends?types=weight&days=7').get_json() == {"weight": single}
+    assert client.get('/api/health-metrics/trends?type=weight&type=bmi&days=7').get_json() == \
+        {"weight": single, "bmi": trends['bmi']}
+
+
+def test_dashboard_combines_stats_trends_and_reminders(client):
+    """Test that the dashboard endpoint matches the separate endpoints it replaces."""
+    today = datetime.now().date()
+    client.post('/api/foods', json={"name": "Cream", "expiryDate": (today + timedelta(days=2)).isoformat()})
+    client.post('/api/meals', json={"mealType": "dinner", "nutrition": {"calories": 500}})
+
+    response = client.get('/api/dashboard?days=7')
+    assert response.status_code == 200
+    dashboard = response.get_json()
+    assert dashboard['stats'] == client.get('/api/stats?days=7').get_json()
+    assert dashboard['nutritionTrends'] == client.get('/api/nutrition/trends?days=7').get_json()
+    assert dashboard['reminders'] == client.get('/api/reminders?days=3').get_json()
+    assert any(r['food']['name'] == 'Cream' for r in dashboard['reminders'])
+    # A bad `days` falls back to 30, as for the other endpoints
+    assert client.get('/api/stats?days=abc').get_json() == client.get('/api/stats').get_json()
+    assert client.get('/api/dashboard?days=abc').get_json() == client.get('/api/dashboard').get_json()
+
+
+def test_conditional_get_returns_304_until_data_changes(client):
+    """Test that GETs carry an ETag, honour If-None-Match and change after writes."""
+    response = client.get('/api/foods')
+    etag = response.headers['ETag']
+    assert response.headers['Last-Modified']
+
+    response = client.get('/api/foods', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+
+    # Different query args are different resources
+    assert client.get('/api/stats?days=7').headers['ETag'] != client.get('/api/stats?days=30').headers['ETag']
+
+    client.post('/api/foods', json={"name": "Fresh Bread"})
+    response = client.get('/api/foods', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert any(f['name'] == 'Fresh Bread' for f in response.get_json())
+
+
+def test_collection_filters_projection_and_cursor_pages(client):
+    """Test that collection GETs filter, project and paginate in a stable order."""
+    for day, meal_type in [("2024-03-01", "lunch"), ("2024-03-02", "dinner"),
+                           ("2024-03-03", "lunch"), ("2024-03-04", "lunch")]:
+        client.post('/api/meals', json={"mealType": meal_type, "date": day + "T12:00:00",
+                                        "nutrition": {"calories": 100}})
+
+    lunches = client.get('/api/meals?mealType=lunch&from=2024-03-01&to=2024-03-03&fields=date,mealType').get_json()
+    assert lunches == [{"date": "2024-03-01T12:00:00", "mealType": "lunch"},
+                       {"date": "2024-03-03T12:00:00", "mealType": "lunch"}]
+
+    first = client.get('/api/meals?from=2024-03-01&to=2024-03-04&order=desc&limit=3&fields=id,date').get_json()
+    assert [m['date'][:10] for m in first['items']] == ["2024-03-04", "2024-03-03", "2024-03-02"]
+    second = client.get(f"/api/meals?from=2024-03-01&to=2024-03-04&order=desc&limit=3&fields=id,date"
+                        f"&cursor={first['nextCursor']}").get_json()
+    assert [m['date'][:10] for m in second['items']] == ["2024-03-01"]
+    assert second['nextCursor'] is None
+
+    assert client.get('/api/meals?limit=0').status_code == 400
+    assert client.get('/api/meals?cursor=garbage').status_code == 400
+    assert client.get('/api/meals?order=sideways').status_code == 400
+
+
+def test_streamed_lists_and_export_match_regular_json(client):
+    """Test that streamed collection GETs and /api/export carry the same data as plain JSON."""
+    client.post('/api/meals', json={"mealType": "lunch", "nutrition": {"calories": 250}})
+    plain = client.get('/api/meals').get_json()
+
+    streamed = client.get('/api/meals?stream=1')
+    assert streamed.is_streamed
+    assert json.loads(streamed.data) == plain
+
+    lines = client.get('/api/meals', headers={'Accept': 'application/x-ndjson'}).data.decode().splitlines()
+    assert [json.loads(line) for line in lines] == plain
+
+    export = client.get('/api/export')
+    assert 'attachment' in export.headers['Content-Disposition']
+    exported = json.loads(export.data)
+    assert exported['meals'] == plain
+    assert exported['foods'] == client.get('/api/foods').get_json()
+
+    lines = client.get('/api/export?collections=meals',
+                       headers={'Accept': 'application/x-ndjson'}).data.decode().splitlines()
+    assert [json.loads(line)['record'] for line in lines] == plain
+    assert client.get('/api/export?collections=nope').status_code == 400
+
+
+def test_batch_endpoints_insert_all_or_nothing_and_delete_by_id(client):
+    """Test that batch endpoints validate every item before saving and delete by id list."""
+    foods = client.post('/api/foods/batch', json=[
+        {"name": "Batch Oats", "nutrition": {"calories": 150, "protein": 5}},
+        {"name": "Batch Milk", "nutrition": {"calories": 60, "protein": 3}},
+    ])
+    assert foods.status_code == 201
+    oats, milk = foods.get_json()
+
+    meals = client.post('/api/meals/batch', json={"items": [
+        {"mealType": "breakfast", "foods": [{"id": oats['id'], "quantity": 2}, "batch milk"]},
+        {"mealType": "snacks", "foods": [{"name": "BATCH MILK"}]},
+    ]})
+    assert meals.status_code == 201
+    assert [m['nutrition']['calories'] for m in meals.get_json()] == [360, 60]
+
+    rejected = client.post('/api/steps/batch', json=[
+        {"steps": 1000, "date": "2024-05-01T08:00:00"},
+        {"steps": "lots"},
+        {"steps": 500, "date": "yesterday"},
+    ])
+    assert rejected.status_code == 400
+    assert [e['index'] for e in rejected.get_json()['items']] == [1, 2]
+    assert client.get('/api/steps?date=2024-05-01').get_json()['total'] == 0
+
+    steps = client.post('/api/steps/batch', json=[
+        {"steps": 1000, "date": "2024-05-01T08:00:00"},
+        {"steps": 2500, "date": "2024-05-01T18:00:00"},
+    ])
+    assert steps.status_code == 201
+    assert client.get('/api/steps?date=2024-05-01').get_json()['total'] == 3500
+
+    deleted = client.post('/api/steps/batch/delete',
+                          json={"ids": [s['id'] for s in steps.get_json()] + ["missing"]})
+    assert deleted.get_json() == {"deleted": 2}
+    assert client.get('/api/steps?date=2024-05-01').get_json()['total'] == 0
+    assert client.post('/api/foods/batch/delete', json={"ids": []}).status_code == 400
+    assert client.post('/api/meals/batch', json=[]).status_code == 400
+
+
+def test_food_addiction_analysis_counts_foods_streaks_and_sugar(client):
+    """Test that the addiction analysis reports food frequency, streaks and daily sugar."""
+    today = datetime.now().date()
+    for offset in range(3):
+        day = (today - timedelta(days=offset)).isoformat()
+        client.post('/api/meals', json={"mealType": "snacks", "date": day + "T15:00:00",
+                                        "foods": ["Analysis Candy"],
+                                        "nutrition": {"sugar": 30, "fats": 5, "sodium": 100}})
+    client.post('/api/meals', json={"mealType": "snacks", "date": today.isoformat() + "T21:00:00",
+                                    "foods": ["analysis candy"], "nutrition": {"sugar": 30}})
+
+    analysis = client.get('/api/food-addictions/analysis?days=7').get_json()
+    assert analysis['period'] == 7
+    assert analysis['to'] == today.isoformat()
+    assert [p['amount'] for p in analysis['sugarTracking']][-3:] == [30, 30, 60]
+    assert analysis['highSugarDays'] == 1
+    assert analysis['foodFrequency']['analysis candy'] == 4
+    candy = next(f for f in analysis['foods'] if f['name'] == 'analysis candy')
+    assert (candy['days'], candy['currentStreak'], candy['longestStreak'], candy['flagged']) == (3, 3, 3, True)
+
+    assert client.get('/api/food-addictions/analysis?days=0').status_code == 400
+    assert client.get('/api/food-addictions').status_code == 200
+
+
+def test_metrics_endpoint_reports_latency_phases_and_profiles(client, tmp_path, monkeypatch):
+    """Test that /api/metrics exposes per-endpoint latency and phases, and sampled profiles are dumped."""
+    profile_dir = tmp_path / "profiles"
+    monkeypatch.setattr(app_mod, "PROFILE_EVERY", 1)
+    monkeypatch.setattr(app_mod, "PROFILE_DIR", str(profile_dir))
+    client.post('/api/foods', json={"name": "Metered Milk"})
+    client.get('/api/foods/missing-id')
+    monkeypatch.setattr(app_mod, "PROFILE_EVERY", 0)
+
+    response = client.get('/api/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+    assert 'fridgy_requests_total{endpoint="/api/foods",method="POST",status="201"}' in text
+    assert 'fridgy_request_duration_seconds_bucket{endpoint="/api/foods",le="+Inf"}' in text
+    for phase in ('load', 'save', 'encode', 'handler'):
+        assert 'fridgy_request_phase_seconds_count{endpoint="/api/foods",phase="%s"}' % phase in text
+    assert 'fridgy_http_body_bytes_total{endpoint="/api/foods",direction="in"}' in text
+    assert 'fridgy_storage_bytes_total{direction="written"}' in text
+    assert len(list(profile_dir.glob('*.prof'))) == 2
+
+
+def test_sampled_profile_is_finished_even_without_after_request(client, tmp_path, monkeypatch):
+    """Test that a sampled request frees the profiler when its after_request hooks never run."""
+    from backend import metrics
+
+    profile_dir = tmp_path / "profiles"
+    monkeypatch.setattr(app_mod, "PROFILE_EVERY", 1)
+    monkeypatch.setattr(app_mod, "PROFILE_DIR", str(profile_dir))
+    with flask_app.test_request_context('/api/foods'):
+        flask_app.preprocess_request()
+        # No response is processed, as when an error propagates
+
+    assert len(list(profile_dir.glob('*.prof'))) == 1
+    client.get('/api/foods')
+    assert len(list(profile_dir.glob('*.prof'))) == 2
+    assert metrics._sampler._busy.acquire(blocking=False)
+    metrics._sampler._busy.release()
+
+
+def test_asgi_adapter_shares_concurrent_reads_and_sees_writes(client):
+    """Test that the ASGI entry point serves the app, single-flights identical GETs and streams bodies."""
+    import asyncio
+    import threading
+    from backend.asgi import create_app
+
+    calls = []
+    release = threading.Event()
+
+    def wsgi_app(environ, start_response):
+        calls.append((environ['REQUEST_METHOD'], environ['PATH_INFO']))
+        if environ['REQUEST_METHOD'] == 'GET':
+            # Hold the first read until the identical ones have arrived
+            release.wait(5)
+        return flask_app.wsgi_app(environ, start_response)
+
+    asgi = create_app(wsgi_app, workers=2)
+
+    async def request(method, path, body=b'', query=b''):
+        messages = [{"type": "http.request", "body": body, "more_body": False}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+
+        headers = [(b'content-type', b'application/json')] if body else []
+        await asgi({"type": "http", "method": method, "path": path, "query_string": query,
+                    "headers": headers, "server": ("testserver", 80)}, receive, send)
+        status = sent[0]['status']
+        return status, b''.join(m.get('body', b'') for m in sent[1:]), len(sent) - 1
+
+    async def scenario():
+        reads = [asyncio.ensure_future(request('GET', '/api/foods')) for _ in range(5)]
+        await asyncio.sleep(0.05)
+        release.set()
+        results = await asyncio.gather(*reads)
+        created = await request('POST', '/api/foods', json.dumps({"name": "Async Milk"}).encode())
+        after = await request('GET', '/api/foods')
+        streamed = await request('GET', '/api/foods', query=b'stream=1')
+        return results, created, after, streamed
+
+    try:
+        results, created, after, streamed = asyncio.run(scenario())
+    finally:
+        asgi.close()
+
+    # Five concurrent reads, one app call; then the write and two distinct reads
+    assert calls == [('GET', '/api/foods'), ('POST', '/api/foods'), ('GET', '/api/foods'), ('GET', '/api/foods')]
+    assert len({body for _, body, _ in results}) == 1
+    assert all(status == 200 for status, _, _ in results)
+    assert created[0] == 201
+    assert 'Async Milk' in [f['name'] for f in json.loads(after[1])]
+    assert streamed[0] == 200 and streamed[2] > 2
+    assert json.loads(streamed[1]) == json.loads(after[1])
+
+
+def test_asgi_adapter_bounds_buffered_chunks_for_slow_clients():
+    """Test that a shared flight waits for its slowest client and drops chunks every client was sent."""
+    import asyncio
+    from backend import asgi as asgi_mod
+
+    calls = []
+    buffered = []
+    chunks = [b'%03d,' % n for n in range(60)]
+
+    def wsgi_app(environ, start_response):
+        calls.append(environ['PATH_INFO'])
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+
+        def body():
+            for chunk in chunks:
+                buffered.extend(len(f.chunks) for f in list(asgi._flights.values()))
+                yield chunk
+        return body()
+
+    asgi = asgi_mod.create_app(wsgi_app, workers=2)
+
+    async def request(delay):
+        sent = []
+
+        async def receive():
+            return {"type": "http.request", "body": b'', "more_body": False}
+
+        async def send(message):
+            await asyncio.sleep(delay)
+            sent.append(message)
+
+        await asgi({"type": "http", "method": "GET", "path": "/big", "query_string": b'',
+                    "headers": [], "server": ("testserver", 80)}, receive, send)
+        return b''.join(m.get('body', b'') for m in sent[1:])
+
+    async def scenario():
+        slow = asyncio.ensure_future(request(0.002))
+        fast = asyncio.ensure_future(request(0))
+        # Joins once the first chunks were dropped, so it gets a flight of its own
+        while not calls or asgi._flights[next(iter(asgi._flights))].joinable:
+            await asyncio.sleep(0.001)
+        late = asyncio.ensure_future(request(0))
+        return await asyncio.gather(slow, fast, late)
+
+    try:
+        bodies = asyncio.run(scenario())
+    finally:
+        asgi.close()
+
+    assert bodies == [b''.join(chunks)] * 3
+    assert len(calls) == 2
+    assert max(buffered) <= asgi_mod.MAX_BUFFERED_CHUNKS
+    assert not asgi._flights
+
+
+def test_households_have_separate_data_selected_by_header_or_prefix(client, tmp_path, monkeypatch):
+    """Test that households selected by header or URL prefix get their own data files and pool stats."""
+    monkeypatch.setattr(app_mod, "HOUSEHOLDS_DIR", str(tmp_path / "households"))
+    headers = {"X-Fridgy-Household": "smith"}
+    response = client.post('/api/foods', json={"name": "Smith Cheese"}, headers=headers)
+    assert response.status_code == 201
+
+    smith = [f['name'] for f in client.get('/h/smith/api/foods').get_json()]
+    assert 'Smith Cheese' in smith
+    assert 'Smith Cheese' not in [f['name'] for f in client.get('/h/jones/api/foods').get_json()]
+    assert 'Smith Cheese' not in [f['name'] for f in client.get('/api/foods').get_json()]
+    assert (tmp_path / "households" / "smith").is_dir()
+
+    assert client.get('/api/foods', headers={"X-Fridgy-Household": "../etc"}).status_code == 400
+    text = client.get('/api/metrics').get_data(as_text=True)
+    assert 'fridgy_store_pool_resident ' in text
+    assert 'fridgy_store_pool_hits_total ' in text
+
+
+def test_reminder_sweep_precomputes_every_resident_household(client, tmp_path, monkeypatch):
+    """Test that the midnight sweep builds each resident household's reminder lists for every window."""
+    from backend import data_service
+    from backend.indexes.expiry import ExpiryIndex, sweep_reminders
+
+    monkeypatch.setattr(app_mod, "HOUSEHOLDS_DIR", str(tmp_path / "households"))
+    data_service.invalidate_cache()
+    today = datetime.now().date()
+    for household in ('smith', 'jones'):
+        client.post('/h/%s/api/foods' % household,
+                    json={"name": household, "expiryDate": (today + timedelta(days=2)).isoformat()})
+
+    stores = data_service.resident_stores()
+    assert len(stores) == 2
+    sweep_reminders(stores, today, (7, 3))
+
+    # Both windows are served from what the sweep built
+    monkeypatch.setattr(ExpiryIndex, 'expiring_before', lambda self, end: pytest.fail('not precomputed'))
+    for household in ('smith', 'jones'):
+        for days in (7, 3):
+            reminders = client.get('/h/%s/api/reminders?days=%d' % (household, days)).get_json()
+            assert household in [r['food']['name'] for r in reminders]
+    assert 'smith' in [r['food']['name'] for r in client.get('/h/smith/api/dashboard').get_json()['reminders']]
+
+
+def test_archived_history_still_counts_in_trends_and_stats(client):
+    """Test that archiving old records moves them out of the live data without changing dated views."""
+    from backend import data_service
+
+    now = datetime.now()
+    for i, days_ago in enumerate((100, 100, 40, 5)):
+        data_service.insert_record('meals', {
+            "id": "archive-meal-%d" % i, "mealType": "lunch", "foods": [{"name": "Chips"}],
+            "date": (now - timedelta(days=days_ago)).isoformat(),
+            "nutrition": {"calories": 100 * (i + 1), "protein": 10}})
+    data_service.insert_record('steps', {"id": "archive-steps", "steps": 4000,
+                                         "date": (now - timedelta(days=70)).isoformat()})
+    data_service.insert_record('healthMetrics', {"id": "archive-weight", "type": "weight", "value": 70,
+                                                 "date": (now - timedelta(days=70)).isoformat()})
+    old_day = (now - timedelta(days=100)).date().isoformat()
+    steps_day = (now - timedelta(days=70)).date().isoformat()
+    urls = ('/api/nutrition/trends?days=365', '/api/stats?days=365',
+            '/api/steps?date=%s' % steps_day,
+            '/api/steps?from=%s&to=%s' % (old_day, now.date().isoformat()),
+            '/api/health-metrics/trends?type=weight&days=365',
+            '/api/nutrition/daily?date=%s' % old_day,
+            '/api/meals?from=%s&to=%s' % (old_day, now.date().isoformat()),
+            '/api/food-addictions/analysis?days=365')
+    before = [client.get(url).get_json() for url in urls]
+    exported = json.loads(client.get('/api/export').data)
+    assert before[2]['total'] == 4000
+    assert {"date": steps_day, "total": 4000} in before[3]['days']
+    assert [p['value'] for p in before[4] if p['value'] is not None] == [70]
+
+    response = client.post('/api/archive/run?days=30')
+    assert response.status_code == 200
+    assert response.get_json()['archived'] == {"meals": 3, "steps": 1, "healthMetrics": 1}
+    assert 'archive-meal-0' not in [m['id'] for m in client.get('/api/meals').get_json()]
+
+    after = [client.get(url).get_json() for url in urls]
+    assert after == before
+    # The export still has every record, archived ones first
+    export = json.loads(client.get('/api/export').data)
+    for name in ('meals', 'steps', 'healthMetrics', 'foods'):
+        assert sorted(export[name], key=lambda r: r['id']) == sorted(exported[name], key=lambda r: r['id'])
+    assert [m['id'] for m in export['meals'][:3]] == ['archive-meal-0', 'archive-meal-1', 'archive-meal-2']
+
+    archived = client.get('/api/archive/meals?from=%s&to=%s' % (old_day, old_day)).get_json()
+    assert [m['id'] for m in archived] == ['archive-meal-0', 'archive-meal-1']
+    segments = client.get('/api/archive').get_json()['segments']
+    assert sum(s['count'] for s in segments if s['collection'] == 'meals') == 3
+    assert client.post('/api/archive/run?days=30').get_json()['archived']['meals'] == 0
+    assert client.post('/api/archive/run').status_code == 400
@@ -0,0 +1,633 @@
+"""
+Unit tests for the Fridgy data service layer.
+
+Tests use a temporary data file to avoid affecting production data.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from datetime import date, datetime
+import pytest
+import backend.app as app_mod
+from backend import data_service
+from backend.bench import dataset, run
+from backend.indexes import columns
+from backend.indexes.consumption import ConsumptionIndex, streaks
+from backend.indexes.expiry import ExpiryIndex
+from backend.indexes.foods import FoodLookup
+from backend.indexes.timeline import Timeline
+from backend.storage import files, journal_storage, json_storage, partitioned_storage, serialization
+from backend.storage.base import empty_document
+from backend.storage.document import Collection, Document
+from backend.storage.journal_storage import JournalStorage
+from backend.storage.json_storage import JsonStorage
+from backend.storage.pool import StorePool
+
+
+@pytest.fixture
+def data_file(tmp_path, monkeypatch):
+    """Point the data service at an isolated data file."""
+    path = tmp_path / "test_data.json"
+    monkeypatch.setattr(app_mod, "DATA_FILE", str(path))
+    yield path
+    data_service.invalidate_cache()
+
+
+def test_readonly_load_is_served_from_cache(data_file):
+    """Test that repeated read-only loads return the same parsed document."""
+    first = data_service.load_data(readonly=True)
+    second = data_service.load_data(readonly=True)
+    assert first is second
+
+
+def test_load_picks_up_external_edits(data_file):
+    """Test that a file rewritten outside the service is re-parsed."""
+    data_service.load_data(readonly=True)
+
+    document = json.loads(data_file.read_text())
+    document['foods'].append({"id": "external", "name": "Cheese"})
+    data_file.write_text(json.dumps(document))
+    # Make sure the mtime moves even on coarse-grained filesystems
+    stat = os.stat(data_file)
+    os.utime(data_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    foods = data_service.load_data(readonly=True)['foods']
+    assert any(f['id'] == 'external' for f in foods)
+
+
+def test_working_copy_does_not_leak_into_cache(data_file):
+    """Test that unsaved changes to a working copy are not visible to readers."""
+    data = data_service.load_data()
+    data['foods'].append({"id": "unsaved", "name": "Ghost"})
+
+    foods = data_service.load_data(readonly=True)['foods']
+    assert all(f['id'] != 'unsaved' for f in foods)
+
+    data_service.save_data(data)
+    foods = data_service.load_data(readonly=True)['foods']
+    assert any(f['id'] == 'unsaved' for f in foods)
+
+
+@pytest.fixture
+def journal_file(data_file, monkeypatch):
+    """Switch the data service to journal storage mode."""
+    monkeypatch.setattr(app_mod, "STORAGE_MODE", "journal")
+    yield data_file
+
+
+def test_journal_mode_appends_instead_of_rewriting(journal_file):
+    """Test that a mutation in journal mode leaves the snapshot untouched."""
+    data_service.load_data(readonly=True)
+    snapshot_before = journal_file.read_text()
+
+    data_service.insert_record('meals', {"id": "m1", "mealType": "lunch"})
+
+    assert journal_file.read_text() == snapshot_before
+    log_lines = (journal_file.parent / (journal_file.name + '.wal')).read_text().splitlines()
+    assert len(log_lines) == 1
+    assert json.loads(log_lines[0])['record']['id'] == 'm1'
+
+
+def test_journal_replays_log_after_restart(journal_file):
+    """Test that a fresh process state rebuilds the document from snapshot plus log."""
+    data_service.insert_record('meals', {"id": "m1", "mealType": "lunch"})
+    data_service.insert_record('meals', {"id": "m2", "mealType": "dinner"})
+    data_service.update_record('meals', 'm1', {"mealType": "breakfast"})
+    data_service.delete_record('meals', 'm2')
+
+    # Simulate a process restart
+    data_service.invalidate_cache()
+
+    meals = data_service.load_data(readonly=True)['meals']
+    assert meals == [{"id": "m1", "mealType": "breakfast"}]
+
+
+def test_journal_compaction_folds_log_into_snapshot(journal_file):
+    """Test that compaction empties the log without losing changes."""
+    data_service.insert_record('steps', {"id": "s1", "steps": 1200})
+    data_service.get_storage().compact()
+
+    log_file = journal_file.parent / (journal_file.name + '.wal')
+    assert log_file.read_text() == ''
+    snapshot = json.loads(journal_file.read_text())
+    assert snapshot['steps'] == [{"id": "s1", "steps": 1200}]
+
+    data_service.invalidate_cache()
+    assert data_service.load_data(readonly=True)['steps'] == [{"id": "s1", "steps": 1200}]
+
+
+def test_overlapping_journal_compactions_keep_every_write(tmp_path, monkeypatch):
+    """Test that a slow compaction does not overwrite a newer snapshot written by another instance."""
+    path = str(tmp_path / "data.json")
+    first, second = JournalStorage(path, empty_document), JournalStorage(path, empty_document)
+    for i in range(5):
+        first.apply({"op": "insert", "collection": "meals", "record": {"id": "m%d" % i}})
+    second.document()
+
+    real_encode = journal_storage.encode_snapshot
+    def encode_while_other_compacts(data, fmt):
+        # While `second` serializes its snapshot, `first` writes more and compacts
+        monkeypatch.setattr(journal_storage, "encode_snapshot", real_encode)
+        for i in range(5, 10):
+            first.apply({"op": "insert", "collection": "meals", "record": {"id": "m%d" % i}})
+        first.compact()
+        return real_encode(data, fmt)
+
+    monkeypatch.setattr(journal_storage, "encode_snapshot", encode_while_other_compacts)
+    second.compact()
+
+    meals = JournalStorage(path, empty_document).list_records('meals')
+    assert [m['id'] for m in meals] == ['m%d' % i for i in range(10)]
+
+
+@pytest.fixture
+def sqlite_file(data_file, monkeypatch):
+    """Switch the data service to the SQLite backend."""
+    monkeypatch.setattr(app_mod, "STORAGE_MODE", "sqlite")
+    yield data_file.with_suffix('.db')
+
+
+def test_sqlite_range_queries_use_indexes(sqlite_file):
+    """Test that date and type filters are answered through an index."""
+    data_service.insert_record('healthMetrics', {"id": "h1", "type": "weight", "value": 70, "date": "2024-03-01T08:00:00"})
+    data_service.insert_record('healthMetrics', {"id": "h2", "type": "bmi", "value": 22, "date": "2024-03-02T08:00:00"})
+    data_service.insert_record('healthMetrics', {"id": "h3", "type": "weight", "value": 71, "date": "2024-03-05T08:00:00"})
+
+    found = data_service.query_range('healthMetrics', 'date', '2024-03-02', type='weight')
+    assert [m['id'] for m in found] == ['h3']
+    assert [m['id'] for m in data_service.query_prefix('healthMetrics', 'date', '2024-03-01')] == ['h1']
+
+    storage = data_service.get_storage()
+    plan = storage._connect().execute(
+        'EXPLAIN QUERY PLAN SELECT doc FROM "healthMetrics" WHERE "type" = ? AND "date" >= ?',
+        ('weight', '2024-03-02')).fetchall()
+    assert any('idx_healthMetrics_type_date' in row[-1] for row in plan)
+
+
+def test_sqlite_day_views_do_not_build_the_document(sqlite_file):
+    """Test that day views on SQLite are answered by queries instead of reading every table."""
+    data_service.insert_record('meals', {"id": "m1", "date": "2024-05-01T08:00:00", "mealType": "breakfast",
+                                         "nutrition": {"calories": 300}})
+    data_service.insert_record('meals', {"id": "m2", "date": "2024-05-02T08:00:00", "mealType": "lunch",
+                                         "nutrition": {"calories": 500}})
+    storage = data_service.get_storage()
+    storage._document = None
+
+    assert [m['id'] for m in data_service.records_in_period('meals', '2024-05-01')] == ['m1']
+    with app_mod.app.test_client() as client:
+        response = client.get('/api/nutrition/daily?date=2024-05-02')
+    assert response.get_json()['totals']['calories'] == 500
+    assert storage._document is None
+    assert not data_service.is_document_loaded()
+
+    # A document built for another read is used while it is current
+    data_service.get_document()
+    assert data_service.is_document_loaded()
+    data_service.insert_record('meals', {"id": "m3", "date": "2024-05-01T12:00:00"})
+    assert [m['id'] for m in data_service.records_in_period('meals', '2024-05-01')] == ['m1', 'm3']
+
+
+def test_sqlite_migration_copies_json_collections(tmp_path):
+    """Test that the migration tool copies every collection and journal entry from a JSON file."""
+    from backend.storage.sqlite_storage import SqliteStorage, migrate_from_json
+
+    json_file = tmp_path / "legacy.json"
+    json_file.write_text(json.dumps({
+        "foods": [{"id": "f1", "name": "Rice", "expiryDate": "2025-01-01"}],
+        "meals": [{"id": "m1", "date": "2024-05-01T12:00:00", "mealType": "lunch"}],
+        "recipes": [], "healthMetrics": [], "sharedRecipes": [], "foodAddictions": [], "steps": []
+    }))
+    log_file = tmp_path / "legacy.json.wal"
+    log_file.write_text(json.dumps({"seq": 1, "op": "insert", "collection": "foods",
+                                    "record": {"id": "f2", "name": "Oats"}}) + "\n")
+    before = {path.name: path.read_bytes() for path in tmp_path.iterdir()}
+
+    counts = migrate_from_json(str(json_file))
+
+    assert counts['foods'] == 2 and counts['meals'] == 1
+    # The source is only read: no snapshot rewrite, compaction or lock file
+    assert {path.name: path.read_bytes() for path in tmp_path.iterdir() if path.suffix != '.db'
+            and not path.name.startswith('legacy.db')} == before
+    storage = SqliteStorage(str(json_file), lambda: {})
+    assert storage.get_record('foods', 'f2')['name'] == 'Oats'
+    assert storage.query_prefix('meals', 'date', '2024-05-01')[0]['id'] == 'm1'
+
+    # Closing (as the store pool does on eviction) closes the connections;
+    # the backend still works afterwards
+    conn = storage._connect()
+    storage.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute('SELECT 1')
+    assert storage.get_record('foods', 'f1')['name'] == 'Rice'
+
+
+@pytest.mark.skipif(files.fcntl is None, reason="cross-process locks need fcntl")
+def test_concurrent_writers_do_not_lose_updates(data_file):
+    """Test that separate storage instances (as in separate workers) never drop a write."""
+    # Each thread gets its own storage object, like a separate worker process
+    storages = [JsonStorage(str(data_file), empty_document) for _ in range(4)]
+
+    def insert_many(storage, worker):
+        for i in range(10):
+            storage.apply({"op": "insert", "collection": "meals", "record": {"id": "%d-%d" % (worker, i)}})
+
+    threads = [threading.Thread(target=insert_many, args=(s, n)) for n, s in enumerate(storages)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    meals = json.loads(data_file.read_text())['meals']
+    assert len(meals) == 40
+
+
+def test_corrupt_data_file_is_kept_aside_not_overwritten(data_file):
+    """Test that an unparseable data file is quarantined instead of being replaced in place."""
+    data_file.write_text('{"foods": [')
+
+    data = data_service.load_data(readonly=True)
+
+    assert data['foods'] == []
+    quarantined = list(data_file.parent.glob(data_file.name + '.corrupt-*'))
+    assert len(quarantined) == 1
+    assert quarantined[0].read_text() == '{"foods": ['
+
+
+def test_snapshot_without_its_codec_fails_instead_of_loading_empty(data_file, monkeypatch):
+    """Test that a MessagePack data file read without msgpack raises rather than looking empty."""
+    raw = serialization.MSGPACK_MAGIC + b'\x81\xa5foods\x90'
+    data_file.write_bytes(raw)
+    monkeypatch.setattr(serialization, "msgpack", None)
+
+    with pytest.raises(RuntimeError, match='msgpack'):
+        data_service.list_records('foods')
+    assert data_file.read_bytes() == raw
+    assert not list(data_file.parent.glob(data_file.name + '.corrupt-*'))
+
+
+def test_batched_writes_share_one_flush(data_file, monkeypatch):
+    """Test that writes arriving within the batch window are written together."""
+    writes = []
+    original_write = json_storage.write_atomic
+    monkeypatch.setattr(json_storage, "write_atomic",
+                        lambda path, payload: (writes.append(path), original_write(path, payload)))
+    storage = JsonStorage(str(data_file), empty_document)
+    storage.load()
+    writes.clear()
+    storage.batch_window = 0.05
+
+    threads = [threading.Thread(target=storage.apply,
+                                args=({"op": "insert", "collection": "steps", "record": {"id": str(i)}},))
+               for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(storage.load()['steps']) == 8
+    assert len(writes) < 8
+
+
+def test_list_pages_are_lazy_and_cursors_survive_deletes(data_file):
+    """Test that unpaged list pages are produced as consumed and cursors resume after deletes."""
+    for i in range(6):
+        data_service.insert_record('meals', {"id": "m%d" % i, "date": "2024-03-0%dT12:00:00" % (i + 1)})
+
+    page, position = data_service.list_page('meals', fields=['id'])
+    assert position is None and not isinstance(page, list)
+    assert next(page) == {"id": "m0"}
+
+    page, position = data_service.list_page('meals', fields=['id'], limit=2)
+    assert page == [{"id": "m0"}, {"id": "m1"}] and position == (2, 'm1')
+    # Deleting a record before the cursor resumes after the cursor's record
+    data_service.delete_record('meals', 'm0')
+    page, position = data_service.list_page('meals', fields=['id'], limit=2, after=position)
+    assert page == [{"id": "m2"}, {"id": "m3"}] and position == (3, 'm3')
+    # Without the cursor's record, the page starts at the old offset
+    data_service.delete_record('meals', 'm3')
+    page, position = data_service.list_page('meals', fields=['id'], limit=2, after=position)
+    assert page == [{"id": "m5"}] and position is None
+    page, _ = data_service.list_page('meals', after=(9, 'gone'), start='2024-03-01')
+    assert list(page) == []
+
+
+def test_collection_index_keeps_order_across_deletes():
+    """Test that id lookups stay correct and order is kept after deleting from the middle."""
+    meals = Collection({"id": str(i), "n": i} for i in range(5))
+
+    assert meals.delete("2") is True
+    assert meals.delete("2") is False
+    meals.append({"id": "5", "n": 5})
+
+    assert [m["id"] for m in meals.records()] == ["0", "1", "3", "4", "5"]
+    assert meals.get("3")["n"] == 3
+    assert meals.get("2") is None
+
+
+def test_collection_index_handles_duplicate_and_changed_ids():
+    """Test that legacy duplicate ids and id-changing updates keep the index consistent."""
+    foods = Collection([{"id": "a", "v": 1}, {"id": "b"}, {"id": "a", "v": 2}])
+
+    assert foods.get("a")["v"] == 1
+    foods.update("a", {"id": "c"})
+    assert foods.get("c")["v"] == 1
+    assert foods.get("a")["v"] == 2
+
+    assert foods.delete("a") is True
+    assert [f["id"] for f in foods.records()] == ["c", "b"]
+
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+def test_time_series_columns_match_with_and_without_numpy(use_numpy, monkeypatch):
+    """Test that window totals and latest-per-day agree on both column paths."""
+    if use_numpy and columns.np is None:
+        pytest.skip("NumPy is not installed")
+    if not use_numpy:
+        monkeypatch.setattr(columns, "np", None)
+
+    document = Document({
+        "steps": [
+            {"id": "s1", "date": "2024-05-01T08:00:00", "steps": 1000},
+            {"id": "s2", "date": "2024-05-02T08:00:00", "steps": 2500},
+        ],
+        "healthMetrics": [
+            {"id": "m1", "type": "weight", "value": 70, "date": "2024-05-02T07:00:00"},
+            {"id": "m2", "type": "weight", "value": 71, "date": "2024-05-02T21:00:00"},
+            {"id": "m3", "type": "bmi", "value": 22, "date": "2024-05-02T22:00:00"},
+        ],
+    })
+    series = document.index(columns.TimeSeriesColumns)
+    document.apply({"op": "insert", "collection": "steps",
+                    "record": {"id": "s3", "date": "2024-05-03T08:00:00", "steps": 500}})
+
+    records, total = series.window('steps', since=datetime(2024, 5, 2))
+    assert [r['id'] for r in records] == ['s2', 's3']
+    assert total == 3000
+
+    latest = series.latest_per_day('healthMetrics', date(2024, 5, 1), category='weight')
+    assert {day: r['id'] for day, r in latest.items()} == {'2024-05-02': 'm2'}
+
+    document.apply({"op": "delete", "collection": "healthMetrics", "id": "m2"})
+    latest = series.latest_per_day('healthMetrics', date(2024, 5, 1), category='weight')
+    assert latest['2024-05-02']['id'] == 'm1'
+
+
+def test_timeline_windows_follow_changes_in_time_order():
+    """Test that timeline windows are time-ordered and follow inserts, updates and deletes."""
+    document = Document({"meals": [
+        {"id": "late", "date": "2024-05-02T20:00:00"},
+        {"id": "early", "date": "2024-05-02T07:00:00"},
+        {"id": "before", "date": "2024-05-01T12:00:00"},
+    ]})
+    timeline = document.index(Timeline)
+    assert [m['id'] for m in timeline.in_period('meals', '2024-05-02')] == ['early', 'late']
+
+    document.apply({"op": "insert", "collection": "meals",
+                    "record": {"id": "noon", "date": "2024-05-02T12:00:00"}})
+    document.apply({"op": "update", "collection": "meals", "id": "before",
+                    "changes": {"date": "2024-05-03T09:00:00"}})
+    document.apply({"op": "delete", "collection": "meals", "id": "late"})
+
+    assert [m['id'] for m in timeline.in_period('meals', '2024-05-02')] == ['early', 'noon']
+    assert [m['id'] for m in timeline.window('meals', start='2024-05-02T12:00:00')] == ['noon', 'before']
+    assert [m['id'] for m in timeline.in_period('meals', '2024-05')] == ['early', 'noon', 'before']
+    assert timeline.in_period('meals', 'not a date') is None
+
+
+def test_food_lookup_follows_food_changes():
+    """Test that food lookups by id and name, and memoized nutrition, follow food changes."""
+    document = Document({"foods": [
+        {"id": "a", "name": "Milk", "nutrition": {"calories": 60, "protein": 3}},
+        {"id": "b", "name": "milk", "nutrition": {"calories": 40}},
+        {"id": "c", "name": "Oats"},
+    ]})
+    lookup = document.index(FoodLookup)
+    assert lookup.by_name('MILK')['id'] == 'a'
+    meal = ["milk", {"foodId": "b", "quantity": 2}, {"name": "oats"}, {"name": "unknown"}]
+    assert lookup.meal_nutrition(meal)['calories'] == 140
+    assert lookup.meal_nutrition(meal)['protein'] == 3
+
+    document.apply({"op": "update", "collection": "foods", "id": "a",
+                    "changes": {"nutrition": {"calories": 70}}})
+    assert lookup.meal_nutrition(["Milk"])['calories'] == 70
+    document.apply({"op": "update", "collection": "foods", "id": "a", "changes": {"name": "Whole Milk"}})
+    assert lookup.by_name('milk')['id'] == 'b'
+    document.apply({"op": "update", "collection": "foods", "id": "a", "changes": {"name": "Milk"}})
+    assert lookup.by_name('milk')['id'] == 'a'
+    document.apply({"op": "delete", "collection": "foods", "id": "b"})
+    assert lookup.by_id('b') is None
+    assert lookup.meal_nutrition([{"id": "b"}])['calories'] == 0
+
+
+def test_consumption_counters_follow_meal_changes():
+    """Test that per-day food counters follow meal inserts, updates and deletes."""
+    document = Document({"meals": [
+        {"id": "m1", "date": "2024-05-01T08:00:00", "foods": ["Chocolate", {"name": "chocolate"}, {"id": "f1"}]},
+        {"id": "m2", "date": "2024-05-01T20:00:00", "foods": ["Chips"]},
+    ]})
+    index = document.index(ConsumptionIndex)
+    assert index.counts_between(['2024-05-01']) == {'2024-05-01': {'chocolate': 1, 'f1': 1, 'chips': 1}}
+
+    document.apply({"op": "update", "collection": "meals", "id": "m2", "changes": {"date": "2024-05-02T20:00:00"}})
+    document.apply({"op": "delete", "collection": "meals", "id": "m1"})
+    document.apply({"op": "insert", "collection": "meals",
+                    "record": {"id": "m3", "date": "2024-05-02T09:00:00", "foods": ["CHIPS"]}})
+    assert index.counts_between(['2024-05-01', '2024-05-02']) == {'2024-05-02': {'chips': 2}}
+    assert index.name('chips') == 'CHIPS'
+
+    days = [date(2024, 5, d) for d in (1, 2, 3, 6, 7)]
+    assert streaks(days, date(2024, 5, 8)) == (2, 3)
+    assert streaks(days, date(2024, 5, 10)) == (0, 3)
+
+
+def test_benchmark_dataset_is_seeded_and_runs_report_percentiles(tmp_path):
+    """Test that generated data files are reproducible and benchmark runs report latencies."""
+    today = datetime(2024, 5, 1)
+    first, second = tmp_path / "a.json", tmp_path / "b.json"
+    counts = dataset.write_dataset(str(first), seed=7, today=today, **dataset.SCALES['tiny'])
+    dataset.write_dataset(str(second), seed=7, today=today, **dataset.SCALES['tiny'])
+    assert first.read_bytes() == second.read_bytes()
+    assert counts['meals'] == 500 and counts['foods'] == 50
+    assert len(json.loads(first.read_text())['meals']) == 500
+
+    results = run.run_benchmarks(str(first), requests=5, only=['stats', 'meals.create'])
+    assert set(results['scenarios']) == {'stats', 'meals.create'}
+    stats = results['scenarios']['stats']
+    assert stats['p50Ms'] <= stats['p95Ms'] <= stats['p99Ms'] <= stats['maxMs']
+    assert app_mod.DATA_FILE != str(first)
+    assert run.compare(results, results)[1].split()[1] == '+0.0%'
+
+
+@pytest.mark.parametrize("mode", ["json", "journal"])
+@pytest.mark.parametrize("fmt", ["compact", "msgpack"])
+def test_snapshot_formats_round_trip_and_are_detected_on_load(fmt, mode, data_file, monkeypatch):
+    """Test that data files written in each snapshot format load back, whatever format is configured."""
+    if fmt == 'msgpack':
+        pytest.importorskip('msgpack')
+    monkeypatch.setattr(app_mod, "STORAGE_MODE", mode)
+    monkeypatch.setattr(app_mod, "SNAPSHOT_FORMAT", fmt)
+    data_service.insert_record('foods', {"id": "crème", "name": "Crème fraîche", "nutrition": {"fats": 4.5}})
+    if mode == 'journal':
+        data_service.get_storage().compact()
+    raw = data_file.read_bytes()
+    assert serialization.detect_format(raw) == ('msgpack' if fmt == 'msgpack' else 'json')
+    if fmt == 'compact':
+        assert b'\n' not in raw
+
+    # A fresh process configured for another format still reads the file
+    data_service.invalidate_cache()
+    monkeypatch.setattr(app_mod, "SNAPSHOT_FORMAT", "json")
+    assert data_service.get_record('foods', 'crème')['nutrition'] == {"fats": 4.5}
+
+
+def test_serialization_falls_back_to_stdlib_and_converts_files(tmp_path, monkeypatch):
+    """Test that the stdlib fallback reads fast-library output and the converter rewrites files."""
+    data = {"foods": [{"id": "1", "name": "Café", "qty": 1.5}], "steps": []}
+    fast = serialization.encode_snapshot(data, 'compact')
+    monkeypatch.setattr(serialization, "orjson", None)
+    assert serialization.decode_snapshot(fast) == data
+    assert serialization.loads(serialization.dumps(data)) == data
+
+    path = tmp_path / "data.json"
+    path.write_bytes(serialization.encode_snapshot(data, 'json'))
+    before, after = serialization.convert(str(path), fmt='compact')
+    assert after < before
+    assert serialization.read_snapshot(str(path))[0] == data
+    with pytest.raises(ValueError):
+        serialization.decode_snapshot(b'{"foods": [')
+
+
+def test_partitioned_storage_splits_data_and_rewrites_only_changed_partitions(data_file, monkeypatch):
+    """Test that partitioned storage splits the data file, reads one month lazily and rewrites one partition."""
+    data_file.write_text(json.dumps({
+        "foods": [{"id": "f1", "name": "Milk"}],
+        "meals": [{"id": "m1", "date": "2024-04-30T20:00:00"},
+                  {"id": "m2", "date": "2024-05-02T08:00:00"},
+                  {"id": "m3", "date": "2024-05-01T12:00:00"}],
+        "steps": [{"id": "s1", "steps": 100, "date": "2024-05-01T09:00:00"}],
+    }))
+    (data_file.parent / "test_data.json.wal").write_text(json.dumps(
+        {"seq": 1, "op": "insert", "collection": "foods", "record": {"id": "f2", "name": "Oats"}}) + "\n")
+    before = {path.name: path.read_bytes() for path in data_file.parent.iterdir()}
+    monkeypatch.setattr(app_mod, "STORAGE_MODE", "partitioned")
+    parts = data_file.parent / "test_data.parts"
+
+    assert [m['id'] for m in data_service.records_in_period('meals', '2024-05-01')] == ['m3']
+    # Splitting only reads the data file and its journal
+    assert {path.name: path.read_bytes() for path in data_file.parent.iterdir() if path != parts} == before
+    assert data_service.get_record('foods', 'f2')['name'] == 'Oats'
+    assert not data_service.is_document_loaded()
+    assert sorted(p.name for p in (parts / "meals").iterdir()) == ['2024-04.json', '2024-05.json']
+    assert data_service.list_records('foods')[0] == {"id": "f1", "name": "Milk"}
+
+    manifest = json.loads((parts / "manifest.json").read_text())
+    data_service.insert_record('meals', {"id": "m4", "date": "2024-04-29T08:00:00"})
+    data_service.update_record('steps', 's1', {"steps": 200})
+    changed = json.loads((parts / "manifest.json").read_text())['partitions']
+    assert {k for k in changed if changed[k] != manifest['partitions'][k]} == {'meals/2024-04', 'steps/2024-05'}
+
+    # Moving a record to another month moves it between partitions
+    data_service.update_record('meals', 'm1', {"date": "2024-06-01T08:00:00"})
+    data_service.invalidate_cache()
+    assert [m['id'] for m in data_service.list_records('meals')] == ['m4', 'm2', 'm3', 'm1']
+    assert data_service.records_in_period('steps', '2024-05')[0]['steps'] == 200
+    assert data_service.load_data(readonly=True)['foods'][0]['name'] == 'Milk'
+
+
+def test_partitioned_writes_and_indexes_read_only_their_partitions(data_file, monkeypatch):
+    """Test that partitioned writes and index builds read only the partitions they need."""
+    data_file.write_text(json.dumps({
+        "foods": [{"id": "f1", "name": "Milk", "expiryDate": "2024-05-03"}],
+        "meals": [{"id": "m1", "date": "2024-04-30T20:00:00"},
+                  {"id": "m2", "date": "2024-05-02T08:00:00"}],
+        "steps": [{"id": "s1", "steps": 100, "date": "2024-05-01T09:00:00"}],
+    }))
+    monkeypatch.setattr(app_mod, "STORAGE_MODE", "partitioned")
+    read = []
+    original = partitioned_storage.PartitionedStorage._partition
+    monkeypatch.setattr(partitioned_storage.PartitionedStorage, '_partition',
+                        lambda self, key: read.append(key) or original(self, key))
+
+    data_service.insert_record('meals', {"id": "m3", "date": "2024-04-29T08:00:00"})
+    data_service.update_record('meals', 'm2', {"calories": 300})
+    assert set(read) == {'meals/2024-04', 'meals/2024-05'}
+
+    read.clear()
+    assert [r['food']['id'] for r in data_service.get_index(ExpiryIndex).reminders(date(2024, 5, 1), 3)] == ['f1']
+    assert set(read) == {'foods'}
+    assert not data_service.is_document_loaded()
+
+    # Writes to a loaded collection go through the document and its indexes
+    data_service.delete_record('foods', 'f1')
+    assert data_service.get_index(ExpiryIndex).reminders(date(2024, 5, 1), 3) == []
+    data_service.invalidate_cache()
+    assert [m['id'] for m in data_service.list_records('meals')] == ['m1', 'm3', 'm2']
+    assert data_service.get_record('meals', 'm2')['calories'] == 300
+    assert data_service.list_records('foods') == []
+
+
+def test_partitioned_batch_applies_many_entries_to_one_copy_per_partition(data_file, monkeypatch):
+    """Test that a batch of writes to unloaded partitions matches applying them to a document."""
+    monkeypatch.setattr(app_mod, "STORAGE_MODE", "partitioned")
+    meals = [{"id": "m%d" % i, "date": "2024-05-%02dT12:00:00" % (i % 28 + 1)} for i in range(200)]
+    data_file.write_text(json.dumps({"foods": [], "meals": meals}))
+    entries = [{"op": "insert", "collection": "meals",
+                "record": {"id": "n%d" % i, "date": "2024-05-03T08:00:00"}} for i in range(100)]
+    entries += [{"op": "delete", "collection": "meals", "id": "m%d" % i} for i in range(0, 200, 2)]
+    entries += [{"op": "update", "collection": "meals", "id": "m1", "changes": {"date": "2024-06-01T08:00:00"}},
+                {"op": "update", "collection": "meals", "id": "m3", "changes": {"id": "renamed"}},
+                {"op": "update", "collection": "meals", "id": "missing", "changes": {}},
+                {"op": "delete", "collection": "meals", "id": "m0"}]
+    expected = Document({"meals": list(meals)})
+    expected_results = [expected.apply(entry) for entry in entries]
+
+    assert data_service.apply_changes(entries) == expected_results
+    assert not data_service.is_document_loaded()
+    data_service.invalidate_cache()
+    stored = data_service.list_records('meals')
+    assert sorted(r['id'] for r in stored) == sorted(r['id'] for r in expected.records('meals'))
+    may = [r['id'] for r in stored if r['date'].startswith('2024-05')]
+    assert may == [r['id'] for r in expected.records('meals') if r['date'].startswith('2024-05')]
+
+
+def test_store_pool_evicts_least_recently_used_by_count_and_bytes(tmp_path):
+    """Test that the store pool keeps recently used backends within its limits and closes the rest."""
+    closed = []
+
+    class FakeStorage:
+        def __init__(self, name, size):
+            self.data_file, self.size = name, size
+
+        def disk_bytes(self):
+            return self.size
+
+        def close(self):
+            closed.append(self.data_file)
+
+    pool = StorePool()
+    sizes = {"a": 10, "b": 10, "c": 10, "big": 100}
+    get = lambda name, **limits: pool.get(name, lambda: FakeStorage(name, sizes[name]), **limits)
+    get("a", max_entries=2)
+    get("b", max_entries=2)
+    assert get("a", max_entries=2).data_file == "a"
+    get("c", max_entries=2)
+    assert closed == ["b"]
+
+    # Over the byte limit: everything but the backend being returned goes
+    get("big", max_entries=10, max_bytes=50)
+    assert closed == ["b", "a", "c"]
+    stats = pool.stats()
+    assert (stats['resident'], stats['residentBytes'], stats['hits'], stats['misses'], stats['evictions']) == (1, 100, 1, 4, 3)
+    assert stats['hitRate'] == 0.2
+
+
+def test_evicted_journal_storage_folds_its_log(tmp_path):
+    """Test that closing a journal backend (pool eviction) compacts its log into the snapshot."""
+    storage = JournalStorage(str(tmp_path / "data.json"), empty_document)
+    storage.apply({"op": "insert", "collection": "foods", "record": {"id": "1", "name": "Rice"}})
+    assert storage.disk_bytes() > os.path.getsize(tmp_path / "data.json")
+    storage.close()
+    assert os.path.getsize(tmp_path / "data.json.wal") == 0
+    assert JournalStorage(str(tmp_path / "data.json"), empty_document).get_record('foods', '1')['name'] == 'Rice'
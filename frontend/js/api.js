@@ -13,7 +13,17 @@ class FoodAPI {
             // Use the same origin but point to port 8080 where the backend runs
             this.baseUrl = `${protocol}//${hostname}:8080/api`;
         }
+
+        // Optional household (see backend/households.py), e.g. set with
+        // localStorage.setItem('fridgyHousehold', 'smith')
+        const household = localStorage.getItem('fridgyHousehold');
+        if (household) {
+            this.baseUrl = this.baseUrl.replace(/\/api$/, `/h/${encodeURIComponent(household)}/api`);
+        }
         
+        // URL -> { etag, text } of the last GET response, for conditional requests
+        this.responseCache = new Map();
+
         // Check connection on initialization
         this.checkConnection();
     }
@@ -70,20 +80,35 @@ class FoodAPI {
         }, 10000);
     }
 
-    async safeFetch(url, options = {}) {
-        const doFetch = async () => {
-            const response = await fetch(url, {
-                ...options,
-                headers: {
-                    'Content-Type': 'application/json',
-                    ...options.headers
-                }
-            });
-            if (!response.ok) {
-                throw new Error(`HTTP error! status: ${response.status}`);
+    // Fetch JSON, sending the ETag of the last response for GETs. On a 304
+    // the previous body is parsed again, so callers always get fresh objects.
+    async fetchJson(url, options = {}) {
+        const isGet = !options.method || options.method.toUpperCase() === 'GET';
+        const cached = isGet ? this.responseCache.get(url) : undefined;
+        const response = await fetch(url, {
+            ...options,
+            headers: {
+                'Content-Type': 'application/json',
+                ...(cached ? { 'If-None-Match': cached.etag } : {}),
+                ...options.headers
             }
-            return await response.json();
-        };
+        });
+        if (response.status === 304 && cached) {
+            return JSON.parse(cached.text);
+        }
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        const text = await response.text();
+        const etag = response.headers.get('ETag');
+        if (isGet && etag) {
+            this.responseCache.set(url, { etag, text });
+        }
+        return JSON.parse(text);
+    }
+
+    async safeFetch(url, options = {}) {
+        const doFetch = () => this.fetchJson(url, options);
 
         try {
             return await doFetch();
@@ -104,18 +129,17 @@ class FoodAPI {
         }
     }
 
-    async getFoods() {
+    // Append query parameters (filters, fields, order, limit, cursor) to an API path
+    withQuery(path, query = {}) {
+        const params = new URLSearchParams(query).toString();
+        return params ? `${this.baseUrl}${path}?${params}` : `${this.baseUrl}${path}`;
+    }
+
+    // With `limit` or `cursor` in the query, the list endpoints return
+    // { items, nextCursor } instead of a plain array
+    async getFoods(query = {}) {
         try {
-            const response = await fetch(`${this.baseUrl}/foods`, {
-                method: 'GET',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-            });
-            if (!response.ok) {
-                throw new Error(`HTTP error! status: ${response.status}`);
-            }
-            return await response.json();
+            return await this.fetchJson(this.withQuery('/foods', query));
         } catch (error) {
             console.error('Error fetching foods:', error);
             if (error.message.includes('Failed to fetch') || error.message.includes('NetworkError')) {
@@ -153,16 +177,7 @@ class FoodAPI {
 
     async getRecipes() {
         try {
-            const response = await fetch(`${this.baseUrl}/recipes`, {
-                method: 'GET',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-            });
-            if (!response.ok) {
-                throw new Error(`HTTP error! status: ${response.status}`);
-            }
-            return await response.json();
+            return await this.fetchJson(`${this.baseUrl}/recipes`);
         } catch (error) {
             console.error('Error fetching recipes:', error);
             if (error.message.includes('Failed to fetch') || error.message.includes('NetworkError')) {
@@ -197,18 +212,9 @@ class FoodAPI {
         await fetch(`${this.baseUrl}/recipes/${id}`, { method: 'DELETE' });
     }
 
-    async getMeals() {
+    async getMeals(query = {}) {
         try {
-            const response = await fetch(`${this.baseUrl}/meals`, {
-                method: 'GET',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-            });
-            if (!response.ok) {
-                throw new Error(`HTTP error! status: ${response.status}`);
-            }
-            return await response.json();
+            return await this.fetchJson(this.withQuery('/meals', query));
         } catch (error) {
             console.error('Error fetching meals:', error);
             if (error.message.includes('Failed to fetch') || error.message.includes('NetworkError')) {
@@ -275,9 +281,9 @@ class FoodAPI {
         }
     }
 
-    async getHealthMetrics() {
+    async getHealthMetrics(query = {}) {
         try {
-            return await this.safeFetch(`${this.baseUrl}/health-metrics`);
+            return await this.safeFetch(this.withQuery('/health-metrics', query));
         } catch (error) {
             console.error('Error fetching health metrics:', error);
             return [];
@@ -311,6 +317,15 @@ class FoodAPI {
         }
     }
 
+    async getStepsRange(from, to) {
+        try {
+            return await this.safeFetch(`${this.baseUrl}/steps?from=${from}&to=${to}`);
+        } catch (error) {
+            console.error('Error fetching steps range:', error);
+            return { from, to, days: [] };
+        }
+    }
+
     async addSteps(steps) {
         return await this.safeFetch(`${this.baseUrl}/steps`, {
             method: 'POST',
@@ -318,6 +333,13 @@ class FoodAPI {
         });
     }
 
+    async addStepsBatch(entries) {
+        return await this.safeFetch(`${this.baseUrl}/steps/batch`, {
+            method: 'POST',
+            body: JSON.stringify(entries)
+        });
+    }
+
     async getFoodAddictions() {
         try {
             return await this.safeFetch(`${this.baseUrl}/food-addictions`);
@@ -329,15 +351,18 @@ class FoodAPI {
 
     async analyzeAddictions(days = 30) {
         try {
-            return await this.safeFetch(`${this.baseUrl}/food-addictions/analyze?days=${days}`);
+            return await this.safeFetch(`${this.baseUrl}/food-addictions/analysis?days=${days}`);
         } catch (error) {
             console.error('Error analyzing addictions:', error);
             return {
                 sugarTracking: [],
                 fatTracking: [],
+                sodiumTracking: [],
                 averageSugar: 0,
                 averageFat: 0,
+                averageSodium: 0,
                 foodFrequency: {},
+                foods: [],
                 period: days
             };
         }
@@ -377,6 +402,19 @@ class FoodAPI {
         }
     }
 
+    async getDashboard(days = 30) {
+        try {
+            return await this.safeFetch(`${this.baseUrl}/dashboard?days=${days}`);
+        } catch (error) {
+            console.error('Error fetching dashboard:', error);
+            return {
+                stats: await this.getStats(days),
+                nutritionTrends: [],
+                reminders: []
+            };
+        }
+    }
+
     async getReminders() {
         try {
             return await this.safeFetch(`${this.baseUrl}/reminders`);
@@ -420,6 +458,16 @@ class FoodAPI {
         }
     }
 
+    async getHealthMetricsTrendsByType(types = ['weight'], days = 30) {
+        try {
+            // `types` always answers with { type: points }, even for a single type
+            return await this.safeFetch(`${this.baseUrl}/health-metrics/trends?types=${types.join(',')}&days=${days}`);
+        } catch (error) {
+            console.error('Error fetching health metrics trends:', error);
+            return Object.fromEntries(types.map(type => [type, []]));
+        }
+    }
+
     async syncGoogleFitSteps(stepsData) {
         return await this.safeFetch(`${this.baseUrl}/google-fit/steps`, {
             method: 'POST',
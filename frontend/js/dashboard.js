@@ -38,10 +38,8 @@ class Dashboard {
     async loadData() {
         const days = parseInt(document.getElementById('period-select').value) || 30;
         
-        // Load stats
-        const stats = await this.api.getStats(days);
-        const foods = await this.api.getFoods();
-        const nutritionTrends = await this.api.getNutritionTrends(days);
+        // Load stats, trends and expiring foods in one request
+        const { stats, nutritionTrends, reminders } = await this.api.getDashboard(days);
         
         // Update stat cards
         document.getElementById('total-foods').textContent = stats.foods.total;
@@ -49,21 +47,16 @@ class Dashboard {
         document.getElementById('total-meals').textContent = stats.meals.total;
         document.getElementById('total-recipes').textContent = stats.recipes.total;
         
-        // Update expiring list
-        const expiring = foods.filter(food => {
-            const expiry = new Date(food.expiryDate);
-            const today = new Date();
-            const diffDays = Math.ceil((expiry - today) / (1000 * 60 * 60 * 24));
-            return diffDays <= 3 && diffDays >= 0;
-        });
+        // Update expiring list (reminders come sorted, soonest first)
+        const expiring = reminders.filter(reminder => reminder.daysUntilExpiry >= 0);
         
         const expiringList = document.getElementById('expiring-list');
         if (expiring.length === 0) {
             expiringList.innerHTML = '<p>No food items expiring soon!</p>';
         } else {
-            expiringList.innerHTML = expiring.map(food => `
+            expiringList.innerHTML = expiring.map(reminder => `
                 <div class="food-item">
-                    <strong>${food.name}</strong> - Expires in ${this.getDaysUntilExpiry(food.expiryDate)} days
+                    <strong>${reminder.food.name}</strong> - Expires in ${reminder.daysUntilExpiry} days
                 </div>
             `).join('');
         }
@@ -255,12 +248,6 @@ class Dashboard {
             }
         });
     }
-
-    getDaysUntilExpiry(expiryDate) {
-        const today = new Date();
-        const expiry = new Date(expiryDate);
-        return Math.ceil((expiry - today) / (1000 * 60 * 60 * 24));
-    }
 }
 
 const dashboard = new Dashboard();
\ No newline at end of file
@@ -76,38 +76,31 @@ class HealthPage {
     }
 
     async loadMetrics() {
-        const metrics = await this.api.getHealthMetrics();
+        // The list shows the 10 most recent metrics
+        const page = await this.api.getHealthMetrics({ order: 'desc', limit: 10, fields: 'id,type,value,date' });
+        const metrics = Array.isArray(page) ? page : page.items || [];
         this.renderMetrics(metrics);
         
-        // Load trends
-        const weightTrends = await this.api.getHealthMetricsTrends('weight', 30);
-        const bmiTrends = await this.api.getHealthMetricsTrends('bmi', 30);
-        const cholesterolTrends = await this.api.getHealthMetricsTrends('cholesterol', 30);
+        // Load trends (all three series in one request)
+        const trends = await this.api.getHealthMetricsTrendsByType(['weight', 'bmi', 'cholesterol'], 30);
         
-        this.updateWeightChart(weightTrends);
-        this.updateBMIChart(bmiTrends);
-        this.updateCholesterolChart(cholesterolTrends);
+        this.updateWeightChart(trends.weight || []);
+        this.updateBMIChart(trends.bmi || []);
+        this.updateCholesterolChart(trends.cholesterol || []);
     }
 
     async loadSteps() {
         const today = new Date().toISOString().split('T')[0];
-        const stepsData = await this.api.getSteps(today);
-        
-        document.getElementById('today-steps').textContent = stepsData.total || 0;
-        
-        // Load steps for chart (last 30 days)
-        const allSteps = [];
-        for (let i = 0; i < 30; i++) {
-            const date = new Date();
-            date.setDate(date.getDate() - i);
-            const dateStr = date.toISOString().split('T')[0];
-            const daySteps = await this.api.getSteps(dateStr);
-            allSteps.push({
-                date: dateStr,
-                steps: daySteps.total || 0
-            });
-        }
-        allSteps.reverse();
+        const start = new Date();
+        start.setDate(start.getDate() - 29);
+        const from = start.toISOString().split('T')[0];
+
+        // Per-day totals for the last 30 days (oldest first), today included
+        const range = await this.api.getStepsRange(from, today);
+        const allSteps = range.days.map(day => ({ date: day.date, steps: day.total || 0 }));
+        const todayEntry = allSteps.find(day => day.date === today);
+
+        document.getElementById('today-steps').textContent = todayEntry ? todayEntry.steps : 0;
         this.updateStepsChart(allSteps);
     }
 
@@ -118,7 +111,7 @@ class HealthPage {
         // Update charts
         this.updateSugarChart(analysis.sugarTracking);
         this.updateFatChart(analysis.fatTracking);
-        this.renderFoodFrequency(analysis.foodFrequency);
+        this.renderFoodFrequency(analysis.foods);
     }
 
     renderMetrics(metrics) {
@@ -359,25 +352,31 @@ class HealthPage {
                     <h3>${analysis.averageFat.toFixed(1)}g</h3>
                     <p>Average Daily Fat</p>
                 </div>
+                <div class="stat-card">
+                    <h3>${analysis.averageSodium.toFixed(0)}mg</h3>
+                    <p>Average Daily Sodium</p>
+                </div>
+                <div class="stat-card">
+                    <h3>${analysis.highSugarDays || 0}</h3>
+                    <p>Days Over 50g Sugar</p>
+                </div>
             </div>
             <p style="margin-top: 1rem;">Analysis period: Last ${analysis.period} days</p>
         `;
     }
 
-    renderFoodFrequency(foodFrequency) {
+    renderFoodFrequency(foods) {
         const container = document.getElementById('food-frequency-list');
-        if (!foodFrequency || Object.keys(foodFrequency).length === 0) {
+        if (!foods || foods.length === 0) {
             container.innerHTML = '<p>No food frequency data available.</p>';
             return;
         }
         
-        const sorted = Object.entries(foodFrequency)
-            .sort((a, b) => b[1] - a[1])
-            .slice(0, 10);
-        
-        container.innerHTML = sorted.map(([food, count]) => `
+        // Foods come sorted, most frequent first
+        container.innerHTML = foods.slice(0, 10).map(food => `
             <div class="card" style="margin: 0.5rem 0;">
-                <strong>${food}:</strong> Consumed ${count} time(s)
+                <strong>${food.name}:</strong> Consumed ${food.meals} time(s) on ${food.days} day(s)
+                ${food.flagged ? `<br><em>Eaten ${food.longestStreak} days in a row (current streak: ${food.currentStreak})</em>` : ''}
             </div>
         `).join('');
     }
@@ -1,6 +1,10 @@
 class TrackerPage {
     constructor() {
         this.api = new FoodAPI();
+        // Meals fetched per page of the meal list ("Load more" fetches the next)
+        this.mealsPageSize = 50;
+        this.meals = [];
+        this.mealsCursor = null;
         this.loadMeals();
         this.loadDailyNutrition();
         this.setupForm();
@@ -51,9 +55,29 @@ class TrackerPage {
         }
     }
 
-    async loadMeals() {
-        const meals = await this.api.getMeals();
-        this.renderMeals(meals);
+    async loadMeals(more = false) {
+        // Newest meals first, only the fields the meal cards show
+        const query = {
+            order: 'desc',
+            limit: this.mealsPageSize,
+            fields: 'id,date,time,mealType,foods,nutrition'
+        };
+        if (more && this.mealsCursor) {
+            query.cursor = this.mealsCursor;
+        }
+        const page = await this.api.getMeals(query);
+        const items = Array.isArray(page) ? page : page.items || [];
+        this.meals = more ? this.meals.concat(items) : items;
+        this.mealsCursor = Array.isArray(page) ? null : page.nextCursor || null;
+        this.renderMeals(this.meals.slice());
+        this.renderLoadMore();
+    }
+
+    renderLoadMore() {
+        const container = document.getElementById('meals-more');
+        if (container) {
+            container.classList.toggle('hidden', !this.mealsCursor);
+        }
     }
 
     async loadDailyNutrition() {
@@ -174,11 +198,11 @@ class TrackerPage {
     }
 
     async loadFoodsForSelection() {
-        const foods = await this.api.getFoods();
+        const foods = await this.api.getFoods({ fields: 'id,name,quantity,unit' });
         const foodSelect = document.getElementById('meal-foods-select');
         if (foodSelect) {
             foodSelect.innerHTML = '<option value="">Select foods...</option>' +
-                foods.map(food => `<option value="${food.id}">${food.name} (${food.quantity} ${food.unit})</option>`).join('');
+                foods.map(food => `<option value="${food.id}" data-name="${food.name}">${food.name} (${food.quantity} ${food.unit})</option>`).join('');
         }
     }
 
@@ -196,22 +220,21 @@ class TrackerPage {
                 submitBtn.disabled = true;
                 submitBtn.innerHTML = '<span class="loading"></span> Logging...';
                 
-                const selectedFoodIds = Array.from(document.getElementById('meal-foods-select')?.selectedOptions || [])
-                    .map(opt => opt.value)
-                    .filter(id => id);
+                // The server resolves foods by id, so the options carry all we need
+                const selectedFoods = Array.from(document.getElementById('meal-foods-select')?.selectedOptions || [])
+                    .filter(opt => opt.value)
+                    .map(opt => ({ id: opt.value, name: opt.dataset.name, quantity: 1 }));
                 
                 const customFoods = document.getElementById('meal-foods-custom')?.value
                     .split(',')
                     .map(f => f.trim())
                     .filter(f => f) || [];
 
-                if (selectedFoodIds.length === 0 && customFoods.length === 0) {
+                if (selectedFoods.length === 0 && customFoods.length === 0) {
                     throw new Error('Please select foods or enter custom foods');
                 }
 
-                const foods = await this.api.getFoods();
-                const selectedFoods = foods.filter(f => selectedFoodIds.includes(f.id));
-                const allFoods = [...selectedFoods.map(f => ({ id: f.id, name: f.name, quantity: 1 })), ...customFoods];
+                const allFoods = [...selectedFoods, ...customFoods];
 
                 const meal = {
                     mealType: document.getElementById('meal-type').value,